@@ -4,13 +4,31 @@
  * - Accepts POST requests from edge nodes (LAND/SEA)
  * - Authenticates using Bearer token (provisioned per node)
  * - Accepts GZIP-compressed or plain JSON payloads (batch logs)
+ * - Accepts the compact binary format (Content-Type application/vnd.beacon.logs.v1)
  * - Upserts attendance logs, updates node heartbeat/status
+ * - Acknowledges per record: { ok, accepted, duplicates, rejected, deferred } by edge
+ *   log id, so one bad record no longer fails (and resends) the whole batch
+ * - user_id is the terminal's user id (User.biometricId) or a User.id; punches of
+ *   users the cloud does not know yet are deferred (not stored, not rejected) so
+ *   the edge holds them and retries once the user exists
+ * - Idempotent per batch: an Idempotency-Key header (edge batch id) is stored
+ *   with the ack; a repeated key replays the stored ack without reprocessing
+ * - GET ?batch=<id> returns the stored ack (404 if never processed), used by
+ *   edge crash recovery to settle in-flight batches without resending them
+ * - Stored acks are pruned after SYNC_BATCH_RETENTION_DAYS (at most hourly per
+ *   node); a batch recovered later gets 404 and is resent, and its logs come
+ *   back as duplicates
  * - Sets Redis key for online status (TTL: 1h for SEA, 5m for LAND)
+ * - Stores the edge's compact metrics summary (X-Beacon-Metrics header: backlog,
+ *   harvest times per terminal, upload latency/status counts) in Redis with the
+ *   same TTL, for fleet link sizing and finding slow terminals
  *
  * Implementation Notes:
- * - Prisma: Used for DB access (beaconNode, attendanceLog)
- * - Redis: Used for online status (node:{id}:online)
+ * - Prisma: Used for DB access (beaconNode, attendanceLog, syncBatch)
+ * - Redis: Used for online status (node:{id}:online) and metrics (node:{id}:metrics)
  * - GZIP: Use zlib to decompress if needed
+ * - Binary: Decoded by @/lib/beaconWire into the same shape as the JSON logs
+ * - Unknown vnd.beacon versions get 415 so the edge falls back to JSON
  * - Error handling: Returns 401/403/400/500 as appropriate
  */
 
@@ -18,25 +36,90 @@ import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import Redis from 'ioredis';
 import zlib from 'zlib';
+import { decodeBeaconWire, isBeaconWire } from '@/lib/beaconWire';
 
 const redis = new Redis(process.env.REDIS_URL || 'redis://localhost:6379');
 
-export async function POST(req: NextRequest) {
-  // 1. Authenticate using Bearer token
+// Stored batch acks older than this are deleted; an edge settles in-flight batches on
+// its next sync, so only one offline for longer gets a 404 (and resends: duplicates)
+const SYNC_BATCH_RETENTION_DAYS = Number(process.env.SYNC_BATCH_RETENTION_DAYS || 7);
+
+// Upper bound on the stored metrics summary; anything larger is ignored
+const MAX_METRICS_BYTES = 16 * 1024;
+
+// Parses the X-Beacon-Metrics header; null if missing, oversized or not a JSON object
+function parseMetrics(header: string | null) {
+  if (!header || header.length > MAX_METRICS_BYTES) return null;
+  try {
+    const metrics = JSON.parse(header);
+    return metrics && typeof metrics === 'object' && !Array.isArray(metrics) ? metrics : null;
+  } catch {
+    return null;
+  }
+}
+
+// Resolves the node for a Bearer token, or the error response to return
+async function authenticate(req: NextRequest) {
   const auth = req.headers.get('authorization');
   if (!auth?.startsWith('Bearer ')) {
-    return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
+    return { error: NextResponse.json({ error: 'Unauthorized' }, { status: 401 }) };
   }
   const token = auth.replace('Bearer ', '').trim();
   const node = await prisma.beaconNode.findUnique({ where: { token } });
   if (!node) {
-    return NextResponse.json({ error: 'Invalid node token' }, { status: 403 });
+    return { error: NextResponse.json({ error: 'Invalid node token' }, { status: 403 }) };
+  }
+  return { node };
+}
+
+// Deletes a node's expired batch acks, at most once an hour per node
+async function pruneBatches(nodeId: string) {
+  if (!(await redis.set(`node:${nodeId}:batch-prune`, '1', 'EX', 3600, 'NX'))) return;
+  const cutoff = new Date(Date.now() - SYNC_BATCH_RETENTION_DAYS * 24 * 3600 * 1000);
+  await prisma.syncBatch.deleteMany({ where: { node_id: nodeId, createdAt: { lt: cutoff } } });
+}
+
+async function findBatch(batchId: string, nodeId: string) {
+  const batch = await prisma.syncBatch.findUnique({ where: { id: batchId } });
+  return batch && batch.node_id === nodeId ? batch : null;
+}
+
+export async function GET(req: NextRequest) {
+  const { node, error } = await authenticate(req);
+  if (!node) return error;
+  const batchId = req.nextUrl.searchParams.get('batch');
+  if (!batchId) {
+    return NextResponse.json({ error: 'batch is required' }, { status: 400 });
+  }
+  const batch = await findBatch(batchId, node.id);
+  if (!batch) {
+    return NextResponse.json({ error: 'Unknown batch' }, { status: 404 });
+  }
+  return NextResponse.json(batch.response);
+}
+
+export async function POST(req: NextRequest) {
+  // 1. Authenticate using Bearer token
+  const { node, error } = await authenticate(req);
+  if (!node) return error;
+
+  // Replay the stored ack for a batch that was already processed
+  const batchId = req.headers.get('idempotency-key');
+  if (batchId) {
+    const batch = await findBatch(batchId, node.id);
+    if (batch) return NextResponse.json(batch.response);
   }
 
-  // 2. Decompress if GZIP, else parse JSON
+  // 2. Decode binary batches, decompress if GZIP, else parse JSON
+  const contentType = req.headers.get('content-type');
+  if (!isBeaconWire(contentType) && (contentType || '').startsWith('application/vnd.beacon')) {
+    return NextResponse.json({ error: 'Unsupported payload format' }, { status: 415 });
+  }
   let logs: any[] = [];
   try {
-    if (req.headers.get('content-encoding') === 'gzip') {
+    if (isBeaconWire(contentType)) {
+      logs = decodeBeaconWire(Buffer.from(await req.arrayBuffer()));
+    } else if (req.headers.get('content-encoding') === 'gzip') {
       const buf = Buffer.from(await req.arrayBuffer());
       const decompressed = zlib.gunzipSync(buf).toString();
       logs = JSON.parse(decompressed);
@@ -51,16 +134,76 @@ export async function POST(req: NextRequest) {
     return NextResponse.json({ error: 'Payload must be array' }, { status: 400 });
   }
 
-  // 3. Upsert logs and update node heartbeat/status
+  // 3. Validate per record, classify against existing logs, insert the new ones
+  const rejected: { id: number | null; reason: string }[] = [];
+  const deferred: number[] = [];
+  const valid: { id: number; user_id: string; timestamp: Date }[] = [];
+  for (const log of logs) {
+    const id = typeof log?.id === 'number' ? log.id : null;
+    const timestamp = new Date(log?.timestamp);
+    if (id === null) rejected.push({ id, reason: 'missing id' });
+    else if (typeof log.user_id !== 'string' || !log.user_id) rejected.push({ id, reason: 'missing user_id' });
+    else if (isNaN(timestamp.getTime())) rejected.push({ id, reason: 'invalid timestamp' });
+    else valid.push({ id, user_id: log.user_id, timestamp });
+  }
+
   try {
-    await prisma.attendanceLog.createMany({
-      data: logs.map(log => ({
-        user_id: log.user_id,
-        timestamp: new Date(log.timestamp),
-        node_id: node.id,
-      })),
-      skipDuplicates: true,
-    });
+    const accepted: number[] = [];
+    const duplicates: number[] = [];
+    const data: { user_id: string; timestamp: Date; node_id: string }[] = [];
+    if (valid.length) {
+      // Terminals send their own user id (biometricId); map it to User.id
+      const sentIds = Array.from(new Set(valid.map(log => log.user_id)));
+      const biometricIds = sentIds.filter(id => /^\d+$/.test(id)).map(Number).filter(Number.isSafeInteger);
+      const users = await prisma.user.findMany({
+        where: { OR: [{ id: { in: sentIds } }, { biometricId: { in: biometricIds } }] },
+        select: { id: true, biometricId: true },
+      });
+      const userFor = new Map<string, string>();
+      for (const user of users) {
+        if (user.biometricId !== null) userFor.set(String(user.biometricId), user.id);
+      }
+      // An exact User.id match wins over a biometricId that happens to look the same
+      for (const user of users) userFor.set(user.id, user.id);
+
+      const known = valid.filter(log => userFor.has(log.user_id));
+      const existing = known.length
+        ? await prisma.attendanceLog.findMany({
+          where: {
+            user_id: { in: Array.from(new Set(known.map(log => userFor.get(log.user_id)!))) },
+            timestamp: {
+              gte: new Date(Math.min(...known.map(log => log.timestamp.getTime()))),
+              lte: new Date(Math.max(...known.map(log => log.timestamp.getTime()))),
+            },
+          },
+          select: { user_id: true, timestamp: true },
+        })
+        : [];
+      const seen = new Set(existing.map(log => `${log.user_id}|${log.timestamp.getTime()}`));
+      for (const log of valid) {
+        const userId = userFor.get(log.user_id);
+        if (!userId) {
+          // Not enrolled in the cloud yet: the edge holds the punch and retries later
+          deferred.push(log.id);
+          continue;
+        }
+        const key = `${userId}|${log.timestamp.getTime()}`;
+        if (seen.has(key)) {
+          duplicates.push(log.id);
+        } else {
+          seen.add(key);
+          accepted.push(log.id);
+          data.push({ user_id: userId, timestamp: log.timestamp, node_id: node.id });
+        }
+      }
+    }
+    // skipDuplicates still guards against a concurrent upload of the same logs;
+    // the logs and the batch's stored ack commit together
+    const response = { ok: true, accepted, duplicates, rejected, deferred };
+    await prisma.$transaction([
+      prisma.attendanceLog.createMany({ data, skipDuplicates: true }),
+      ...(batchId ? [prisma.syncBatch.create({ data: { id: batchId, node_id: node.id, response } })] : []),
+    ]);
     await prisma.beaconNode.update({
       where: { id: node.id },
       data: { last_heartbeat: new Date(), status: 'online' },
@@ -70,7 +213,12 @@ export async function POST(req: NextRequest) {
     if (node.type === 'SEA') ttl = 3600;
     else if (node.type === 'OFFICE') ttl = 120;
     await redis.set(`node:${node.id}:online`, 'true', 'EX', ttl);
-    return NextResponse.json({ ok: true });
+    if (batchId) await pruneBatches(node.id);
+    const metrics = parseMetrics(req.headers.get('x-beacon-metrics'));
+    if (metrics) {
+      await redis.set(`node:${node.id}:metrics`, JSON.stringify({ ...metrics, at: new Date().toISOString() }), 'EX', ttl);
+    }
+    return NextResponse.json(response);
   } catch (e) {
     return NextResponse.json({ error: 'DB error' }, { status: 500 });
   }
@@ -1,22 +1,52 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 
-// This endpoint is called by edge nodes to sync enrolled users
+// Users the edge mirrors onto its terminals
+const enrolledWhere = {
+    fingerprintEnrolled: true,
+    biometricId: { not: null },
+};
+
+// This endpoint is called by edge nodes to sync enrolled users.
+// Incremental: ?updatedSince=<cursor from the previous response> returns only users
+// changed since then (plus `ids`, every enrolled biometricId, so the edge can drop
+// removed users), and If-None-Match with the previous ETag returns 304 when nothing changed.
 export async function GET(req: NextRequest) {
-    // In production, you should authenticate edge nodes using their tokens
-    const token = req.headers.get('Authorization')?.replace('Bearer ', '');
+    // Edge nodes authenticate with their BeaconNode token (as on /api/beacon/sync);
+    // the roster carries fingerprint templates and drives deletions on terminals
+    const auth = req.headers.get('authorization');
+    if (!auth?.startsWith('Bearer ')) {
+        return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
+    }
+    const token = auth.replace('Bearer ', '').trim();
+    const node = token ? await prisma.beaconNode.findUnique({ where: { token } }) : null;
+    if (!node) {
+        return NextResponse.json({ error: 'Invalid node token' }, { status: 403 });
+    }
 
-    // For now, we'll allow any request (you should validate the node token)
-    // const node = await prisma.beaconNode.findUnique({ where: { token } });
-    // if (!node) return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
+    const updatedSince = req.nextUrl.searchParams.get('updatedSince');
+    const since = updatedSince ? new Date(updatedSince) : null;
+    if (since && isNaN(since.getTime())) {
+        return NextResponse.json({ error: 'Invalid updatedSince' }, { status: 400 });
+    }
 
     try {
-        // Get all enrolled users
+        // Roster version: any user update moves max(updatedAt) (un-enrolling included),
+        // and deleting an enrolled user changes the count
+        const [latest, total] = await Promise.all([
+            prisma.user.aggregate({ _max: { updatedAt: true } }),
+            prisma.user.count({ where: enrolledWhere }),
+        ]);
+        const cursor = latest._max.updatedAt ?? new Date(0);
+        const etag = `W/"${total}-${cursor.getTime()}"`;
+        if (req.headers.get('if-none-match') === etag) {
+            return new NextResponse(null, { status: 304, headers: { ETag: etag } });
+        }
+
+        // Changed users only when the edge has a cursor (inclusive: a user updated in the
+        // same millisecond as the cursor is sent again rather than missed)
         const users = await prisma.user.findMany({
-            where: {
-                fingerprintEnrolled: true,
-                biometricId: { not: null },
-            },
+            where: since ? { ...enrolledWhere, updatedAt: { gte: since } } : enrolledWhere,
             select: {
                 id: true,
                 biometricId: true,
@@ -24,15 +54,26 @@ export async function GET(req: NextRequest) {
                 email: true,
                 fingerprintTemplate: true,
                 enrolledAt: true,
+                updatedAt: true,
             },
             orderBy: { biometricId: 'asc' },
         });
+        const ids = since
+            ? (await prisma.user.findMany({
+                where: enrolledWhere,
+                select: { biometricId: true },
+                orderBy: { biometricId: 'asc' },
+            })).map((user) => user.biometricId)
+            : users.map((user) => user.biometricId);
 
         return NextResponse.json({
             users,
-            total: users.length,
+            total,
+            ids,
+            full: !since,
+            cursor: cursor.toISOString(),
             syncedAt: new Date().toISOString(),
-        });
+        }, { headers: { ETag: etag } });
     } catch (error) {
         console.error('Error syncing users:', error);
         return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
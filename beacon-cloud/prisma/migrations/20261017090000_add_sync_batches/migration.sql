@@ -0,0 +1,15 @@
+-- CreateTable
+CREATE TABLE "SyncBatch" (
+    "id" TEXT NOT NULL,
+    "node_id" TEXT NOT NULL,
+    "response" JSONB NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "SyncBatch_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "SyncBatch_node_id_createdAt_idx" ON "SyncBatch"("node_id", "createdAt");
+
+-- AddForeignKey
+ALTER TABLE "SyncBatch" ADD CONSTRAINT "SyncBatch_node_id_fkey" FOREIGN KEY ("node_id") REFERENCES "BeaconNode"("id") ON DELETE RESTRICT ON UPDATE CASCADE;
@@ -0,0 +1,111 @@
+/**
+ * Compact binary log batches from edge nodes (SEA uploads)
+ * --------------------------------------------------
+ * - Decoder for the format produced by beacon-edge/beacon_core/wire.py
+ * - Selected by Content-Type; plain/GZIP JSON remains the fallback
+ * - Layout: "BCN" | version | compression (0 none, 1 deflate) | body
+ * - Body: count, node id, user-id dictionary, then id / user index /
+ *   timestamp / punch columns (LEB128 varints; ids and timestamps are
+ *   zigzag delta-encoded)
+ */
+
+import zlib from 'zlib';
+
+export const BEACON_WIRE_CONTENT_TYPE = 'application/vnd.beacon.logs.v1';
+
+export interface WireLog {
+  id: number;
+  user_id: string;
+  timestamp: string;
+  punch_type: number;
+  beacon_node_id: string;
+}
+
+class Reader {
+  private pos = 0;
+
+  constructor(private readonly buf: Buffer) {}
+
+  varint(): number {
+    // Arithmetic instead of bit ops so values above 2^31 stay exact
+    let result = 0;
+    let scale = 1;
+    for (;;) {
+      if (this.pos >= this.buf.length) throw new Error('Truncated payload');
+      const byte = this.buf[this.pos++];
+      result += (byte & 0x7f) * scale;
+      if (!(byte & 0x80)) return result;
+      scale *= 128;
+    }
+  }
+
+  string(): string {
+    const length = this.varint();
+    if (this.pos + length > this.buf.length) throw new Error('Truncated payload');
+    const value = this.buf.toString('utf8', this.pos, this.pos + length);
+    this.pos += length;
+    return value;
+  }
+
+  deltas(count: number): number[] {
+    const values: number[] = [];
+    let current = 0;
+    for (let i = 0; i < count; i++) {
+      const raw = this.varint();
+      const value = raw % 2 === 0 ? raw / 2 : -(raw + 1) / 2;
+      current = i === 0 ? value : current + value;
+      values.push(current);
+    }
+    return values;
+  }
+}
+
+const pad = (n: number) => String(n).padStart(2, '0');
+
+// Epoch seconds of the naive device time -> 'YYYY-MM-DD HH:MM:SS', as the JSON path sends it
+function formatTimestamp(seconds: number): string {
+  const d = new Date(seconds * 1000);
+  return `${d.getUTCFullYear()}-${pad(d.getUTCMonth() + 1)}-${pad(d.getUTCDate())} ` +
+    `${pad(d.getUTCHours())}:${pad(d.getUTCMinutes())}:${pad(d.getUTCSeconds())}`;
+}
+
+export function isBeaconWire(contentType: string | null): boolean {
+  return (contentType || '').split(';')[0].trim().toLowerCase() === BEACON_WIRE_CONTENT_TYPE;
+}
+
+export function decodeBeaconWire(payload: Buffer): WireLog[] {
+  if (payload.length < 5 || payload.toString('latin1', 0, 3) !== 'BCN') {
+    throw new Error('Not a BEACON wire payload');
+  }
+  if (payload[3] !== 1) throw new Error(`Unsupported wire version ${payload[3]}`);
+  let body: Buffer;
+  if (payload[4] === 1) body = zlib.inflateSync(payload.subarray(5));
+  else if (payload[4] === 0) body = payload.subarray(5);
+  else throw new Error(`Unsupported compression ${payload[4]}`);
+
+  const reader = new Reader(body);
+  const count = reader.varint();
+  const nodeId = reader.string();
+  const dictSize = reader.varint();
+  const dictionary: string[] = [];
+  for (let i = 0; i < dictSize; i++) dictionary.push(reader.string());
+  const ids = reader.deltas(count);
+  const users: string[] = [];
+  for (let i = 0; i < count; i++) {
+    const index = reader.varint();
+    if (index >= dictionary.length) throw new Error('User index out of range');
+    users.push(dictionary[index]);
+  }
+  const timestamps = reader.deltas(count);
+  const logs: WireLog[] = [];
+  for (let i = 0; i < count; i++) {
+    logs.push({
+      id: ids[i],
+      user_id: users[i],
+      timestamp: formatTimestamp(timestamps[i]),
+      punch_type: reader.varint(),
+      beacon_node_id: nodeId,
+    });
+  }
+  return logs;
+}
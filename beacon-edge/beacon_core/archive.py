@@ -0,0 +1,151 @@
+"""
+Archive module for Project BEACON Edge Gateway
+----------------------------------------------
+- Retention: moves synced logs older than ARCHIVE_RETENTION_DAYS out of SQLite
+- Archives are append-only, GZIP-compressed JSON lines, one file per month
+  (each run appends a new GZIP member; readers see one continuous stream)
+- Archived rows keep deduplicating via Database.purge_archived (key hashes)
+- Archived months can be re-uploaded on demand:
+  python -m beacon_core.archive reupload 2025-01
+"""
+
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from beacon_core.database import Database, log_key_hash
+from beacon_core.logger import get_logger
+
+# Synced logs older than this many days are archived (0 disables retention)
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '90'))
+# Archive directory; defaults to "archive" next to the database file
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+# How often main.py runs retention, and rows moved per transaction
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', str(24 * 3600)))
+ARCHIVE_BATCH_ROWS = int(os.getenv('ARCHIVE_BATCH_ROWS', '5000'))
+
+ARCHIVE_PREFIX = 'beacon_logs-'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+logger = get_logger('Archive')
+
+
+class Archiver:
+    """
+    Moves old synced rows from beacon_logs into monthly archive files.
+    Each batch is appended and fsynced before its rows are deleted, so a crash
+    can at worst write a row twice (readers skip repeats), never lose it.
+    """
+    def __init__(self, db: Database, archive_dir: Optional[str] = None,
+                 retention_days: int = ARCHIVE_RETENTION_DAYS):
+        self.db = db
+        self.archive_dir = archive_dir or ARCHIVE_DIR or \
+            os.path.join(os.path.dirname(os.path.abspath(db.db_path)), 'archive')
+        self.retention_days = retention_days
+
+    def path_for(self, month: str) -> str:
+        """
+        Archive file for a month ('YYYY-MM').
+        """
+        return os.path.join(self.archive_dir, f'{ARCHIVE_PREFIX}{month}{ARCHIVE_SUFFIX}')
+
+    def months(self) -> List[str]:
+        """
+        Months with an archive file, oldest first.
+        """
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            name[len(ARCHIVE_PREFIX):-len(ARCHIVE_SUFFIX)]
+            for name in os.listdir(self.archive_dir)
+            if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)
+        )
+
+    def _append(self, month: str, rows: List[Tuple[Any, ...]]) -> None:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        lines = ''.join(json.dumps([row[0], row[1], row[2], row[3], row[5]]) + '\n' for row in rows)
+        with open(self.path_for(month), 'ab') as f:
+            f.write(gzip.compress(lines.encode('utf-8')))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, now: Optional[datetime] = None) -> int:
+        """
+        Archive synced logs older than the retention window.
+        Returns: number of rows archived
+        """
+        if self.retention_days <= 0:
+            return 0
+        cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).isoformat(sep=' ', timespec='seconds')
+        archived = 0
+        after_id = 0
+        while True:
+            rows = self.db.fetch_synced_before(cutoff, after_id, ARCHIVE_BATCH_ROWS)
+            if not rows:
+                break
+            by_month: Dict[str, List[Tuple[Any, ...]]] = {}
+            for row in rows:
+                by_month.setdefault(str(row[2])[:7], []).append(row)
+            for month, month_rows in by_month.items():
+                self._append(month, month_rows)
+            self.db.purge_archived(rows)
+            archived += len(rows)
+            after_id = rows[-1][0]
+        if archived:
+            logger.info("%d synced logs older than %s moved to %s", archived, cutoff, self.archive_dir)
+        return archived
+
+    def iter_month(self, month: str) -> Iterator[Tuple[Any, ...]]:
+        """
+        Yield the archived rows of a month in beacon_logs column order
+        (sync_status 1), skipping repeats left by an interrupted run.
+        """
+        path = self.path_for(month)
+        if not os.path.exists(path):
+            return
+        seen: Set[int] = set()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                log_id, user_id, timestamp, punch_type, node_id = json.loads(line)
+                key = log_key_hash(user_id, timestamp, punch_type, node_id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield (log_id, user_id, timestamp, punch_type, 1, node_id)
+
+
+def main(argv: List[str]) -> int:
+    """
+    python -m beacon_core.archive run | list | reupload YYYY-MM [YYYY-MM ...]
+    reupload uses the same CLOUD_API_URL / BEACON_MODE / BEACON_TOKEN / BEACON_NODE_ID as main.py.
+    """
+    if not argv or argv[0] not in ('run', 'list', 'reupload'):
+        print(main.__doc__)
+        return 2
+    db = Database()
+    try:
+        archiver = Archiver(db)
+        if argv[0] == 'run':
+            archiver.run()
+        elif argv[0] == 'list':
+            for month in archiver.months():
+                print(month, os.path.getsize(archiver.path_for(month)), 'bytes')
+        else:
+            from beacon_core.syncer import Syncer
+            syncer = Syncer(db, os.getenv('BEACON_NODE_ID', ''), os.getenv('CLOUD_API_URL', ''),
+                            os.getenv('BEACON_MODE', 'LAND'), os.getenv('BEACON_TOKEN', ''))
+            try:
+                for month in argv[1:] or archiver.months():
+                    sent = syncer.reupload(archiver.iter_month(month))
+                    print(f"[Archive] {month}: {sent} logs re-uploaded")
+            finally:
+                syncer.close()
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -3,21 +3,156 @@ Database module for Project BEACON Edge Gateway
 -----------------------------------------------
 - Handles all SQLite operations (thread-safe)
 - Deduplicates logs by (user_id, timestamp)
-- Used by harvester and syncer modules
+- Keeps archived rows deduplicated via compact key hashes (see archive.py)
+- Quarantines logs the cloud rejects (sync_status=2) instead of resending them
+- Holds logs the cloud deferred (sync_status=3: user not enrolled there yet)
+  until requeue_deferred() puts them back in the queue
+- Journals upload batches (prepared -> sent -> acknowledged) for crash recovery
+- Reports write-lock waits, write transaction times and backlog depth as metrics
+- Mirrors the cloud's enrolled users for user sync, with a record of what was
+  pushed to each device
+- Used by harvester, syncer and usersync modules
 """
 
+import hashlib
+import json
 import sqlite3
-from typing import Any, List, Tuple, Optional
+import uuid
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Optional
 from datetime import datetime
 
 import os
 import threading
+from beacon_core.logger import get_logger
+from beacon_core.metrics import REGISTRY, LOCK_WAIT_BUCKETS
 
-# Thread lock for safe concurrent DB access
-DB_LOCK = threading.Lock()
+# Default SQLite DB path (absolute path in beacon-edge directory, overridable for container volumes)
+DB_PATH = os.getenv('BEACON_DB_PATH') or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'beacon.db'))
+
+# Records written per transaction by insert_logs_bulk (one commit per chunk)
+BULK_CHUNK_SIZE = int(os.getenv('DB_BULK_CHUNK_SIZE', '5000'))
+
+# Upload batch bounds for iter_unsynced_batches (rows per page, approx. payload bytes)
+SYNC_BATCH_ROWS = int(os.getenv('SYNC_BATCH_ROWS', '1000'))
+SYNC_BATCH_BYTES = int(os.getenv('SYNC_BATCH_BYTES', str(256 * 1024)))
+
+# Connection tuning: WAL lets readers run while a write is in progress, and
+# synchronous=NORMAL only fsyncs at checkpoints (still crash-safe under WAL)
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '2048'))
+DB_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}',
+    'PRAGMA temp_store=MEMORY',
+    f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}',
+)
+logger = get_logger('Database')
+
+DB_LOCK_WAIT = REGISTRY.histogram('beacon_db_lock_wait_seconds', 'Time spent waiting for the SQLite write lock',
+                                  buckets=LOCK_WAIT_BUCKETS)
+DB_WRITE_TIME = REGISTRY.histogram('beacon_db_write_seconds', 'Duration of SQLite write transactions',
+                                   buckets=LOCK_WAIT_BUCKETS)
+
+
+class ConnectionManager:
+    """
+    Long-lived SQLite connections for the edge process.
+    - One persistent connection per thread (sqlite3 connections are not shareable)
+    - WAL journal: readers never block on the writer and vice versa
+    - Writers are serialised in-process and open BEGIN IMMEDIATE transactions,
+      so SQLite never has to busy-wait between our own threads
+    - Time spent waiting for the write lock is recorded (see lock_stats)
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's connection, opening and tuning it on first use.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False only so close_all() can close other threads' connections
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            for pragma in DB_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        Connection for read-only statements; takes no lock.
+        """
+        yield self.connection()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Connection inside a write transaction; commits on success, rolls back on error.
+        """
+        conn = self.connection()
+        started = time.perf_counter()
+        with self._write_lock:
+            acquired = time.perf_counter()
+            self._record_wait(acquired - started)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            DB_WRITE_TIME.observe(time.perf_counter() - acquired)
+
+    def _record_wait(self, waited: float) -> None:
+        DB_LOCK_WAIT.observe(waited)
+        with self._stats_lock:
+            self._waits += 1
+            self._wait_total += waited
+            if waited > self._wait_max:
+                self._wait_max = waited
+
+    def lock_stats(self) -> Dict[str, float]:
+        """
+        Write-lock wait timings since startup (seconds).
+        """
+        with self._stats_lock:
+            return {
+                'acquisitions': self._waits,
+                'wait_total_s': self._wait_total,
+                'wait_max_s': self._wait_max,
+                'wait_avg_s': self._wait_total / self._waits if self._waits else 0.0,
+            }
+
+    def close_all(self) -> None:
+        """
+        Checkpoint the WAL into the main DB file and close every connection.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
 
-# Default SQLite DB path (absolute path in beacon-edge directory)
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'beacon-edge', 'beacon.db'))
 
 # SQL to create the beacon_logs table (deduplicated by user_id, timestamp, punch_type, beacon_node_id)
 CREATE_TABLE_SQL = '''
@@ -32,6 +167,152 @@ CREATE TABLE IF NOT EXISTS beacon_logs (
 );
 '''
 
+# Databases created by older builds lack the UNIQUE constraint above; this index
+# provides the same guarantee so INSERT OR IGNORE can be relied upon everywhere.
+CREATE_DEDUP_INDEX_SQL = '''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_beacon_logs_dedup
+ON beacon_logs (user_id, timestamp, punch_type, beacon_node_id);
+'''
+
+# Removes duplicates left behind by older builds so the dedup index can be created
+DELETE_DUPLICATES_SQL = '''
+DELETE FROM beacon_logs WHERE id NOT IN (
+    SELECT MIN(id) FROM beacon_logs
+    GROUP BY user_id, timestamp, punch_type, beacon_node_id
+);
+'''
+
+# Partial index over the sync queue only: stays small however many synced rows
+# accumulate, and serves the (timestamp, id) keyset scans of the syncer
+CREATE_UNSYNCED_INDEX_SQL = '''
+CREATE INDEX IF NOT EXISTS idx_beacon_logs_unsynced
+ON beacon_logs (timestamp, id) WHERE sync_status=0;
+'''
+
+# 64-bit hashes of the dedup keys of rows moved to the archive, so a re-harvested
+# punch is still recognised after its row has left beacon_logs
+CREATE_ARCHIVED_KEYS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS archived_keys (
+    key_hash INTEGER PRIMARY KEY
+);
+'''
+
+# Logs the cloud rejected (beacon_logs.sync_status=2), with the reason it gave
+CREATE_QUARANTINE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS quarantined_logs (
+    log_id INTEGER PRIMARY KEY,
+    reason TEXT NOT NULL,
+    quarantined_at DATETIME NOT NULL
+);
+'''
+
+# Upload batch journal: a batch is 'prepared' before its first POST, 'sent' once
+# a POST may have reached the cloud, and 'acknowledged' in the same transaction
+# that settles its logs. log_ids is a JSON array of the batch's beacon_logs ids.
+CREATE_SYNC_JOURNAL_SQL = '''
+CREATE TABLE IF NOT EXISTS sync_journal (
+    batch_id TEXT PRIMARY KEY,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    log_ids TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+'''
+
+# Per-connection scratch table for set-based updates by id (see _stage_ids)
+CREATE_TEMP_IDS_SQL = 'CREATE TEMP TABLE IF NOT EXISTS staged_ids (id INTEGER PRIMARY KEY)'
+
+# Per-device harvest cursor (high-water mark) for incremental harvesting
+CREATE_CURSORS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS device_cursors (
+    device_ip TEXT PRIMARY KEY,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    last_timestamp DATETIME,
+    updated_at DATETIME NOT NULL
+);
+'''
+
+# Bytes sent to the cloud per UTC day (SEA satellite budget)
+CREATE_SYNC_USAGE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS sync_usage (
+    day TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+# Enrolled users mirrored from the cloud (/api/edge/sync-users); template holds the
+# raw fingerprint template bytes, updated_at the cloud's timestamp
+CREATE_CLOUD_USERS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS cloud_users (
+    biometric_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    template BLOB,
+    updated_at TEXT NOT NULL
+);
+'''
+
+# Users user sync wrote to each device, with a digest of the name and template
+# pushed, so unchanged users are never rewritten
+CREATE_DEVICE_USERS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS device_users (
+    device_ip TEXT NOT NULL,
+    biometric_id INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (device_ip, biometric_id)
+);
+'''
+
+# Small named values that must survive restarts (user sync cursor and ETag)
+CREATE_SYNC_STATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+INSERT_IGNORE_SQL = '''
+INSERT OR IGNORE INTO beacon_logs (user_id, timestamp, punch_type, sync_status, beacon_node_id)
+VALUES (?, ?, ?, 0, ?)
+'''
+
+# Same as INSERT_IGNORE_SQL, plus a check against archived_keys (last parameter: log_key_hash)
+INSERT_IGNORE_UNARCHIVED_SQL = '''
+INSERT OR IGNORE INTO beacon_logs (user_id, timestamp, punch_type, sync_status, beacon_node_id)
+SELECT ?, ?, ?, 0, ? WHERE NOT EXISTS (SELECT 1 FROM archived_keys WHERE key_hash=?)
+'''
+
+# (user_id, timestamp, punch_type, beacon_node_id)
+LogRecord = Tuple[str, datetime, int, str]
+
+# (biometric_id, name, template, updated_at)
+CloudUser = Tuple[int, str, Optional[bytes], str]
+
+
+def log_key_hash(user_id: Any, timestamp: Any, punch_type: Any, beacon_node_id: Any) -> int:
+    """
+    Signed 64-bit hash of a log's dedup key, as stored in archived_keys.
+    Timestamps hash the way SQLite stores them ('YYYY-MM-DD HH:MM:SS').
+    """
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat(sep=' ')
+    key = f"{user_id}\x1f{timestamp}\x1f{int(punch_type)}\x1f{beacon_node_id}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big', signed=True)
+
+
+def estimate_row_bytes(row: Tuple[Any, ...]) -> int:
+    """Approximate JSON size of one beacon_logs row as uploaded (values plus key overhead)."""
+    return sum(len(str(value)) for value in row) + 80
+
+
+class IngestResult(NamedTuple):
+    """Outcome of a bulk insert: rows written vs. rows skipped as duplicates."""
+    inserted: int
+    duplicates: int
+
+
 class Database:
     """
     SQLite database handler for BEACON logs.
@@ -39,57 +320,87 @@ class Database:
     - Provides safe insert, fetch, and update methods
     """
     def __init__(self, db_path: str = DB_PATH):
-        import os
-        print(f"[DEBUG] CWD: {os.getcwd()}")
-        print(f"[DEBUG] DB_PATH resolved: {db_path}")
-        parent_dir = os.path.dirname(db_path)
-        print(f"[DEBUG] Parent directory: {parent_dir}")
-        print(f"[DEBUG] Parent directory exists: {os.path.exists(parent_dir)}")
-        print(f"[DEBUG] Parent directory writable: {os.access(parent_dir, os.W_OK)}")
+        if logger.debug_enabled():
+            parent_dir = os.path.dirname(db_path)
+            logger.debug("Opening %s (cwd %s, parent exists %s, writable %s)", db_path, os.getcwd(),
+                         os.path.exists(parent_dir), os.access(parent_dir, os.W_OK))
         self.db_path = db_path
+        self.connections = ConnectionManager(db_path)
+        self._has_archived_keys = False
         self._init_db()
+        REGISTRY.gauge('beacon_unsynced_logs', 'Logs waiting to be uploaded', fn=self.count_unsynced)
+        REGISTRY.gauge('beacon_quarantined_logs', 'Logs the cloud rejected (held for review)',
+                       fn=self.count_quarantined)
+        REGISTRY.gauge('beacon_deferred_logs', 'Logs the cloud deferred (user not enrolled there yet)',
+                       fn=self.count_deferred)
 
     def _init_db(self) -> None:
         """
         Create the beacon_logs table if it doesn't exist.
         """
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
+        with self.connections.writer() as conn:
             conn.execute(CREATE_TABLE_SQL)
-            conn.commit()
+            conn.execute(CREATE_CURSORS_TABLE_SQL)
+            conn.execute(CREATE_SYNC_USAGE_TABLE_SQL)
+            conn.execute(CREATE_ARCHIVED_KEYS_TABLE_SQL)
+            conn.execute(CREATE_QUARANTINE_TABLE_SQL)
+            conn.execute(CREATE_SYNC_JOURNAL_SQL)
+            conn.execute(CREATE_CLOUD_USERS_TABLE_SQL)
+            conn.execute(CREATE_DEVICE_USERS_TABLE_SQL)
+            conn.execute(CREATE_SYNC_STATE_TABLE_SQL)
+            try:
+                conn.execute(CREATE_DEDUP_INDEX_SQL)
+            except sqlite3.IntegrityError:
+                conn.execute(DELETE_DUPLICATES_SQL)
+                conn.execute(CREATE_DEDUP_INDEX_SQL)
+            conn.execute(CREATE_UNSYNCED_INDEX_SQL)
+            self._has_archived_keys = conn.execute('SELECT 1 FROM archived_keys LIMIT 1').fetchone() is not None
 
     def insert_logs_safely(self, user_id: str, timestamp: datetime, punch_type: int, beacon_node_id: str) -> None:
         """
         Insert a log, handling UNIQUE(user_id, timestamp) collisions gracefully.
         Used by harvester for fast deduplication.
         """
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            try:
-                conn.execute(
-                    'INSERT INTO beacon_logs (user_id, timestamp, punch_type, sync_status, beacon_node_id) VALUES (?, ?, ?, 0, ?)',
-                    (user_id, timestamp, punch_type, beacon_node_id)
-                )
-                conn.commit()
-            except sqlite3.IntegrityError:
-                # Duplicate entry, ignore
-                pass
+        self.insert_logs_bulk([(user_id, timestamp, punch_type, beacon_node_id)])
 
     def insert_ignore_duplicates(self, user_id: str, timestamp: datetime, punch_type: int, beacon_node_id: str) -> None:
         """
         Insert a log if it does not already exist (by user_id, timestamp, punch_type, beacon_node_id).
         Prevents double-counting on reconnection or re-harvest.
-        Used by harvester for extra deduplication.
-        """
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 1 FROM beacon_logs WHERE user_id=? AND timestamp=? AND punch_type=? AND beacon_node_id=?
-            ''', (user_id, timestamp, punch_type, beacon_node_id))
-            if cursor.fetchone() is None:
-                cursor.execute('''
-                    INSERT INTO beacon_logs (user_id, timestamp, punch_type, sync_status, beacon_node_id)
-                    VALUES (?, ?, ?, 0, ?)
-                ''', (user_id, timestamp, punch_type, beacon_node_id))
-                conn.commit()
+        Prefer insert_logs_bulk when storing more than a handful of records.
+        """
+        self.insert_logs_bulk([(user_id, timestamp, punch_type, beacon_node_id)])
+
+    def insert_logs_bulk(self, records: Iterable[LogRecord], chunk_size: int = BULK_CHUNK_SIZE) -> IngestResult:
+        """
+        Insert many logs, skipping duplicates via the UNIQUE key (no read-then-write).
+        Records are (user_id, timestamp, punch_type, beacon_node_id) tuples; they are
+        consumed lazily and written chunk_size at a time with one commit per chunk,
+        so the write lock is released between chunks. Once rows have been
+        archived, records whose key is in archived_keys are skipped as duplicates.
+        Returns: IngestResult(inserted, duplicates)
+        """
+        inserted = 0
+        total = 0
+        it = iter(records)
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                break
+            with self.connections.writer() as conn:
+                # Re-checked under the write lock: the archiver may run in another process
+                if not self._has_archived_keys:
+                    self._has_archived_keys = conn.execute('SELECT 1 FROM archived_keys LIMIT 1').fetchone() is not None
+                sql = INSERT_IGNORE_SQL
+                params: List[Tuple[Any, ...]] = chunk
+                if self._has_archived_keys:
+                    sql = INSERT_IGNORE_UNARCHIVED_SQL
+                    params = [tuple(record) + (log_key_hash(*record),) for record in chunk]
+                before = conn.total_changes
+                conn.executemany(sql, params)
+                inserted += conn.total_changes - before
+            total += len(chunk)
+        return IngestResult(inserted, total - inserted)
 
     def fetch_unsynced_logs(self, limit: Optional[int] = None) -> List[Tuple[Any, ...]]:
         """
@@ -97,79 +408,425 @@ class Database:
         Optionally limit the number of logs (for SEA batch sync).
         Returns: List of tuples (all columns)
         """
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            sql = 'SELECT * FROM beacon_logs WHERE sync_status=0 ORDER BY timestamp ASC'
+        with self.connections.reader() as conn:
+            sql = 'SELECT * FROM beacon_logs WHERE sync_status=0 ORDER BY timestamp ASC, id ASC'
             if limit:
                 sql += f' LIMIT {limit}'
             return conn.execute(sql).fetchall()
 
-    def mark_logs_synced(self, ids: List[int]) -> None:
+    def count_unsynced(self) -> int:
+        """
+        Number of logs waiting to be uploaded (counted on the unsynced index).
+        """
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT COUNT(*) FROM beacon_logs WHERE sync_status=0').fetchone()[0]
+
+    def fetch_unsynced_page(self, after: Optional[Tuple[Any, int]], limit: int) -> List[Tuple[Any, ...]]:
+        """
+        Fetch the next page of unsynced logs in (timestamp, id) order.
+        Keyset pagination: after is the (timestamp, id) of the last row of the
+        previous page, or None for the first page.
+        Returns: List of tuples (all columns)
+        """
+        with self.connections.reader() as conn:
+            if after is None:
+                return conn.execute(
+                    'SELECT * FROM beacon_logs WHERE sync_status=0 '
+                    'ORDER BY timestamp ASC, id ASC LIMIT ?',
+                    (limit,)
+                ).fetchall()
+            return conn.execute(
+                'SELECT * FROM beacon_logs WHERE sync_status=0 AND (timestamp > ? OR (timestamp = ? AND id > ?)) '
+                'ORDER BY timestamp ASC, id ASC LIMIT ?',
+                (after[0], after[0], after[1], limit)
+            ).fetchall()
+
+    def iter_unsynced_batches(self, max_rows: int = SYNC_BATCH_ROWS, max_bytes: int = SYNC_BATCH_BYTES,
+                              row_size: Callable[[Tuple[Any, ...]], int] = estimate_row_bytes
+                              ) -> Iterator[List[Tuple[Any, ...]]]:
+        """
+        Stream the unsynced backlog as bounded batches, oldest first.
+        Each batch holds at most max_rows rows and, beyond its first row, at most
+        max_bytes as measured by row_size. Only one page is held in memory, so
+        the caller can upload and mark each batch before the next is read.
+        """
+        after = None
+        while True:
+            rows = self.fetch_unsynced_page(after, max_rows)
+            if not rows:
+                return
+            batch: List[Tuple[Any, ...]] = []
+            size = 0
+            for row in rows:
+                row_bytes = row_size(row)
+                if batch and size + row_bytes > max_bytes:
+                    yield batch
+                    batch, size = [], 0
+                batch.append(row)
+                size += row_bytes
+            yield batch
+            if len(rows) < max_rows:
+                return
+            after = (rows[-1][2], rows[-1][0])
+
+    @staticmethod
+    def _stage_ids(conn: sqlite3.Connection, ids: List[int]) -> Optional[Tuple[int, int]]:
+        """
+        Prepare ids for a single set-based statement: returns (first, last) when
+        they form one contiguous range, otherwise loads them into temp.staged_ids
+        and returns None. Call inside a writer transaction.
+        """
+        if ids[-1] - ids[0] + 1 == len(ids):
+            return ids[0], ids[-1]
+        conn.execute(CREATE_TEMP_IDS_SQL)
+        conn.execute('DELETE FROM temp.staged_ids')
+        conn.executemany('INSERT INTO temp.staged_ids (id) VALUES (?)', [(i,) for i in ids])
+        return None
+
+    def mark_logs_synced(self, ids: Iterable[int]) -> None:
         """
-        Mark logs as synced (sync_status=1) by their IDs.
-        Used by syncer after successful upload.
+        Mark logs as synced (sync_status=1) by their IDs, in one UPDATE
+        (an id range, or a join against a temp table of the ids).
+        Used by syncer for the ids the cloud acknowledged.
         """
+        ids = sorted(set(ids))
         if not ids:
             return
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            conn.executemany('UPDATE beacon_logs SET sync_status=1 WHERE id=?', [(i,) for i in ids])
-            conn.commit()
-import sqlite3
-from typing import Any, List, Tuple, Optional
-from datetime import datetime
-import threading
+        with self.connections.writer() as conn:
+            self._mark_synced(conn, ids)
 
-DB_LOCK = threading.Lock()
+    def _mark_synced(self, conn: sqlite3.Connection, ids: List[int]) -> None:
+        self._set_status(conn, ids, 1)
 
-DB_PATH = 'beacon.db'
+    def _set_status(self, conn: sqlite3.Connection, ids: Iterable[int], status: int) -> None:
+        """
+        Set sync_status for the given ids in one UPDATE (see _stage_ids).
+        """
+        ids = sorted(set(ids))
+        if not ids:
+            return
+        id_range = self._stage_ids(conn, ids)
+        if id_range:
+            conn.execute('UPDATE beacon_logs SET sync_status=? WHERE id BETWEEN ? AND ?', (status,) + id_range)
+        else:
+            conn.execute('UPDATE beacon_logs SET sync_status=? WHERE id IN (SELECT id FROM temp.staged_ids)',
+                         (status,))
 
-CREATE_TABLE_SQL = '''
-CREATE TABLE IF NOT EXISTS beacon_logs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT NOT NULL,
-    timestamp DATETIME NOT NULL,
-    punch_type INTEGER NOT NULL,
-    sync_status INTEGER NOT NULL DEFAULT 0,
-    beacon_node_id TEXT NOT NULL
-);
-'''
+    def quarantine_logs(self, rejected: Iterable[Tuple[int, str]]) -> None:
+        """
+        Take logs the cloud rejected out of the sync queue (sync_status=2) and
+        record why. They stay in beacon_logs until requeued.
+        """
+        rejected = list(rejected)
+        if not rejected:
+            return
+        with self.connections.writer() as conn:
+            self._quarantine(conn, rejected)
 
-class Database:
-    def __init__(self, db_path: str = DB_PATH):
-        self.db_path = db_path
-        self._init_db()
+    def _quarantine(self, conn: sqlite3.Connection, rejected: List[Tuple[int, str]]) -> None:
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        conn.executemany(
+            'INSERT INTO quarantined_logs (log_id, reason, quarantined_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(log_id) DO UPDATE SET reason=excluded.reason, quarantined_at=excluded.quarantined_at',
+            [(log_id, reason, now) for log_id, reason in rejected]
+        )
+        self._set_status(conn, [log_id for log_id, _ in rejected], 2)
 
-    def _init_db(self) -> None:
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            conn.execute(CREATE_TABLE_SQL)
-            conn.commit()
+    def _defer(self, conn: sqlite3.Connection, deferred: List[int]) -> None:
+        self._set_status(conn, deferred, 3)
 
-    def insert_ignore_duplicates(self, user_id: str, timestamp: datetime, punch_type: int, beacon_node_id: str) -> None:
+    def count_deferred(self) -> int:
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT COUNT(*) FROM beacon_logs WHERE sync_status=3').fetchone()[0]
+
+    def requeue_deferred(self) -> int:
         """
-        Insert a log if it does not already exist (by user_id, timestamp, punch_type, beacon_node_id).
-        Prevents double-counting on reconnection or re-harvest.
+        Put deferred logs back in the sync queue (e.g. after new users reach the
+        cloud), together with logs older builds quarantined as 'unknown user'.
+        Returns: number of logs requeued
         """
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 1 FROM beacon_logs WHERE user_id=? AND timestamp=? AND punch_type=? AND beacon_node_id=?
-            ''', (user_id, timestamp, punch_type, beacon_node_id))
-            if cursor.fetchone() is None:
-                cursor.execute('''
-                    INSERT INTO beacon_logs (user_id, timestamp, punch_type, sync_status, beacon_node_id)
-                    VALUES (?, ?, ?, 0, ?)
-                ''', (user_id, timestamp, punch_type, beacon_node_id))
-                conn.commit()
+        with self.connections.writer() as conn:
+            cur = conn.execute(
+                "UPDATE beacon_logs SET sync_status=0 WHERE sync_status=3 OR (sync_status=2 AND id IN "
+                "(SELECT log_id FROM quarantined_logs WHERE reason='unknown user'))"
+            )
+            conn.execute("DELETE FROM quarantined_logs WHERE reason='unknown user'")
+            return cur.rowcount
 
-    def fetch_unsynced_logs(self, limit: Optional[int] = None) -> List[Tuple[Any, ...]]:
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            sql = 'SELECT * FROM beacon_logs WHERE sync_status=0 ORDER BY timestamp ASC'
-            if limit:
-                sql += f' LIMIT {limit}'
-            return conn.execute(sql).fetchall()
+    def count_quarantined(self) -> int:
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT COUNT(*) FROM beacon_logs WHERE sync_status=2').fetchone()[0]
 
-    def mark_logs_synced(self, ids: List[int]) -> None:
-        if not ids:
+    def fetch_quarantined(self) -> List[Tuple[Any, ...]]:
+        """
+        Quarantined logs with the rejection reason.
+        Returns: List of tuples (all beacon_logs columns, reason, quarantined_at)
+        """
+        with self.connections.reader() as conn:
+            return conn.execute(
+                'SELECT l.*, q.reason, q.quarantined_at FROM beacon_logs l '
+                'JOIN quarantined_logs q ON q.log_id = l.id WHERE l.sync_status=2 ORDER BY l.id'
+            ).fetchall()
+
+    def requeue_quarantined(self, ids: Optional[List[int]] = None) -> int:
+        """
+        Put quarantined logs (all, or the given ids) back in the sync queue.
+        Returns: number of logs requeued
+        """
+        with self.connections.writer() as conn:
+            if ids is None:
+                cur = conn.execute('UPDATE beacon_logs SET sync_status=0 WHERE sync_status=2')
+                conn.execute('DELETE FROM quarantined_logs')
+                return cur.rowcount
+            ids = sorted(set(ids))
+            if not ids:
+                return 0
+            id_range = self._stage_ids(conn, ids)
+            if id_range:
+                cur = conn.execute('UPDATE beacon_logs SET sync_status=0 WHERE id BETWEEN ? AND ? AND sync_status=2',
+                                   id_range)
+                conn.execute('DELETE FROM quarantined_logs WHERE log_id BETWEEN ? AND ?', id_range)
+            else:
+                cur = conn.execute('UPDATE beacon_logs SET sync_status=0 '
+                                   'WHERE id IN (SELECT id FROM temp.staged_ids) AND sync_status=2')
+                conn.execute('DELETE FROM quarantined_logs WHERE log_id IN (SELECT id FROM temp.staged_ids)')
+            return cur.rowcount
+
+    def fetch_synced_before(self, cutoff: str, after_id: int, limit: int) -> List[Tuple[Any, ...]]:
+        """
+        Fetch synced logs older than cutoff ('YYYY-MM-DD HH:MM:SS') in id order,
+        starting after after_id. Used by the archiver to page through retention.
+        Returns: List of tuples (all columns)
+        """
+        with self.connections.reader() as conn:
+            return conn.execute(
+                'SELECT * FROM beacon_logs WHERE sync_status=1 AND timestamp < ? AND id > ? '
+                'ORDER BY id ASC LIMIT ?',
+                (cutoff, after_id, limit)
+            ).fetchall()
+
+    def purge_archived(self, rows: List[Tuple[Any, ...]]) -> None:
+        """
+        Delete rows that have been written to the archive, keeping their dedup
+        key hashes in one transaction so the UNIQUE guarantee survives the move.
+        """
+        if not rows:
             return
-        with DB_LOCK, sqlite3.connect(self.db_path) as conn:
-            conn.executemany('UPDATE beacon_logs SET sync_status=1 WHERE id=?', [(i,) for i in ids])
-            conn.commit()
+        with self.connections.writer() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO archived_keys (key_hash) VALUES (?)',
+                [(log_key_hash(row[1], row[2], row[3], row[5]),) for row in rows]
+            )
+            conn.executemany('DELETE FROM beacon_logs WHERE id=?', [(row[0],) for row in rows])
+        self._has_archived_keys = True
+
+    def journal_prepare(self, ids: List[int]) -> str:
+        """
+        Record a new upload batch in the sync journal (state 'prepared').
+        Returns: the batch id, sent to the cloud as the Idempotency-Key
+        """
+        batch_id = uuid.uuid4().hex
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self.connections.writer() as conn:
+            conn.execute(
+                'INSERT INTO sync_journal (batch_id, first_id, last_id, row_count, log_ids, state, created_at, updated_at) '
+                "VALUES (?, ?, ?, ?, ?, 'prepared', ?, ?)",
+                (batch_id, min(ids), max(ids), len(ids), json.dumps(ids), now, now)
+            )
+        return batch_id
+
+    def journal_mark_sent(self, batch_id: str) -> None:
+        """
+        Move a batch to 'sent' (call right before its POST goes out).
+        """
+        with self.connections.writer() as conn:
+            conn.execute(
+                "UPDATE sync_journal SET state='sent', updated_at=? WHERE batch_id=? AND state='prepared'",
+                (datetime.now().isoformat(sep=' ', timespec='seconds'), batch_id)
+            )
+
+    def journal_discard(self, batch_id: str) -> None:
+        """
+        Forget a batch the cloud never processed; its logs stay queued.
+        """
+        with self.connections.writer() as conn:
+            conn.execute('DELETE FROM sync_journal WHERE batch_id=?', (batch_id,))
+
+    def journal_pending(self) -> List[Tuple[str, str, List[int]]]:
+        """
+        Batches not yet acknowledged, oldest first.
+        Returns: List of (batch_id, state, log_ids)
+        """
+        with self.connections.reader() as conn:
+            rows = conn.execute(
+                "SELECT batch_id, state, log_ids FROM sync_journal WHERE state != 'acknowledged' ORDER BY created_at"
+            ).fetchall()
+        return [(batch_id, state, json.loads(log_ids)) for batch_id, state, log_ids in rows]
+
+    def journal_prune(self, before: datetime) -> int:
+        """
+        Delete acknowledged journal entries last updated before the given time.
+        Returns: number of entries deleted
+        """
+        with self.connections.writer() as conn:
+            return conn.execute(
+                "DELETE FROM sync_journal WHERE state='acknowledged' AND updated_at < ?",
+                (before.isoformat(sep=' ', timespec='seconds'),)
+            ).rowcount
+
+    def settle_batch(self, batch_id: Optional[str], synced: Iterable[int],
+                     rejected: Iterable[Tuple[int, str]] = (), deferred: Iterable[int] = ()) -> None:
+        """
+        Apply the cloud's ack for a batch in one transaction: mark synced ids,
+        quarantine rejected ones, hold deferred ones and move the journal entry
+        to 'acknowledged'.
+        """
+        synced = sorted(set(synced))
+        rejected = list(rejected)
+        deferred = list(deferred)
+        with self.connections.writer() as conn:
+            if synced:
+                self._mark_synced(conn, synced)
+            if rejected:
+                self._quarantine(conn, rejected)
+            if deferred:
+                self._defer(conn, deferred)
+            if batch_id is not None:
+                conn.execute(
+                    "UPDATE sync_journal SET state='acknowledged', updated_at=? WHERE batch_id=?",
+                    (datetime.now().isoformat(sep=' ', timespec='seconds'), batch_id)
+                )
+
+    def get_device_cursor(self, device_ip: str) -> Optional[Tuple[int, Optional[datetime]]]:
+        """
+        Fetch the harvest high-water mark stored for a device.
+        Returns: (record_count, last_timestamp) or None if the device was never harvested
+        """
+        with self.connections.reader() as conn:
+            row = conn.execute(
+                'SELECT record_count, last_timestamp FROM device_cursors WHERE device_ip=?',
+                (device_ip,)
+            ).fetchone()
+        if row is None:
+            return None
+        record_count, last_timestamp = row
+        return record_count, datetime.fromisoformat(last_timestamp) if last_timestamp else None
+
+    def set_device_cursor(self, device_ip: str, record_count: int, last_timestamp: Optional[datetime]) -> None:
+        """
+        Store the harvest high-water mark for a device.
+        Used by harvester after the device's new records have been committed.
+        """
+        with self.connections.writer() as conn:
+            conn.execute(
+                '''
+                INSERT INTO device_cursors (device_ip, record_count, last_timestamp, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(device_ip) DO UPDATE SET
+                    record_count=excluded.record_count,
+                    last_timestamp=excluded.last_timestamp,
+                    updated_at=excluded.updated_at
+                ''',
+                (device_ip, record_count,
+                 last_timestamp.isoformat(sep=' ') if last_timestamp else None,
+                 datetime.now().isoformat(sep=' ', timespec='seconds'))
+            )
+
+    def add_sync_bytes(self, day: str, sent_bytes: int) -> None:
+        """
+        Add to the bytes uploaded on a given day (YYYY-MM-DD, UTC).
+        """
+        with self.connections.writer() as conn:
+            conn.execute(
+                'INSERT INTO sync_usage (day, bytes) VALUES (?, ?) '
+                'ON CONFLICT(day) DO UPDATE SET bytes=bytes + excluded.bytes',
+                (day, sent_bytes)
+            )
+
+    def get_sync_bytes(self, day: str) -> int:
+        """
+        Bytes uploaded on a given day (YYYY-MM-DD, UTC).
+        """
+        with self.connections.reader() as conn:
+            row = conn.execute('SELECT bytes FROM sync_usage WHERE day=?', (day,)).fetchone()
+        return row[0] if row else 0
+
+    def apply_cloud_users(self, changed: Iterable[CloudUser], keep: Optional[Iterable[int]],
+                          state: Dict[str, str]) -> int:
+        """
+        Mirror a user sync response in one transaction: upsert the changed
+        users, delete users not in keep (every enrolled id; None keeps all) and
+        store the sync state (cursor, ETag). Returns the number of users deleted.
+        """
+        with self.connections.writer() as conn:
+            conn.executemany(
+                '''
+                INSERT INTO cloud_users (biometric_id, name, template, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(biometric_id) DO UPDATE SET
+                    name=excluded.name, template=excluded.template, updated_at=excluded.updated_at
+                ''',
+                list(changed)
+            )
+            removed: List[int] = []
+            if keep is not None:
+                keep = set(keep)
+                removed = [row[0] for row in conn.execute('SELECT biometric_id FROM cloud_users')
+                           if row[0] not in keep]
+                conn.executemany('DELETE FROM cloud_users WHERE biometric_id=?', [(i,) for i in removed])
+            conn.executemany(
+                'INSERT INTO sync_state (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value=excluded.value',
+                list(state.items())
+            )
+        return len(removed)
+
+    def fetch_cloud_users(self) -> List[CloudUser]:
+        """
+        The mirrored cloud roster, by biometric id.
+        """
+        with self.connections.reader() as conn:
+            return conn.execute(
+                'SELECT biometric_id, name, template, updated_at FROM cloud_users ORDER BY biometric_id'
+            ).fetchall()
+
+    def fetch_device_users(self, device_ip: str) -> Dict[int, str]:
+        """
+        Users user sync wrote to a device: biometric_id -> digest.
+        """
+        with self.connections.reader() as conn:
+            return dict(conn.execute(
+                'SELECT biometric_id, digest FROM device_users WHERE device_ip=?', (device_ip,)
+            ).fetchall())
+
+    def record_device_users(self, device_ip: str, pushed: Dict[int, str], removed: Iterable[int]) -> None:
+        """
+        Record users written to (biometric_id -> digest) and removed from a device.
+        """
+        with self.connections.writer() as conn:
+            conn.executemany(
+                'INSERT INTO device_users (device_ip, biometric_id, digest) VALUES (?, ?, ?) '
+                'ON CONFLICT(device_ip, biometric_id) DO UPDATE SET digest=excluded.digest',
+                [(device_ip, uid, digest) for uid, digest in pushed.items()]
+            )
+            conn.executemany('DELETE FROM device_users WHERE device_ip=? AND biometric_id=?',
+                             [(device_ip, uid) for uid in removed])
+
+    def get_sync_state(self, key: str) -> Optional[str]:
+        """
+        A stored sync_state value (see apply_cloud_users), or None.
+        """
+        with self.connections.reader() as conn:
+            row = conn.execute('SELECT value FROM sync_state WHERE key=?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def lock_stats(self) -> Dict[str, float]:
+        """
+        Write-lock wait timings (see ConnectionManager.lock_stats).
+        """
+        return self.connections.lock_stats()
+
+    def close(self) -> None:
+        """
+        Checkpoint and close all connections (call on shutdown).
+        """
+        self.connections.close_all()
@@ -0,0 +1,318 @@
+"""
+Devices module for Project BEACON Edge Gateway
+----------------------------------------------
+- Pool of authenticated pyzk sessions keyed by device IP, so dashboard
+  operations cost one command round-trip instead of a TCP connect + ZK auth
+- One mutex per device serialises commands (pyzk sessions are not thread-safe,
+  and terminals handle concurrent sessions poorly)
+- Sessions idle past DEVICE_HEALTH_CHECK_AFTER are checked with a cheap command
+  before reuse; a keepalive thread pings idle sessions and closes them after
+  DEVICE_SESSION_IDLE seconds
+- A command that fails drops its session; the next checkout reconnects
+  (with a short TCP probe first while the device keeps failing)
+- DeviceRunner runs blocking device calls from async code on a bounded thread
+  pool, with a deadline per call and a per-device concurrency limit
+- DEVICE_POOL is the process-wide pool, so the harvester, user sync and the
+  enrollment API share one session per device when they run in one process
+- Long holders (the harvester's live capture) check wanted() and hand the
+  session over whenever another checkout is queued for the device
+- Used by enrollment_service.py, main.py and daemon.py
+"""
+
+import asyncio
+import functools
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+from beacon_core.logger import get_logger
+from beacon_core.metrics import REGISTRY
+
+from zk.base import ZK
+
+ZK_PORT = 4370
+ZK_TIMEOUT = 10
+
+# Idle sessions are closed after this many seconds (0 closes them after every use)
+DEVICE_SESSION_IDLE = float(os.getenv('DEVICE_SESSION_IDLE', '120'))
+# Interval of the keepalive pass over idle sessions
+DEVICE_KEEPALIVE_INTERVAL = float(os.getenv('DEVICE_KEEPALIVE_INTERVAL', '30'))
+# A session idle longer than this is health-checked before it is handed out
+DEVICE_HEALTH_CHECK_AFTER = float(os.getenv('DEVICE_HEALTH_CHECK_AFTER', '10'))
+# How long a request waits for another request's command on the same device
+DEVICE_LOCK_TIMEOUT = float(os.getenv('DEVICE_LOCK_TIMEOUT', '30'))
+# Cheap TCP reachability check used before reconnecting to a failing device
+DEVICE_PROBE_TIMEOUT = float(os.getenv('DEVICE_PROBE_TIMEOUT', '2'))
+# Worker threads for blocking device calls made from async code
+DEVICE_MAX_WORKERS = int(os.getenv('DEVICE_MAX_WORKERS', '8'))
+# Calls in flight per device from async code; the rest wait on the event loop
+# instead of holding a worker thread while the device lock is taken
+DEVICE_CONCURRENCY = int(os.getenv('DEVICE_CONCURRENCY', '1'))
+
+logger = get_logger('Devices')
+
+SESSIONS_OPENED = REGISTRY.counter('beacon_device_sessions_opened_total',
+                                   'Device sessions opened (connect + auth)', ('device',))
+SESSION_CHECKOUTS = REGISTRY.counter('beacon_device_session_checkouts_total',
+                                     'Device session checkouts by outcome', ('device', 'result'))
+
+
+class DeviceBusyError(Exception):
+    """Raised when a device stays locked by other requests past DEVICE_LOCK_TIMEOUT."""
+
+
+@dataclass
+class DeviceSession:
+    """One device's pyzk connection, its command lock and usage stats."""
+    ip: str
+    conn: Any = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Checkouts queued on lock
+    waiting: int = 0
+    last_used: float = 0.0
+    failures: int = 0
+    opened: int = 0
+    checkouts: int = 0
+    last_error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'connected': self.conn is not None,
+            'idle_s': round(time.monotonic() - self.last_used, 1) if self.conn is not None else None,
+            'opened': self.opened,
+            'checkouts': self.checkouts,
+            'consecutive_failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+class DevicePool:
+    def __init__(self, password: Optional[int] = None, port: int = ZK_PORT, timeout: int = ZK_TIMEOUT,
+                 idle_timeout: float = DEVICE_SESSION_IDLE):
+        # None: read ZK_PASSWORD when connecting (the process-wide pool is built before .env loads)
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, DeviceSession] = {}
+        self._stop = threading.Event()
+        self._keepalive: Optional[threading.Thread] = None
+        REGISTRY.gauge('beacon_device_sessions_open', 'Pooled device sessions currently connected',
+                       fn=lambda: sum(1 for s in list(self._sessions.values()) if s.conn is not None))
+
+    def _session(self, ip: str) -> DeviceSession:
+        with self._lock:
+            session = self._sessions.get(ip)
+            if session is None:
+                session = self._sessions[ip] = DeviceSession(ip)
+            return session
+
+    def _open(self, session: DeviceSession) -> None:
+        if session.failures:
+            socket.create_connection((session.ip, self.port), timeout=DEVICE_PROBE_TIMEOUT).close()
+        password = int(os.getenv('ZK_PASSWORD', '0')) if self.password is None else self.password
+        zk = ZK(session.ip, port=self.port, timeout=self.timeout, password=password,
+                force_udp=False, ommit_ping=True)
+        session.conn = zk.connect()
+        session.opened += 1
+        SESSIONS_OPENED.inc(device=session.ip)
+
+    def _drop(self, session: DeviceSession) -> None:
+        """
+        Close a session's connection (best effort); the next checkout reconnects.
+        """
+        conn, session.conn = session.conn, None
+        if conn is not None:
+            try:
+                conn.disconnect()
+            except Exception:
+                pass
+
+    def _healthy(self, session: DeviceSession) -> bool:
+        try:
+            session.conn.get_time()
+            return True
+        except Exception as e:
+            logger.info("Pooled session failed health check (%s); reconnecting", e, device=session.ip)
+            self._drop(session)
+            return False
+
+    @contextmanager
+    def session(self, ip: str) -> Iterator[Any]:
+        """
+        Check out the connected pyzk session for a device, holding its lock.
+        A command that raises inside the block drops the session (pyzk's reply
+        ids may be out of step after a timeout), so the next checkout reconnects.
+        """
+        session = self._session(ip)
+        with self._lock:
+            session.waiting += 1
+        try:
+            acquired = session.lock.acquire(timeout=DEVICE_LOCK_TIMEOUT)
+        finally:
+            with self._lock:
+                session.waiting -= 1
+        if not acquired:
+            SESSION_CHECKOUTS.inc(device=ip, result='busy')
+            raise DeviceBusyError(f"Device {ip} is busy; try again shortly")
+        try:
+            result = 'reused'
+            if session.conn is not None and time.monotonic() - session.last_used > DEVICE_HEALTH_CHECK_AFTER:
+                if not self._healthy(session):
+                    result = 'reconnected'
+            if session.conn is None:
+                if result == 'reused':
+                    result = 'opened'
+                try:
+                    self._open(session)
+                except Exception as e:
+                    session.failures += 1
+                    session.last_error = str(e)
+                    SESSION_CHECKOUTS.inc(device=ip, result='failed')
+                    raise
+            session.checkouts += 1
+            SESSION_CHECKOUTS.inc(device=ip, result=result)
+            try:
+                yield session.conn
+            except BaseException as e:
+                session.last_error = str(e)
+                self._drop(session)
+                raise
+            session.failures = 0
+            session.last_used = time.monotonic()
+            if self.idle_timeout <= 0:
+                self._drop(session)
+        finally:
+            session.lock.release()
+
+    def wanted(self, ip: str) -> bool:
+        """
+        True while another checkout is queued for the device, so a caller
+        holding its session for long should finish and let it go.
+        """
+        return self._session(ip).waiting > 0
+
+    def _keepalive_pass(self) -> None:
+        """
+        Ping idle sessions so the device does not time them out, and close
+        sessions idle past idle_timeout. Sessions in use are skipped.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        now = time.monotonic()
+        for session in sessions:
+            if session.conn is None or not session.lock.acquire(blocking=False):
+                continue
+            try:
+                if session.conn is None:
+                    continue
+                if now - session.last_used >= self.idle_timeout:
+                    logger.debug("Closing idle session", device=session.ip)
+                    self._drop(session)
+                elif now - session.last_used >= DEVICE_KEEPALIVE_INTERVAL:
+                    self._healthy(session)
+            finally:
+                session.lock.release()
+
+    def _keepalive_loop(self) -> None:
+        while not self._stop.wait(DEVICE_KEEPALIVE_INTERVAL):
+            try:
+                self._keepalive_pass()
+            except Exception as e:
+                logger.warning("Keepalive pass failed: %s", e)
+
+    def start(self) -> None:
+        """
+        Start the keepalive thread (idempotent).
+        """
+        if self._keepalive is None or not self._keepalive.is_alive():
+            self._stop.clear()
+            self._keepalive = threading.Thread(target=self._keepalive_loop, name='device-keepalive', daemon=True)
+            self._keepalive.start()
+
+    def close(self) -> None:
+        """
+        Stop the keepalive thread and disconnect every session (waits for
+        commands in progress).
+        """
+        self._stop.set()
+        if self._keepalive is not None:
+            self._keepalive.join(timeout=self.timeout)
+            self._keepalive = None
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            with session.lock:
+                self._drop(session)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-device session state keyed by device IP.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {session.ip: session.stats() for session in sessions}
+
+
+class DeviceRunner:
+    """
+    Runs blocking device calls (pool sessions, inventory lookups) from async
+    code. A call that misses its deadline raises asyncio.TimeoutError for the
+    caller, but keeps its device slot until pyzk returns, so a hung terminal
+    cannot pile up worker threads.
+    """
+    def __init__(self, max_workers: int = DEVICE_MAX_WORKERS, per_device: int = DEVICE_CONCURRENCY):
+        self.max_workers = max_workers
+        self.per_device = per_device
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+
+    async def run(self, ip: str, fn: Callable[..., Any], *args: Any, timeout: Optional[float],
+                  **kwargs: Any) -> Any:
+        """
+        Run fn(*args, **kwargs) for device ip within timeout seconds, queueing
+        included (None: no deadline). ip is only a queueing key; the daemon
+        also queues its cloud and archive jobs here under their own names.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='device')
+        limit = self._limits.get(ip)
+        if limit is None:
+            limit = self._limits[ip] = asyncio.Semaphore(self.per_device)
+        await asyncio.wait_for(limit.acquire(), timeout)
+
+        def finished(future: 'asyncio.Future[Any]') -> None:
+            limit.release()
+            # Retrieve the outcome of calls nobody waits for any more
+            if not future.cancelled():
+                future.exception()
+
+        try:
+            future = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            limit.release()
+            raise
+        future.add_done_callback(finished)
+        remaining = None if deadline is None else max(0.0, deadline - loop.time())
+        return await asyncio.wait_for(asyncio.shield(future), remaining)
+
+    def close(self, wait: bool = False) -> None:
+        """
+        Release the worker threads; with wait, block until calls still running
+        have returned.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._limits = {}
+
+
+# Process-wide pool shared by the enrollment API, harvester and user sync
+DEVICE_POOL = DevicePool()
@@ -1,61 +1,404 @@
 """
 Harvester module for Project BEACON Edge Gateway
 ------------------------------------------------
-- Connects to ZKTeco device and fetches attendance logs
+- Connects to ZKTeco devices and fetches attendance logs
+- Polls devices in parallel (bounded pool), each on its own schedule
+- Backs off exponentially from unreachable devices (circuit breaker)
+- Optional streaming mode: live capture per device, polling only to reconcile
+  (streamed punches are group-committed through an IngestBuffer)
 - Stores logs in local SQLite database (deduplicated)
-- Used as a thread in main.py
+- Polls and streams through a shared DevicePool when given one (one session
+  per device, shared with user sync and the enrollment API): live capture
+  pauses while another pool checkout waits for the device, then resumes
+- Reports per-device harvest duration, records and errors as metrics
+- Used as a thread in main.py, and as per-device jobs on daemon.py's event loop
 """
 
 import os
-from datetime import datetime
-from typing import List, Dict, Any
-from beacon_core.database import Database
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Dict, Any, Optional
+from beacon_core.database import Database, IngestResult, LogRecord
+from beacon_core.devices import DeviceBusyError, DevicePool
+from beacon_core.ingest import IngestBuffer
+from beacon_core.logger import get_logger
+from beacon_core.metrics import REGISTRY
 
 
 # Unified Harvester: supports single or multiple devices, debug output, and future extensibility
 from zk.base import ZK
 
+ZK_PORT = 4370
+ZK_TIMEOUT = 10
+
+# Upper bound on devices harvested at the same time
+HARVEST_MAX_WORKERS = int(os.getenv('HARVEST_MAX_WORKERS', '4'))
+# Retry delay after the first failure; doubles per consecutive failure up to the max
+HARVEST_BACKOFF_BASE = float(os.getenv('HARVEST_BACKOFF_BASE', '30'))
+HARVEST_BACKOFF_MAX = float(os.getenv('HARVEST_BACKOFF_MAX', '900'))
+# Cheap TCP reachability check used before reconnecting to a failing device
+DEVICE_PROBE_TIMEOUT = float(os.getenv('DEVICE_PROBE_TIMEOUT', '2'))
+
+# Streaming mode: keep a live-capture session open per device and store punches
+# as they happen; the full incremental harvest only runs to reconcile.
+HARVEST_STREAMING = os.getenv('HARVEST_STREAMING', '0').lower() in ('1', 'true', 'yes')
+HARVEST_RECONCILE_INTERVAL = float(os.getenv('HARVEST_RECONCILE_INTERVAL', '900'))
+# Live-capture socket timeout; bounds how quickly a stream notices stop/reconcile
+# and pool checkouts waiting for the device (keep it under DEVICE_LOCK_TIMEOUT)
+LIVE_CAPTURE_TICK = 10
+# Poll interval of a paused stream waiting for pool checkouts to finish
+STREAM_RESUME_POLL = 0.2
+
+logger = get_logger('Harvester')
+
+HARVEST_DURATION = REGISTRY.histogram('beacon_harvest_duration_seconds',
+                                      'Connect + read time per device harvest', ('device',))
+HARVEST_LOGS = REGISTRY.counter('beacon_harvest_logs_total', 'Logs read from devices by outcome',
+                                ('device', 'result'))
+HARVEST_LAST_LOGS = REGISTRY.gauge('beacon_harvest_last_logs', 'New logs read from a device in its last harvest',
+                                   ('device',))
+HARVEST_ERRORS = REGISTRY.counter('beacon_harvest_errors_total', 'Failed device harvests', ('device',))
+DEVICE_RECORDS = REGISTRY.gauge('beacon_device_records', 'Attendance records held in the device buffer',
+                                ('device',))
+STREAMED_LOGS = REGISTRY.counter('beacon_streamed_logs_total', 'Punches received by live capture', ('device',))
+
+
+@dataclass
+class DeviceState:
+    """Schedule, circuit-breaker state and timing stats for one device."""
+    ip: str
+    type: str
+    interval: float
+    next_due: float = 0.0
+    failures: int = 0
+    runs: int = 0
+    errors: int = 0
+    last_duration: float = 0.0
+    total_duration: float = 0.0
+    last_success: Optional[float] = None
+    last_error: Optional[str] = None
+    streaming: bool = False
+    streamed: int = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'type': self.type,
+            'interval_s': self.interval,
+            'runs': self.runs,
+            'errors': self.errors,
+            'consecutive_failures': self.failures,
+            'last_duration_s': round(self.last_duration, 3),
+            'avg_duration_s': round(self.total_duration / self.runs, 3) if self.runs else 0.0,
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+            'next_due_in_s': round(max(0.0, self.next_due - time.monotonic()), 1),
+            'streaming': self.streaming,
+            'streamed': self.streamed,
+        }
+
+
 class Harvester:
-    def __init__(self, db: Database, beacon_node_id: str, device_ip: str = None):
+    def __init__(self, db: Database, beacon_node_id: str, device_ip: str = None, harvest_interval: float = 60,
+                 on_new_logs: Optional[Callable[[int], None]] = None, pool: Optional[DevicePool] = None):
         self.db = db
+        # Polling sessions come from the pool when set (kept open between harvests)
+        self.pool = pool
         self.beacon_node_id = beacon_node_id
-        # Support both DEVICE_LIST and single device_ip for backward compatibility
+        # Called with the number of newly stored logs (e.g. Syncer.notify)
+        self.on_new_logs = on_new_logs
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        self._stream_threads: List[threading.Thread] = []
+        # Streamed punches arrive one by one; commit them in groups
+        self.ingest = IngestBuffer(db, on_flush=self._on_flush)
+        REGISTRY.gauge('beacon_ingest_buffered_logs', 'Streamed punches waiting for a group commit',
+                       fn=lambda: self.ingest.stats()['depth'])
+        # Support both DEVICE_LIST and single device_ip for backward compatibility.
+        # DEVICE_LIST entries are ip:type with an optional :interval_seconds override.
         device_list = os.getenv('DEVICE_LIST', '')
-        self.devices = []
+        self.devices: List[DeviceState] = []
         if device_list:
             for entry in device_list.split(','):
                 if ':' in entry:
-                    ip, dev_type = entry.split(':', 1)
-                    self.devices.append({'ip': ip.strip(), 'type': dev_type.strip()})
+                    ip, dev_type, *rest = [part.strip() for part in entry.split(':')]
+                    interval = float(rest[0]) if rest and rest[0] else harvest_interval
+                    self._add_device(ip, dev_type, interval)
         elif device_ip:
-            self.devices.append({'ip': device_ip, 'type': 'ZKTeco'})
+            self._add_device(device_ip, 'ZKTeco', harvest_interval)
 
-    def fetch_and_store_logs(self) -> None:
-        for dev in self.devices:
-            ip = dev['ip']
-            dev_type = dev['type']
-            print(f"[Harvester] Checking device {ip} ({dev_type})...")
-            if dev_type.lower() == 'zkteco':
+    def _add_device(self, ip: str, dev_type: str, interval: float) -> None:
+        if dev_type.lower() != 'zkteco':
+            logger.warning("Device type %s not supported yet; skipping", dev_type, device=ip)
+            return
+        self.devices.append(DeviceState(ip=ip, type=dev_type, interval=interval))
+
+    def _store(self, records: Iterable[LogRecord]) -> IngestResult:
+        """
+        Bulk-insert records and signal on_new_logs if any were new.
+        """
+        result = self.db.insert_logs_bulk(records)
+        if result.inserted and self.on_new_logs:
+            self.on_new_logs(result.inserted)
+        return result
+
+    def _on_flush(self, result: IngestResult) -> None:
+        if result.inserted and self.on_new_logs:
+            self.on_new_logs(result.inserted)
+
+    def _harvest_incremental(self, ip: str, conn: Any) -> None:
+        """
+        Store only the records added since the device's stored cursor.
+        - Skips the download entirely when the device record count is unchanged
+        - Slices the buffer by the previous record count when it only grew, and
+          the record before that position was harvested last time
+        - Falls back to the last stored timestamp when the buffer was cleared
+          (even if it has since regrown past the old count) or is full and
+          rolling over (the UNIQUE key absorbs any overlap)
+        """
+        cursor = self.db.get_device_cursor(ip)
+        last_count, last_ts = cursor if cursor else (0, None)
+        conn.read_sizes()
+        record_count = conn.records
+        DEVICE_RECORDS.set(record_count, device=ip)
+        buffer_full = bool(conn.rec_cap) and record_count >= conn.rec_cap
+        if cursor and record_count == last_count and not buffer_full:
+            logger.debug("No new logs (%d records)", record_count, device=ip)
+            HARVEST_LAST_LOGS.set(0, device=ip)
+            return
+
+        logs = conn.get_attendance()
+        # Formatted only when LOG_LEVEL=DEBUG
+        logger.debug("Raw logs: %s", logs, device=ip)
+        # The record just before the slice must be one harvested last time (no
+        # newer than last_ts); a newer one means the buffer was cleared and
+        # refilled past the old count in between
+        continuous = (cursor and last_count <= len(logs) and not buffer_full
+                      and (last_count == 0 or last_ts is None or logs[last_count - 1].timestamp <= last_ts))
+        if continuous:
+            new_logs = logs[last_count:]
+        elif last_ts is not None:
+            new_logs = [log for log in logs if log.timestamp >= last_ts]
+        else:
+            new_logs = logs
+
+        result = self._store(
+            (str(log.user_id), log.timestamp, log.punch, self.beacon_node_id)
+            for log in new_logs
+        )
+        if new_logs:
+            newest = max(log.timestamp for log in new_logs)
+            last_ts = max(newest, last_ts) if last_ts else newest
+        self.db.set_device_cursor(ip, len(logs), last_ts)
+        HARVEST_LOGS.inc(result.inserted, device=ip, result='new')
+        HARVEST_LOGS.inc(result.duplicates, device=ip, result='duplicate')
+        HARVEST_LAST_LOGS.set(len(new_logs), device=ip)
+        logger.info("%d of %d logs processed (%d new, %d duplicate)",
+                    len(new_logs), len(logs), result.inserted, result.duplicates, device=ip)
+
+    def _connect(self, dev: DeviceState) -> Any:
+        """
+        Open a pyzk session. A device with recent failures gets a short TCP probe
+        first, so while it stays down each attempt costs DEVICE_PROBE_TIMEOUT
+        rather than ZK_TIMEOUT.
+        """
+        if dev.failures:
+            socket.create_connection((dev.ip, ZK_PORT), timeout=DEVICE_PROBE_TIMEOUT).close()
+        zk_password = int(os.getenv('ZK_PASSWORD', '0'))
+        zk = ZK(dev.ip, port=ZK_PORT, timeout=ZK_TIMEOUT, password=zk_password, force_udp=False, ommit_ping=True)
+        return zk.connect()
+
+    def _record_failure(self, dev: DeviceState, error: Exception) -> float:
+        """
+        Open the circuit breaker for a device; returns the backoff in seconds.
+        """
+        dev.failures += 1
+        dev.errors += 1
+        dev.last_error = str(error)
+        HARVEST_ERRORS.inc(device=dev.ip)
+        backoff = max(dev.interval, min(HARVEST_BACKOFF_BASE * 2 ** (dev.failures - 1), HARVEST_BACKOFF_MAX))
+        dev.next_due = time.monotonic() + backoff
+        logger.warning("Error communicating with ZKTeco device: %s (failure %d, retry in %.0fs)",
+                       error, dev.failures, backoff, device=dev.ip)
+        return backoff
+
+    def _record_run(self, dev: DeviceState, started: float) -> None:
+        dev.runs += 1
+        dev.last_duration = time.monotonic() - started
+        dev.total_duration += dev.last_duration
+        HARVEST_DURATION.observe(dev.last_duration, device=dev.ip)
+
+    def _record_success(self, dev: DeviceState, started: float) -> None:
+        dev.failures = 0
+        dev.last_error = None
+        dev.last_success = time.time()
+        dev.next_due = started + dev.interval
+        self._record_run(dev, started)
+
+    def harvest_device(self, dev: DeviceState) -> None:
+        """
+        Harvest one device and update its schedule and stats.
+        """
+        logger.debug("Checking device (%s)", dev.type, device=dev.ip)
+        started = time.monotonic()
+        conn = None
+        try:
+            if self.pool is not None:
+                with self.pool.session(dev.ip) as pooled:
+                    self._harvest_incremental(dev.ip, pooled)
+            else:
+                conn = self._connect(dev)
+                self._harvest_incremental(dev.ip, conn)
+        except Exception as e:
+            self._record_failure(dev, e)
+            self._record_run(dev, started)
+        else:
+            self._record_success(dev, started)
+        finally:
+            if conn is not None:
                 try:
-                    zk_password = int(os.getenv('ZK_PASSWORD', '0'))
-                    zk = ZK(ip, port=4370, timeout=10, password=zk_password, force_udp=False, ommit_ping=True)
-                    conn = zk.connect()
-                    logs = conn.get_attendance()
-                    print(f"[Harvester][DEBUG] Raw logs from device {ip}: {logs}")
-                    for log in logs:
-                        self.db.insert_ignore_duplicates(
-                            user_id=str(log.user_id),
-                            timestamp=log.timestamp,
-                            punch_type=log.punch,
-                            beacon_node_id=self.beacon_node_id
-                        )
-                    print(f"[Harvester] {len(logs)} logs fetched from {ip}")
-                except Exception as e:
-                    print(f"[Harvester] Error communicating with ZKTeco device {ip}: {e}")
-                finally:
+                    conn.disconnect()
+                except Exception:
+                    pass
+
+    def _stream_device(self, dev: DeviceState) -> None:
+        """
+        Keep a live-capture session open to one device until stop_streaming().
+        With a pool, capture runs on the device's pooled session and pauses
+        whenever another checkout (enrollment API, user sync) is queued for it,
+        as terminals handle concurrent sessions poorly; it resumes once they
+        are done.
+        """
+        while not self._stop.is_set():
+            started = time.monotonic()
+            conn = None
+            try:
+                if self.pool is not None:
+                    # Queued commands go first; the lock alone would not hand over fairly
+                    while self.pool.wanted(dev.ip) and not self._stop.is_set():
+                        self._stop.wait(STREAM_RESUME_POLL)
+                    if self._stop.is_set():
+                        break
+                    with self.pool.session(dev.ip) as pooled:
+                        self._capture(dev, pooled, started)
+                else:
+                    conn = self._connect(dev)
+                    self._capture(dev, conn, started)
+            except DeviceBusyError:
+                # A long command (e.g. a fingerprint enrollment) holds the device; wait for it
+                continue
+            except Exception as e:
+                backoff = self._record_failure(dev, e)
+                self._record_run(dev, started)
+                self._stop.wait(backoff)
+            finally:
+                if conn is not None:
                     try:
                         conn.disconnect()
                     except Exception:
                         pass
-            else:
-                print(f"[Harvester] Device type {dev_type} not supported yet. Skipping {ip}.")
+
+    def _capture(self, dev: DeviceState, conn: Any, started: float) -> None:
+        """
+        Live capture on an open session. Every session starts with an
+        incremental harvest to pick up punches made while not capturing, and
+        repeats it every HARVEST_RECONCILE_INTERVAL on the same session.
+        Returns when stopping or when a pool checkout wants the device.
+        """
+        while not self._stop.is_set():
+            self._harvest_incremental(dev.ip, conn)
+            self._record_success(dev, started)
+            reconcile_at = time.monotonic() + HARVEST_RECONCILE_INTERVAL
+            logger.info("Streaming punches", device=dev.ip)
+            wanted = False
+            for att in conn.live_capture(new_timeout=LIVE_CAPTURE_TICK):
+                if att is not None:
+                    # Blocks while the ingest buffer is full (backpressure)
+                    self.ingest.put((str(att.user_id), att.timestamp, att.punch, self.beacon_node_id))
+                    dev.streamed += 1
+                    STREAMED_LOGS.inc(device=dev.ip)
+                wanted = self.pool is not None and self.pool.wanted(dev.ip)
+                if wanted or self._stop.is_set() or time.monotonic() >= reconcile_at:
+                    conn.end_live_capture = True
+            if wanted:
+                logger.debug("Pausing stream for a pool checkout", device=dev.ip)
+                return
+            started = time.monotonic()
+
+    def start_streaming(self) -> None:
+        """
+        Switch every device to live capture (one session thread per device).
+        fetch_and_store_logs() skips streamed devices from then on.
+        """
+        self._stop.clear()
+        for dev in self.devices:
+            dev.streaming = True
+            thread = threading.Thread(target=self._stream_device, args=(dev,),
+                                      name=f'stream-{dev.ip}', daemon=True)
+            thread.start()
+            self._stream_threads.append(thread)
+
+    def stop_streaming(self) -> None:
+        """
+        End all live-capture sessions and wait for them to disconnect.
+        """
+        self._stop.set()
+        for thread in self._stream_threads:
+            thread.join(timeout=LIVE_CAPTURE_TICK + ZK_TIMEOUT)
+        self._stream_threads = []
+        for dev in self.devices:
+            dev.streaming = False
+
+    def close(self) -> None:
+        """
+        Stop streaming, commit buffered punches and release harvest workers
+        (call on shutdown, before closing the database).
+        """
+        self.stop_streaming()
+        self.ingest.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def due_devices(self) -> List[DeviceState]:
+        """
+        Polled devices whose harvest is due; devices still backing off are
+        skipped until their retry time.
+        """
+        now = time.monotonic()
+        return [dev for dev in self.devices if not dev.streaming and dev.next_due <= now]
+
+    def fetch_and_store_logs(self) -> None:
+        """
+        Harvest every device that is due, in parallel, and wait for them to finish.
+        """
+        due = self.due_devices()
+        if not due:
+            return
+        if self._executor is None:
+            workers = max(1, min(HARVEST_MAX_WORKERS, len(self.devices)))
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='harvest')
+        wait([self._executor.submit(self.harvest_device, dev) for dev in due])
+
+    def seconds_until_next_due(self) -> float:
+        """
+        Time until the earliest device is due (used by the harvest loop to sleep).
+        """
+        polled = [dev for dev in self.devices if not dev.streaming]
+        if not polled:
+            return float('inf')
+        return max(0.0, min(dev.next_due for dev in polled) - time.monotonic())
+
+    def ingest_stats(self) -> Dict[str, Any]:
+        """
+        Group-commit buffer depth, group sizes and backpressure stats.
+        """
+        return self.ingest.stats()
+
+    def device_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-device schedule, backoff and timing stats keyed by device IP.
+        """
+        return {dev.ip: dev.stats() for dev in self.devices}
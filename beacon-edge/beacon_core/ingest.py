@@ -0,0 +1,189 @@
+"""
+Ingest module for Project BEACON Edge Gateway
+---------------------------------------------
+- Bounded in-memory buffer in front of SQLite for punches that arrive one at
+  a time (live capture), so shift-change bursts cost one commit per group
+- Group-commits every INGEST_FLUSH_MS or INGEST_FLUSH_RECORDS records
+- Backpressure: put() blocks while INGEST_CAPACITY records are waiting
+- flush() waits until everything put so far is committed; close() flushes
+  the remainder and stops the flusher (call on shutdown)
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from beacon_core.database import Database, IngestResult, LogRecord
+from beacon_core.logger import get_logger
+
+# Group-commit triggers: age of the oldest buffered record, or number of records
+INGEST_FLUSH_MS = float(os.getenv('INGEST_FLUSH_MS', '200'))
+INGEST_FLUSH_RECORDS = int(os.getenv('INGEST_FLUSH_RECORDS', '500'))
+# Records held before put() blocks the producer
+INGEST_CAPACITY = int(os.getenv('INGEST_CAPACITY', '10000'))
+
+logger = get_logger('Ingest')
+
+
+class IngestBuffer:
+    """
+    Group-commit buffer feeding Database.insert_logs_bulk from a flusher thread.
+    Records are committed in the order they were put; a failed commit is
+    retried after the flush interval (the records stay buffered).
+    """
+    def __init__(self, db: Database, flush_interval: float = INGEST_FLUSH_MS / 1000,
+                 flush_records: int = INGEST_FLUSH_RECORDS, capacity: int = INGEST_CAPACITY,
+                 on_flush: Optional[Callable[[IngestResult], None]] = None):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.flush_records = max(1, flush_records)
+        self.capacity = max(self.flush_records, capacity)
+        # Called from the flusher thread after each commit
+        self.on_flush = on_flush
+        self._records: List[LogRecord] = []
+        self._oldest_at: Optional[float] = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._flush_waiters = 0
+        # Records put / committed (or given up) so far, for flush()
+        self._put_seq = 0
+        self._done_seq = 0
+        self.flushes = 0
+        self.flushed_records = 0
+        self.max_depth = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+        self.commit_seconds = 0.0
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ingest-flush', daemon=True)
+            self._thread.start()
+
+    def put(self, record: LogRecord, timeout: Optional[float] = None) -> bool:
+        """
+        Buffer one record, blocking while the buffer is full.
+        Returns False if timeout expired first; raises RuntimeError once closed.
+        """
+        return self.put_many([record], timeout) == 1
+
+    def put_many(self, records: Iterable[LogRecord], timeout: Optional[float] = None) -> int:
+        """
+        Buffer records in order, blocking whenever the buffer is full.
+        Returns the number buffered (fewer than given only if timeout expired).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        count = 0
+        with self._cond:
+            self._start()
+            for record in records:
+                if len(self._records) >= self.capacity:
+                    blocked_at = time.monotonic()
+                    self.blocked_puts += 1
+                    while len(self._records) >= self.capacity and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    self.blocked_seconds += time.monotonic() - blocked_at
+                    if len(self._records) >= self.capacity and not self._closed:
+                        return count
+                if self._closed:
+                    raise RuntimeError('ingest buffer is closed')
+                if not self._records:
+                    # Starts the flush-interval clock in the flusher
+                    self._oldest_at = time.monotonic()
+                    self._cond.notify_all()
+                self._records.append(record)
+                self._put_seq += 1
+                count += 1
+                self.max_depth = max(self.max_depth, len(self._records))
+                if len(self._records) == self.flush_records:
+                    self._cond.notify_all()
+        return count
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Commit everything put so far without waiting for the flush interval.
+        Returns False if timeout expired first.
+        """
+        with self._cond:
+            target = self._put_seq
+            if self._done_seq >= target:
+                return True
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._done_seq >= target, timeout)
+            finally:
+                self._flush_waiters -= 1
+
+    def _due(self) -> bool:
+        return bool(self._records) and (
+            self._closed or self._flush_waiters > 0 or len(self._records) >= self.flush_records
+            or time.monotonic() - self._oldest_at >= self.flush_interval
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed and not self._records:
+                        return
+                    wait = None if not self._records else \
+                        max(0.0, self._oldest_at + self.flush_interval - time.monotonic())
+                    self._cond.wait(wait)
+                batch = self._records[:self.flush_records]
+                del self._records[:len(batch)]
+                self._oldest_at = time.monotonic() if self._records else None
+                closing = self._closed
+                # Room for blocked producers
+                self._cond.notify_all()
+            started = time.monotonic()
+            try:
+                result = self.db.insert_logs_bulk(batch, chunk_size=len(batch))
+            except Exception as e:
+                with self._cond:
+                    if closing:
+                        # Still on the devices; the next reconcile harvest picks them up
+                        logger.warning("Dropping %d buffered logs on shutdown: %s", len(batch), e)
+                        self._done_seq += len(batch)
+                        self._cond.notify_all()
+                        continue
+                    logger.warning("Commit of %d logs failed, retrying: %s", len(batch), e)
+                    self._records[:0] = batch
+                    self._oldest_at = time.monotonic()
+                    self._cond.wait(self.flush_interval)
+                continue
+            with self._cond:
+                self.flushes += 1
+                self.flushed_records += len(batch)
+                self.commit_seconds += time.monotonic() - started
+                self._done_seq += len(batch)
+                self._cond.notify_all()
+            if self.on_flush:
+                self.on_flush(result)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Commit whatever is buffered and stop the flusher (call on shutdown).
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'depth': len(self._records),
+                'max_depth': self.max_depth,
+                'flushes': self.flushes,
+                'flushed_records': self.flushed_records,
+                'avg_group': round(self.flushed_records / self.flushes, 1) if self.flushes else 0.0,
+                'avg_commit_s': round(self.commit_seconds / self.flushes, 4) if self.flushes else 0.0,
+                'blocked_puts': self.blocked_puts,
+                'blocked_s': round(self.blocked_seconds, 3),
+            }
@@ -0,0 +1,296 @@
+"""
+Inventory module for Project BEACON Edge Gateway
+------------------------------------------------
+- Per-device cache of users and fingerprint template presence (uid -> finger
+  ids), so the dashboard does not download every template on each request
+- Device counters (read_sizes: one small reply) stand in for full downloads:
+  device summaries use them directly, and every user lookup re-reads them to
+  validate the cache, so enrollments made on the device menu are noticed
+- Cached users/templates expire after INVENTORY_TTL seconds; set_user and
+  delete_user write through the cache and keep it warm
+- Single templates are read with get_user_template instead of get_templates
+- apply_batch writes many users (optionally with a fingerprint template) in one
+  session with the device disabled and reports per-user results with template
+  status from the cache
+- Uses the DevicePool for sessions; never call it while holding a session
+- INVENTORY is the process-wide cache over DEVICE_POOL
+"""
+
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from beacon_core.devices import DEVICE_POOL, DevicePool
+from beacon_core.logger import get_logger
+from beacon_core.metrics import REGISTRY
+
+from zk.exception import ZKErrorResponse
+from zk.finger import Finger
+from zk.user import User
+
+# Cached users/templates are reloaded after this many seconds even if the counters match
+INVENTORY_TTL = float(os.getenv('INVENTORY_TTL', '300'))
+# Device summaries (GET /devices) re-read the counters at most this often
+INVENTORY_COUNTS_TTL = float(os.getenv('INVENTORY_COUNTS_TTL', '10'))
+
+logger = get_logger('Inventory')
+
+INVENTORY_LOOKUPS = REGISTRY.counter('beacon_inventory_lookups_total',
+                                     'Device inventory lookups by outcome (hit, load)', ('device', 'result'))
+
+
+@dataclass
+class DeviceCounts:
+    """Record counters and capacities reported by read_sizes."""
+    users: int = 0
+    fingers: int = 0
+    records: int = 0
+    users_cap: int = 0
+    fingers_cap: int = 0
+    rec_cap: int = 0
+
+    @classmethod
+    def read(cls, conn: Any) -> 'DeviceCounts':
+        conn.read_sizes()
+        return cls(conn.users, conn.fingers, conn.records, conn.users_cap, conn.fingers_cap, conn.rec_cap)
+
+
+@dataclass
+class InventoryEntry:
+    ip: str
+    counts: Optional[DeviceCounts] = None
+    counts_at: float = float('-inf')
+    device_name: Optional[str] = None
+    firmware: Optional[str] = None
+    info_at: float = float('-inf')
+    users: Optional[Dict[int, User]] = None
+    # uid -> finger ids with a stored template
+    templates: Dict[int, List[int]] = field(default_factory=dict)
+    users_at: float = float('-inf')
+    # (users, fingers) counters the cached lists correspond to
+    loaded_counts: Optional[Tuple[int, int]] = None
+
+
+class DeviceInventory:
+    def __init__(self, pool: DevicePool, ttl: float = INVENTORY_TTL, counts_ttl: float = INVENTORY_COUNTS_TTL):
+        self.pool = pool
+        self.ttl = ttl
+        self.counts_ttl = counts_ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, InventoryEntry] = {}
+
+    def _entry(self, ip: str) -> InventoryEntry:
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                entry = self._entries[ip] = InventoryEntry(ip)
+            return entry
+
+    def _read_counts(self, entry: InventoryEntry, conn: Any) -> DeviceCounts:
+        entry.counts = DeviceCounts.read(conn)
+        entry.counts_at = time.monotonic()
+        return entry.counts
+
+    def _load(self, entry: InventoryEntry, conn: Any, counts: DeviceCounts) -> None:
+        """
+        Download users and (if the device holds any) templates; the only
+        place this module calls get_templates.
+        """
+        users = {user.uid: user for user in conn.get_users()}
+        templates: Dict[int, List[int]] = {}
+        if counts.fingers:
+            for tmpl in conn.get_templates():
+                templates.setdefault(tmpl.uid, []).append(tmpl.fid)
+        entry.users = users
+        entry.templates = templates
+        entry.users_at = time.monotonic()
+        entry.loaded_counts = (counts.users, counts.fingers)
+        logger.debug("Loaded %d users, %d with templates", len(users), len(templates), device=entry.ip)
+
+    def info(self, ip: str) -> Dict[str, Any]:
+        """
+        Device name, firmware and record counters/capacities, without
+        downloading users or templates.
+        """
+        entry = self._entry(ip)
+        now = time.monotonic()
+        if now - entry.counts_at >= self.counts_ttl or now - entry.info_at >= self.ttl:
+            with self.pool.session(ip) as conn:
+                self._read_counts(entry, conn)
+                if now - entry.info_at >= self.ttl:
+                    # Not every firmware answers these; a refusal is not an outage
+                    try:
+                        entry.device_name = conn.get_device_name()
+                        entry.firmware = conn.get_firmware_version()
+                    except ZKErrorResponse:
+                        pass
+                    entry.info_at = time.monotonic()
+        return {'device_name': entry.device_name, 'firmware': entry.firmware, **asdict(entry.counts)}
+
+    def users(self, ip: str) -> Tuple[List[User], Dict[int, List[int]]]:
+        """
+        Users on a device and the finger ids with templates per uid. Costs one
+        read_sizes round-trip while the cache is valid.
+        """
+        entry = self._entry(ip)
+        with self.pool.session(ip) as conn:
+            self._validate(entry, conn)
+            return list(entry.users.values()), {uid: list(fids) for uid, fids in entry.templates.items()}
+
+    def _validate(self, entry: InventoryEntry, conn: Any) -> None:
+        """
+        Make the cached users/templates current: re-read the counters and
+        reload if they changed or the cache expired.
+        """
+        counts = self._read_counts(entry, conn)
+        if (entry.users is None or time.monotonic() - entry.users_at >= self.ttl
+                or entry.loaded_counts != (counts.users, counts.fingers)):
+            INVENTORY_LOOKUPS.inc(device=entry.ip, result='load')
+            self._load(entry, conn, counts)
+        else:
+            INVENTORY_LOOKUPS.inc(device=entry.ip, result='hit')
+
+    def template(self, ip: str, uid: int) -> Optional[bytes]:
+        """
+        The first stored fingerprint template of a user, or None.
+        """
+        _, templates = self.users(ip)
+        for fid in templates.get(uid, []):
+            with self.pool.session(ip) as conn:
+                finger = conn.get_user_template(uid=uid, temp_id=fid)
+            if finger:
+                return finger.template
+        return None
+
+    def _write_through(self, entry: InventoryEntry, conn: Any, users: int, fingers: int) -> None:
+        """
+        Re-read the counters after a write. The cache stays warm if they moved
+        exactly as the write predicts; otherwise something else changed the
+        device meanwhile and the cache is dropped.
+        """
+        counts = self._read_counts(entry, conn)
+        if entry.loaded_counts == (counts.users - users, counts.fingers - fingers):
+            entry.loaded_counts = (counts.users, counts.fingers)
+        else:
+            self.invalidate(entry.ip)
+
+    def set_user(self, ip: str, uid: int, name: str, privilege: int = 0, password: str = '',
+                 group_id: str = '', user_id: str = '', card: int = 0) -> None:
+        """
+        Create or update a user on the device and in the cache.
+        """
+        entry = self._entry(ip)
+        with self.pool.session(ip) as conn:
+            conn.set_user(uid=uid, name=name, privilege=privilege, password=password,
+                          group_id=group_id, user_id=user_id, card=card)
+            if entry.users is None:
+                return
+            added = uid not in entry.users
+            entry.users[uid] = User(uid, name, privilege, password, group_id, user_id, card)
+            self._write_through(entry, conn, users=1 if added else 0, fingers=0)
+
+    def delete_user(self, ip: str, uid: int) -> None:
+        """
+        Delete a user (and their templates) from the device and the cache.
+        """
+        entry = self._entry(ip)
+        with self.pool.session(ip) as conn:
+            conn.delete_user(uid=uid)
+            if entry.users is None:
+                return
+            removed = entry.users.pop(uid, None) is not None
+            fingers = len(entry.templates.pop(uid, []))
+            self._write_through(entry, conn, users=-1 if removed else 0, fingers=-fingers)
+
+    def apply_batch(self, ip: str, upserts: Sequence[Dict[str, Any]] = (),
+                    deletes: Sequence[int] = ()) -> List[Dict[str, Any]]:
+        """
+        Create/update and delete many users in one session, with the device
+        disabled (keypad and sensor locked) during the writes. upserts take
+        set_user's keyword arguments, plus an optional 'template' (raw bytes,
+        stored as finger 0 with the user in one upload). Returns one result per user, in order,
+        with its template status from the cache: one user/template download
+        per batch at most, none while the cache is valid.
+
+        A refused command fails only its user. A lost connection stops the
+        batch; the remaining users are reported as not attempted.
+        """
+        entry = self._entry(ip)
+        results: List[Dict[str, Any]] = []
+        current: Optional[Dict[str, Any]] = None
+        try:
+            with self.pool.session(ip) as conn:
+                self._validate(entry, conn)
+                users, templates = entry.users, entry.templates
+                added = removed = fingers_added = fingers_removed = 0
+                conn.disable_device()
+                try:
+                    for fields in upserts:
+                        fields = dict(fields)
+                        uid = fields['uid']
+                        template = fields.pop('template', None)
+                        current = {'uid': uid, 'action': 'updated' if uid in users else 'created'}
+                        user = User(uid, fields.get('name', ''), fields.get('privilege', 0),
+                                    fields.get('password', ''), fields.get('group_id', ''),
+                                    fields.get('user_id', ''), fields.get('card', 0))
+                        try:
+                            if template:
+                                conn.save_user_template(user, [Finger(uid, 0, 1, template)])
+                            else:
+                                conn.set_user(**fields)
+                        except ZKErrorResponse as e:
+                            current.update(success=False, error=str(e))
+                        else:
+                            added += uid not in users
+                            users[uid] = user
+                            if template and 0 not in templates.get(uid, []):
+                                templates.setdefault(uid, []).append(0)
+                                fingers_added += 1
+                            current.update(success=True, has_template=uid in templates)
+                        results.append(current)
+                        current = None
+                    for uid in deletes:
+                        current = {'uid': uid, 'action': 'deleted'}
+                        if uid not in users:
+                            current.update(action='not_found', success=True, has_template=False)
+                        else:
+                            try:
+                                conn.delete_user(uid=uid)
+                            except ZKErrorResponse as e:
+                                current.update(success=False, error=str(e))
+                            else:
+                                del users[uid]
+                                removed += 1
+                                fingers_removed += len(templates.pop(uid, []))
+                                current.update(success=True, has_template=False)
+                        results.append(current)
+                        current = None
+                finally:
+                    conn.enable_device()
+                self._write_through(entry, conn, users=added - removed, fingers=fingers_added - fingers_removed)
+        except Exception as e:
+            # The session broke mid-batch; what the device holds now is unknown
+            self.invalidate(ip)
+            if not results and current is None:
+                raise
+            total = len(upserts) + len(deletes)
+            logger.warning("Batch stopped after %d of %d users: %s", len(results), total, e, device=ip)
+            if current is not None:
+                current.update(success=False, error=str(e))
+                results.append(current)
+            pending = [fields['uid'] for fields in upserts] + list(deletes)
+            results.extend({'uid': uid, 'action': 'not_attempted', 'success': False, 'error': str(e)}
+                           for uid in pending[len(results):])
+        return results
+
+    def invalidate(self, ip: str) -> None:
+        """
+        Forget everything cached about a device.
+        """
+        with self._lock:
+            self._entries.pop(ip, None)
+
+
+# Process-wide inventory over DEVICE_POOL (enrollment API and user sync)
+INVENTORY = DeviceInventory(DEVICE_POOL)
@@ -0,0 +1,181 @@
+"""
+Link module for Project BEACON Edge Gateway
+-------------------------------------------
+- Tracks uplink quality from real uploads (throughput, RTT, failure rate)
+- Used by the syncer to size SEA batches to the current satellite window
+- Probes the cloud endpoint in-process (TCP connect) for online checks
+"""
+
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from urllib.parse import urlparse
+from beacon_core.logger import get_logger
+
+# Online check: cached for LINK_PROBE_TTL seconds; background probe every LINK_PROBE_INTERVAL
+LINK_PROBE_TTL = float(os.getenv('LINK_PROBE_TTL', '20'))
+LINK_PROBE_TIMEOUT = float(os.getenv('LINK_PROBE_TIMEOUT', '5'))
+LINK_PROBE_INTERVAL = float(os.getenv('LINK_PROBE_INTERVAL', '30'))
+LINK_HISTORY = int(os.getenv('LINK_HISTORY', '120'))
+
+logger = get_logger('Link')
+
+
+class LinkEstimator:
+    """
+    Rolling estimate of uplink quality.
+    - throughput: EWMA of bytes/s, with the estimated RTT taken out of each
+      upload's duration so small batches do not understate the link
+    - rtt: smallest request duration in the recent window (a small upload is
+      dominated by round trips), or an explicit probe via record_rtt()
+    - failure_rate: EWMA of failed uploads (1.0 = every recent upload failed)
+    """
+    def __init__(self, alpha: float = 0.3, window: int = 20):
+        self.alpha = alpha
+        self.throughput: Optional[float] = None
+        self.failure_rate = 0.0
+        self._durations: Deque[float] = deque(maxlen=window)
+        self._probe_rtt: Optional[float] = None
+        self.uploads = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rtt(self) -> Optional[float]:
+        candidates = list(self._durations)
+        if self._probe_rtt is not None:
+            candidates.append(self._probe_rtt)
+        return min(candidates) if candidates else None
+
+    def _ewma(self, current: Optional[float], sample: float) -> float:
+        return sample if current is None else current + self.alpha * (sample - current)
+
+    def record(self, sent_bytes: int, duration: float, ok: bool) -> None:
+        """
+        Record one upload attempt.
+        """
+        with self._lock:
+            self.uploads += 1
+            self.failure_rate = self._ewma(self.failure_rate, 0.0 if ok else 1.0)
+            if not ok:
+                self.failures += 1
+                return
+            rtt = self.rtt
+            self._durations.append(duration)
+            transfer = duration - rtt if rtt is not None and duration - rtt > 0.2 * duration else duration
+            self.throughput = self._ewma(self.throughput, sent_bytes / max(transfer, 1e-3))
+
+    def record_rtt(self, rtt: float) -> None:
+        """
+        Record a round-trip time measured by a probe rather than an upload.
+        """
+        with self._lock:
+            self._probe_rtt = rtt if self._probe_rtt is None else self._ewma(self._probe_rtt, rtt)
+
+    def snapshot(self) -> Dict[str, Any]:
+        rtt = self.rtt
+        return {
+            'throughput_bps': round(self.throughput, 1) if self.throughput is not None else None,
+            'rtt_s': round(rtt, 3) if rtt is not None else None,
+            'failure_rate': round(self.failure_rate, 3),
+            'uploads': self.uploads,
+            'failures': self.failures,
+        }
+
+
+class LinkMonitor:
+    """
+    Cheap reachability probe of the cloud API, replacing the ping subprocess.
+    - Probes with a TCP connect to the API host/port (no process spawn, tests
+      the endpoint we actually upload to)
+    - Caches the result for ttl seconds; keeps a rolling RTT/loss history
+    - Optional background thread that calls on_link_up when the link returns,
+      so SEA uploads start as soon as a satellite window opens
+    """
+    def __init__(self, url: str, ttl: float = LINK_PROBE_TTL, timeout: float = LINK_PROBE_TIMEOUT,
+                 history: int = LINK_HISTORY, estimator: Optional[LinkEstimator] = None,
+                 on_link_up: Optional[Callable[[], None]] = None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or ''
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.estimator = estimator
+        self.on_link_up = on_link_up
+        # (monotonic time, reachable, rtt seconds or None)
+        self.history: Deque[Tuple[float, bool, Optional[float]]] = deque(maxlen=history)
+        self.online: Optional[bool] = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def probe(self) -> bool:
+        """
+        Probe now, record the sample, and fire on_link_up on a down->up transition.
+        """
+        started = time.monotonic()
+        try:
+            socket.create_connection((self.host, self.port), timeout=self.timeout).close()
+            ok, rtt = True, time.monotonic() - started
+        except OSError:
+            ok, rtt = False, None
+        with self._lock:
+            was_online = self.online
+            self.online = ok
+            self._checked_at = time.monotonic()
+            self.history.append((self._checked_at, ok, rtt))
+        if rtt is not None and self.estimator is not None:
+            self.estimator.record_rtt(rtt)
+        if ok and was_online is False:
+            logger.info("%s:%d reachable again (rtt %.0fms)", self.host, self.port, rtt * 1000)
+            if self.on_link_up:
+                self.on_link_up()
+        elif not ok and was_online is not False:
+            logger.warning("%s:%d unreachable", self.host, self.port)
+        return ok
+
+    def is_online(self) -> bool:
+        """
+        Cached reachability; probes only when the last result is older than ttl.
+        """
+        if time.monotonic() - self._checked_at < self.ttl and self.online is not None:
+            return self.online
+        return self.probe()
+
+    def start(self, interval: float = LINK_PROBE_INTERVAL) -> None:
+        """
+        Probe every interval seconds in a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop() -> None:
+            while not self._stop.is_set():
+                self.probe()
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name='link-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self.history)
+        rtts = [rtt for _, ok, rtt in samples if ok and rtt is not None]
+        return {
+            'online': self.online,
+            'samples': len(samples),
+            'loss_rate': round(sum(1 for _, ok, _ in samples if not ok) / len(samples), 3) if samples else None,
+            'rtt_last_s': round(rtts[-1], 3) if rtts else None,
+            'rtt_avg_s': round(sum(rtts) / len(rtts), 3) if rtts else None,
+        }
@@ -0,0 +1,177 @@
+"""
+Logger module for Project BEACON Edge Gateway
+---------------------------------------------
+- Structured logging on top of the stdlib logging module, one logger per
+  component tag: get_logger('Harvester') writes "[Harvester] ..." lines
+- Levels from LOG_LEVEL (default INFO); DEBUG dumps are opt-in
+- Lazy formatting: messages take %-style args and are only formatted when the
+  level is enabled, so debug dumps cost nothing when off
+- Keyword fields name what a line is about (device=ip, status=200) and are
+  appended as key=value, or emitted as JSON objects with LOG_FORMAT=json;
+  changing numbers belong in the %-args
+- Per-message rate limiting: at most LOG_RATE_LIMIT lines per message template
+  and field set every LOG_RATE_WINDOW seconds (so one flapping device cannot
+  hide another); the next line reports how many were dropped
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'text' ([Tag] message key=value) or 'json' (one object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Lines per message template and field set per window (0 disables rate limiting)
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', '20'))
+LOG_RATE_WINDOW = float(os.getenv('LOG_RATE_WINDOW', '60'))
+
+ROOT = 'beacon'
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops lines past the per-template limit within a window and records how
+    many were dropped on the next line that gets through.
+    """
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        # (logger, level, template, fields) -> [window start, lines in window, suppressed]
+        self._seen: Dict[Tuple[Any, ...], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0:
+            return True
+        fields = getattr(record, 'fields', None) or {}
+        key = (record.name, record.levelno, str(record.msg), tuple(map(str, fields.values())))
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                if len(self._seen) > 10_000:
+                    self._seen.clear()
+                self._seen[key] = [now, 1, 0]
+            elif state[1] < self.limit:
+                state[1] += 1
+                suppressed = 0
+            else:
+                state[2] += 1
+                return False
+        record.suppressed = suppressed
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """
+    "[Tag] message key=value"; levels other than INFO are tagged, e.g. "[Tag][WARNING]".
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        tag = record.name.split('.', 1)[-1]
+        level = '' if record.levelno == logging.INFO else f'[{record.levelname}]'
+        line = f'[{tag}]{level} {record.getMessage()}'
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        if getattr(record, 'suppressed', 0):
+            line += f' ({record.suppressed} similar lines suppressed)'
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'component': record.name.split('.', 1)[-1],
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """
+    Writes to whatever sys.stdout is at emit time (so redirect_stdout works).
+    """
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class Logger(logging.LoggerAdapter):
+    """
+    Logger taking keyword fields: logger.info('%d logs from %s', n, ip, device=ip).
+    """
+    def __init__(self, logger: logging.Logger):
+        super().__init__(logger, {})
+
+    def log(self, level: int, msg: str, *args: Any, exc_info: Any = None, **fields: Any) -> None:
+        if self.logger.isEnabledFor(level):
+            self.logger._log(level, msg, args, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, msg: str, *args: Any, **fields: Any) -> None:
+        self.log(logging.DEBUG, msg, *args, **fields)
+
+    def info(self, msg: str, *args: Any, **fields: Any) -> None:
+        self.log(logging.INFO, msg, *args, **fields)
+
+    def warning(self, msg: str, *args: Any, **fields: Any) -> None:
+        self.log(logging.WARNING, msg, *args, **fields)
+
+    def error(self, msg: str, *args: Any, **fields: Any) -> None:
+        self.log(logging.ERROR, msg, *args, **fields)
+
+    def exception(self, msg: str, *args: Any, **fields: Any) -> None:
+        self.log(logging.ERROR, msg, *args, exc_info=True, **fields)
+
+    def debug_enabled(self) -> bool:
+        """
+        For debug output whose arguments are expensive to build.
+        """
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure(level: Optional[str] = None, fmt: Optional[str] = None,
+              rate_limit: Optional[int] = None) -> None:
+    """
+    (Re)configure the beacon loggers; get_logger() applies the env defaults.
+    """
+    global _configured
+    with _configure_lock:
+        root = logging.getLogger(ROOT)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        handler = _StdoutHandler()
+        handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == 'json' else TextFormatter())
+        handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT if rate_limit is None else rate_limit))
+        root.addHandler(handler)
+        root.setLevel(getattr(logging, (level or LOG_LEVEL).upper(), logging.INFO))
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(tag: str) -> Logger:
+    if not _configured:
+        configure()
+    return Logger(logging.getLogger(f'{ROOT}.{tag}'))
@@ -0,0 +1,304 @@
+"""
+Metrics module for Project BEACON Edge Gateway
+----------------------------------------------
+- Lightweight in-process registry: counters, gauges and histograms with labels
+  (no client library; one lock per metric, fixed histogram buckets)
+- Callback gauges sample state other modules already keep, at most every
+  METRICS_SAMPLE_TTL seconds
+- Registry.render() produces the Prometheus text format; MetricsServer serves
+  it on METRICS_PORT (0 disables)
+- Registry.summary() is the compact snapshot the syncer attaches to each
+  upload (X-Beacon-Metrics header), so the cloud sees link and terminal health
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from beacon_core.logger import get_logger
+
+# Prometheus scrape endpoint (GET /metrics); 0 disables
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+METRICS_BIND = os.getenv('METRICS_BIND', '0.0.0.0')
+# Callback gauges (e.g. unsynced backlog, a COUNT query) are re-sampled at most this often
+METRICS_SAMPLE_TTL = float(os.getenv('METRICS_SAMPLE_TTL', '5'))
+
+# Seconds; covers LAN device reads through slow satellite uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Seconds; SQLite write-lock waits are normally far below a millisecond
+LOCK_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+logger = get_logger('Metrics')
+
+LabelValues = Tuple[str, ...]
+Sample = Union[float, Dict[LabelValues, float]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _compact(value: float) -> Union[int, float]:
+    return int(value) if value == int(value) else round(value, 3)
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, (
+        v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values))]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """
+    Base class: a named family of values keyed by label values.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _items(self) -> List[Tuple[LabelValues, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for key, value in sorted(self._items()):
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+    def snapshot(self) -> Any:
+        """
+        Compact value: a number, or {"label|label": number} for labelled metrics.
+        """
+        items = self._items()
+        if not self.labels:
+            return _compact(items[0][1]) if items else 0
+        return {'|'.join(key): _compact(value) for key, value in sorted(items)}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """
+    Gauge set directly, or sampled from fn (a number, or a dict keyed by
+    label-value tuples) when rendered.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 fn: Optional[Callable[[], Sample]] = None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self._sampled_at = float('-inf')
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _items(self) -> List[Tuple[LabelValues, float]]:
+        if self.fn is not None and time.monotonic() - self._sampled_at >= METRICS_SAMPLE_TTL:
+            try:
+                sample = self.fn()
+            except Exception:
+                sample = None
+            if sample is not None:
+                values = sample if isinstance(sample, dict) else {(): float(sample)}
+                with self._lock:
+                    self._values = dict(values)
+                    self._sampled_at = time.monotonic()
+        return super()._items()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _series_items(self) -> List[Tuple[LabelValues, List[float]]]:
+        with self._lock:
+            return [(key, list(series)) for key, series in self._series.items()]
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for key, series in sorted(self._series_items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, key, le)} {_format_value(cumulative)}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {_format_value(cumulative)}'
+
+    def snapshot(self) -> Any:
+        """
+        Compact value: [count, sum] (or per label set).
+        """
+        items = {'|'.join(key): [int(sum(series[:-1])), _compact(series[-1])]
+                 for key, series in sorted(self._series_items())}
+        if not self.labels:
+            return items.get('', [0, 0])
+        return items
+
+
+class Registry:
+    """
+    Named metrics; asking twice for the same name returns the same metric, so
+    modules can declare their metrics at import time.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls: type, name: str, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'metric {name} already registered as {metric.kind}')
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (),
+              fn: Optional[Callable[[], Sample]] = None) -> Gauge:
+        """
+        Get or create a gauge; passing fn (re)binds its sampling callback.
+        """
+        gauge = self._get(Gauge, name, help, labels)
+        if fn is not None:
+            gauge.fn = fn
+            gauge._sampled_at = float('-inf')
+        return gauge
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+    def summary(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        Compact snapshot of the named metrics, keyed without the beacon_ prefix;
+        labelled metrics with no values yet are left out.
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in names if name in self._metrics]
+        snapshots = ((metric.name.replace('beacon_', '', 1), metric.snapshot()) for metric in metrics)
+        return {name: value for name, value in snapshots if value != {}}
+
+    def summary_json(self, names: Iterable[str]) -> str:
+        return json.dumps(self.summary(names), separators=(',', ':'))
+
+
+# Process-wide registry used by the harvester, syncer and database
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """
+    Serves REGISTRY as Prometheus text on GET /metrics from one daemon thread
+    (scrapes are rare; a single thread also keeps callback gauges on one
+    SQLite connection).
+    """
+    def __init__(self, registry: Registry = REGISTRY, port: int = METRICS_PORT, host: str = METRICS_BIND):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server: Optional[HTTPServer] = None
+
+    def start(self) -> bool:
+        """
+        Start serving; returns False if disabled (port 0) or the port is taken.
+        """
+        if not self.port:
+            return False
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            self._server = HTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.warning("Could not listen on %s:%d: %s", self.host, self.port, e)
+            return False
+        threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True).start()
+        logger.info("Serving Prometheus metrics on http://%s:%d/metrics", self.host, self.port)
+        return True
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
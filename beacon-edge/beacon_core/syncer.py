@@ -2,186 +2,607 @@
 Syncer module for Project BEACON Edge Gateway
 ---------------------------------------------
 - Handles uploading logs to the cloud API
-- Supports LAND (real-time) and SEA (batch, GZIP) modes
-- Deduplicates and marks logs as synced after upload
+- Supports LAND (real-time) and SEA (batch, GZIP or compact binary) modes
+- Drains LAND/OFFICE backlogs as bounded, in-order batches (flat memory)
+- Sizes SEA batches from measured link throughput, within a daily byte budget
+- Reuses one keep-alive HTTP session; retries 5xx/timeouts with backoff and
+  keeps several batches in flight while draining a backlog
+- Marks exactly the logs the cloud acknowledged as synced; quarantines rejects
+- Holds logs the cloud deferred (unknown user) and requeues them every
+  SYNC_DEFERRED_RETRY_INTERVAL, or as soon as user sync pulls new users
+- Journals each batch and sends its id as an Idempotency-Key, so batches left
+  in flight by a crash are settled from the cloud's stored ack, not resent
+- Wakes on harvester notifications instead of polling the DB on a fixed timer
+- SEA: online checks and link-up wake-ups come from an in-process LinkMonitor
+- Records request latency, bytes and HTTP status metrics, and attaches a
+  compact metrics summary to the first upload of each sync (X-Beacon-Metrics)
 """
 
 import os
 import json
 import gzip
+import random
 import time
 import requests
-import subprocess
-from typing import List, Dict, Any, Optional
-from beacon_core.database import Database
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from beacon_core import wire
+from beacon_core.database import Database, SYNC_BATCH_ROWS
+from beacon_core.link import LinkEstimator, LinkMonitor
+from beacon_core.logger import get_logger
+from beacon_core.metrics import REGISTRY
+
+# Batches uploaded concurrently while draining a LAND/OFFICE backlog
+SYNC_MAX_IN_FLIGHT = int(os.getenv('SYNC_MAX_IN_FLIGHT', '2'))
+# Retries after a 5xx, timeout or connection error; backoff is capped exponential with full jitter
+SYNC_RETRIES = int(os.getenv('SYNC_RETRIES', '3'))
+SYNC_BACKOFF_BASE = float(os.getenv('SYNC_BACKOFF_BASE', '0.5'))
+SYNC_BACKOFF_MAX = float(os.getenv('SYNC_BACKOFF_MAX', '30'))
+# LAND/OFFICE JSON bodies at least this large are sent GZIP-compressed
+SYNC_GZIP_MIN_BYTES = int(os.getenv('SYNC_GZIP_MIN_BYTES', '1024'))
+# SEA upload encoding: 'binary' (beacon_core.wire, falls back to JSON if the cloud rejects it) or 'json'
+SYNC_WIRE_FORMAT = os.getenv('SYNC_WIRE_FORMAT', 'binary').lower()
+
+# Adaptive SEA batching: size each batch to upload in about SEA_TARGET_UPLOAD_SECONDS,
+# and keep draining (up to SEA_MAX_BATCHES_PER_SYNC) while the link stays healthy
+SEA_TARGET_UPLOAD_SECONDS = float(os.getenv('SEA_TARGET_UPLOAD_SECONDS', '10'))
+SEA_INITIAL_BATCH = int(os.getenv('SEA_INITIAL_BATCH', '500'))
+SEA_MIN_BATCH = int(os.getenv('SEA_MIN_BATCH', '50'))
+SEA_MAX_BATCH = int(os.getenv('SEA_MAX_BATCH', '5000'))
+SEA_MAX_BATCHES_PER_SYNC = int(os.getenv('SEA_MAX_BATCHES_PER_SYNC', '20'))
+SEA_DRAIN_MAX_FAILURE_RATE = float(os.getenv('SEA_DRAIN_MAX_FAILURE_RATE', '0.2'))
+SEA_UPLOAD_TIMEOUT = float(os.getenv('SEA_UPLOAD_TIMEOUT', '30'))
+# Upload bytes allowed per UTC day in SEA mode (0 = unlimited); retries count too
+SEA_DAILY_BYTE_BUDGET = int(os.getenv('SEA_DAILY_BYTE_BUDGET', '0'))
+
+# Deferred logs (users the cloud does not know yet) are requeued this often
+SYNC_DEFERRED_RETRY_INTERVAL = float(os.getenv('SYNC_DEFERRED_RETRY_INTERVAL', '3600'))
+
+# Acknowledged sync journal entries are kept this long (pruned hourly)
+SYNC_JOURNAL_RETENTION_HOURS = float(os.getenv('SYNC_JOURNAL_RETENTION_HOURS', '24'))
+
+# Attach REGISTRY.summary(SYNC_SUMMARY_METRICS) to the first upload of each sync pass
+# (a few hundred bytes of header; once per pass keeps it small next to SEA batches)
+SYNC_SEND_METRICS = os.getenv('SYNC_SEND_METRICS', '1').lower() in ('1', 'true', 'yes')
+SYNC_SUMMARY_METRICS = (
+    'beacon_unsynced_logs',
+    'beacon_quarantined_logs',
+    'beacon_deferred_logs',
+    'beacon_harvest_duration_seconds',
+    'beacon_harvest_errors_total',
+    'beacon_device_records',
+    'beacon_sync_requests_total',
+    'beacon_sync_request_duration_seconds',
+    'beacon_sync_bytes_total',
+    'beacon_db_lock_wait_seconds',
+)
+
+logger = get_logger('Syncer')
+
+SYNC_REQUESTS = REGISTRY.counter('beacon_sync_requests_total',
+                                 'Upload attempts by HTTP status (error = no response)', ('status',))
+SYNC_LATENCY = REGISTRY.histogram('beacon_sync_request_duration_seconds', 'Upload attempt round-trip time')
+SYNC_BYTES = REGISTRY.counter('beacon_sync_bytes_total', 'Upload body bytes sent (retries included)')
+SYNC_LOGS = REGISTRY.counter('beacon_sync_logs_total', 'Uploaded logs by cloud ack outcome', ('result',))
 
 class Syncer:
     """
     Handles syncing unsynced logs to the cloud API.
-    - LAND: Real-time, JSON upload
-    - SEA: Batch, GZIP-compressed upload (500 logs max)
+    - LAND: Real-time, JSON upload (GZIP above SYNC_GZIP_MIN_BYTES)
+    - SEA: Batch, compact binary or GZIP-compressed JSON upload, sized to the link
     """
-    def __init__(self, db: Database, beacon_node_id: str, api_url: str, mode: str, token: Optional[str] = None):
+    def __init__(self, db: Database, beacon_node_id: str, api_url: str, mode: str, token: Optional[str] = None,
+                 coalesce_window: float = 0, min_interval: float = 0):
         """
         :param db: Database instance
         :param beacon_node_id: Unique node ID
         :param api_url: Cloud API endpoint
         :param mode: 'LAND' or 'SEA'
         :param token: Bearer token for authentication
+        :param coalesce_window: Seconds to wait after a notification for more logs to arrive
+        :param min_interval: Minimum seconds between upload attempts
         """
         self.db = db
         self.beacon_node_id = beacon_node_id
         self.api_url = api_url
         self.mode = mode.upper()
         self.token = token or ""
+        self.coalesce_window = coalesce_window
+        self.min_interval = min_interval
+        self._wake = threading.Event()
+        # Start pending so any backlog left from a previous run is flushed
+        self._pending = True
+        self._failed = False
+        self._stopped = False
+        self._last_attempt = float('-inf')
+        self.max_in_flight = max(1, SYNC_MAX_IN_FLIGHT)
+        self.retries = SYNC_RETRIES
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight))
+        if self.token:
+            self.session.headers['Authorization'] = f'Bearer {self.token}'
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Cleared for the rest of the process if the cloud does not understand the binary format
+        self.binary_wire = SYNC_WIRE_FORMAT == 'binary'
+        # Every POST attempt's body size, including retries (for budgets/metrics)
+        self.bytes_sent = 0
+        self.link = LinkEstimator()
+        self.link_monitor = LinkMonitor(api_url, estimator=self.link, on_link_up=self.on_link_up)
+        self._link_up = threading.Event()
+        self.sea_batch_rows = SEA_INITIAL_BATCH
+        self._sea_bytes_per_log: Optional[float] = None
+        self._journal_pruned_at = float('-inf')
+        self._deferred_requeued_at = time.monotonic()
+        # Set per sync pass; the next upload carries the metrics summary
+        self._metrics_due = False
+        # Guards bytes_sent and _metrics_due (uploads run on SYNC_MAX_IN_FLIGHT threads)
+        self._accounting_lock = threading.Lock()
+
+    def stop(self) -> None:
+        """
+        Release wait_for_work(): it returns False from now on (shutdown).
+        """
+        self._stopped = True
+        self._wake.set()
+        self._link_up.set()
+
+    def close(self) -> None:
+        """
+        Release pooled connections and upload workers (call on shutdown).
+        """
+        self.stop()
+        self.link_monitor.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    def notify(self, count: int = 0) -> None:
+        """
+        Signal that new logs were stored (called by the harvester after inserts).
+        """
+        self._pending = True
+        self._wake.set()
+
+    def requeue_deferred(self) -> int:
+        """
+        Put deferred logs back in the queue and wake the syncer (called on a
+        timer from wait_for_work(), and by user sync when the roster changes).
+        """
+        self._deferred_requeued_at = time.monotonic()
+        count = self.db.requeue_deferred()
+        if count:
+            logger.info("%d deferred logs requeued", count)
+            self.notify()
+        return count
+
+    def on_link_up(self) -> None:
+        """
+        Signal that the uplink just came back (called by the LinkMonitor).
+        Wakes the syncer immediately, bypassing the coalescing window and
+        min_interval, so a satellite window is used as soon as it opens.
+        """
+        self._link_up.set()
+        self.notify()
+
+    def wait_for_work(self, tick: float) -> bool:
+        """
+        Block until an upload is worth attempting.
+        - Returns once notify() reports new logs, after the coalescing window and
+          no sooner than min_interval after the previous attempt
+        - Returns straight away while a backlog remains from the last attempt
+        - After a failed attempt, or with nothing pending, waits up to tick; an
+          idle tick returns False so no DB query is made
+        - A link-up signal skips (or cuts short) the coalescing and min_interval waits
+        - Returns False once stop() is called
+        - Requeues deferred logs when SYNC_DEFERRED_RETRY_INTERVAL has passed
+        """
+        if self._stopped:
+            return False
+        if time.monotonic() - self._deferred_requeued_at >= SYNC_DEFERRED_RETRY_INTERVAL:
+            self.requeue_deferred()
+        notified = False
+        if self._failed or not self._pending:
+            notified = self._wake.wait(tick)
+            if not notified and not self._pending:
+                return False
+        if notified and self.coalesce_window:
+            self._link_up.wait(self.coalesce_window)
+        remaining = self._last_attempt + self.min_interval - time.monotonic()
+        if remaining > 0:
+            self._link_up.wait(remaining)
+        if self._stopped:
+            return False
+        # Cleared before sync() reads the DB, so a notify() during the sync is not lost
+        self._link_up.clear()
+        self._wake.clear()
+        self._pending = False
+        return True
+
+    def _finish(self, ok: bool, backlog: bool = False) -> None:
+        """
+        Record the outcome of an upload attempt for wait_for_work().
+        """
+        self._failed = not ok
+        if not ok or backlog:
+            self._pending = True
 
     def _is_online(self) -> bool:
         """
-        Checks internet connectivity (for SEA mode) by pinging 8.8.8.8.
+        Checks connectivity to the cloud API (for SEA mode) via the LinkMonitor:
+        a cached TCP connect to the API host, re-probed after LINK_PROBE_TTL.
         Returns True if online, False otherwise.
         """
-        try:
-            result = subprocess.run(['ping', '-n', '1', '8.8.8.8'], stdout=subprocess.DEVNULL)
-            return result.returncode == 0
-        except Exception:
-            return False
+        return self.link_monitor.is_online()
+
+    @staticmethod
+    def _log_to_dict(log: tuple) -> Dict[str, Any]:
+        """
+        Wire representation of one beacon_logs row.
+        """
+        return {
+            'id': log[0],
+            'user_id': log[1],
+            'timestamp': log[2],
+            'punch_type': log[3],
+            'beacon_node_id': log[5]
+        }
 
-    def _prepare_payload(self, logs: list) -> bytes:
+    @staticmethod
+    def _prepare_payload(logs: list) -> bytes:
         """
         GZIP-compresses the JSON payload for satellite cost savings (SEA mode).
         """
-        payload = json.dumps([
-            {
-                'id': log[0],
-                'user_id': log[1],
-                'timestamp': log[2],
-                'punch_type': log[3],
-                'beacon_node_id': log[5]
-            } for log in logs
-        ])
+        payload = json.dumps([Syncer._log_to_dict(log) for log in logs])
         return gzip.compress(payload.encode('utf-8'))
 
-    def sync(self) -> None:
+    def _encode_sea(self, logs: list) -> Tuple[bytes, Dict[str, str]]:
         """
-        Syncs unsynced logs to the cloud API.
-        - LAND: Sends all unsynced logs as JSON
-        - SEA: Sends up to 500 logs as GZIP-compressed JSON if online
-        - OFFICE: Same as LAND, but logs as OFFICE and uses LAN intervals
-        Marks logs as synced on success. Handles errors gracefully.
+        SEA body: the compact binary format when enabled, else GZIP JSON.
         """
-        if self.mode in ('LAND', 'OFFICE'):
-            logs = self.db.fetch_unsynced_logs()
-            if not logs:
-                return
+        if self.binary_wire:
             try:
-                resp = requests.post(
-                    self.api_url,
-                    json=[{
-                        'id': log[0],
-                        'user_id': log[1],
-                        'timestamp': log[2],
-                        'punch_type': log[3],
-                        'beacon_node_id': log[5]
-                    } for log in logs],
-                    headers={"Authorization": f"Bearer {self.token}"} if self.token else {},
-                    timeout=10
-                )
-                if resp.status_code == 200:
-                    self.db.mark_logs_synced([log[0] for log in logs])
-                print(f"[Syncer] {self.mode} sync: {len(logs)} logs sent, status {resp.status_code}")
-            except Exception as e:
-                print(f"[Syncer] {self.mode} sync error: {e}")
-        elif self.mode == 'SEA':
-            if not self._is_online():
-                # No connectivity, skip sync to save satellite bandwidth
-                return
-            logs = self.db.fetch_unsynced_logs(limit=500)
-            if not logs:
-                return
-            compressed = self._prepare_payload(logs)
-            headers = {
-                'Content-Encoding': 'gzip',
-                'Content-Type': 'application/json',
-            }
-            if self.token:
-                headers['Authorization'] = f'Bearer {self.token}'
+                return wire.encode_logs(logs), {'Content-Type': wire.CONTENT_TYPE}
+            except wire.WireFormatError as e:
+                logger.warning("Batch not encodable as binary (%s); sending JSON", e)
+        return self._prepare_payload(logs), {'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
+
+    def _encode_json(self, logs: list) -> Tuple[bytes, Dict[str, str]]:
+        """
+        JSON body for a LAND/OFFICE batch, GZIP-compressed once it is worth it.
+        """
+        body = json.dumps([self._log_to_dict(log) for log in logs]).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if len(body) >= SYNC_GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def _post(self, body: bytes, headers: Dict[str, str], timeout: float,
+              retries: Optional[int] = None) -> requests.Response:
+        """
+        POST on the pooled session, retrying 5xx responses, timeouts and
+        connection errors up to retries (default self.retries) times. Safe to
+        repeat: the cloud deduplicates on (user_id, timestamp).
+        Returns the last response; raises the last error if every attempt failed.
+        """
+        retries = self.retries if retries is None else retries
+        with self._accounting_lock:
+            send_metrics, self._metrics_due = self._metrics_due, False
+        if send_metrics:
+            headers = dict(headers, **{'X-Beacon-Metrics': REGISTRY.summary_json(SYNC_SUMMARY_METRICS)})
+        attempt = 0
+        while True:
+            started = time.perf_counter()
             try:
-                resp = requests.post(
-                    self.api_url,
-                    data=compressed,
-                    headers=headers,
-                    timeout=30
-                )
-                if resp.status_code == 200:
-                    self.db.mark_logs_synced([log[0] for log in logs])
-            except Exception as e:
-                print(f"[Syncer] SEA sync error: {e}")
-import os
-import json
-import gzip
-import time
-import requests
-import subprocess
-from typing import List, Dict, Any
-from beacon_core.database import Database
+                with self._accounting_lock:
+                    self.bytes_sent += len(body)
+                SYNC_BYTES.inc(len(body))
+                resp = self.session.post(self.api_url, data=body, headers=headers, timeout=timeout)
+                SYNC_REQUESTS.inc(status=resp.status_code)
+                SYNC_LATENCY.observe(time.perf_counter() - started)
+                if resp.status_code < 500 or attempt >= retries:
+                    return resp
+                reason = f"status {resp.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                SYNC_REQUESTS.inc(status='error')
+                SYNC_LATENCY.observe(time.perf_counter() - started)
+                if attempt >= retries:
+                    raise
+                reason = str(e)
+            delay = random.uniform(0, min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+            logger.warning("Upload attempt %d failed (%s); retrying in %.1fs", attempt, reason, delay)
+            time.sleep(delay)
 
-class Syncer:
-    def __init__(self, db: Database, beacon_node_id: str, api_url: str, mode: str):
-        self.db = db
-        self.beacon_node_id = beacon_node_id
-        self.api_url = api_url
-        self.mode = mode.upper()
+    def _acknowledge(self, batch_id: Optional[str], ids: List[int], resp: requests.Response) -> bool:
+        """
+        Settle a batch the cloud answered with 200 (or a stored ack on recovery).
+        The cloud lists per record which ids it accepted, already had
+        (duplicates), rejected or deferred; the first two are marked synced,
+        rejects are quarantined, deferred logs are held for requeue_deferred(),
+        and anything unlisted stays queued. A response without
+        per-record acks (older cloud) covers the whole batch. The journal entry
+        is acknowledged in the same transaction.
+        Returns True if every log in the batch was settled.
+        """
+        try:
+            ack = resp.json()
+        except ValueError:
+            ack = None
+        if not isinstance(ack, dict) or 'accepted' not in ack:
+            self.db.settle_batch(batch_id, ids)
+            SYNC_LOGS.inc(len(ids), result='accepted')
+            return True
+        batch_ids = set(ids)
+        synced = {i for i in (ack.get('accepted') or []) + (ack.get('duplicates') or []) if i in batch_ids}
+        rejected = {
+            r['id']: str(r.get('reason') or 'rejected')
+            for r in ack.get('rejected') or []
+            if isinstance(r, dict) and r.get('id') in batch_ids and r['id'] not in synced
+        }
+        deferred = {i for i in ack.get('deferred') or [] if i in batch_ids and i not in synced and i not in rejected}
+        self.db.settle_batch(batch_id, synced, rejected.items(), deferred)
+        duplicates = len(synced.intersection(ack.get('duplicates') or []))
+        SYNC_LOGS.inc(len(synced) - duplicates, result='accepted')
+        SYNC_LOGS.inc(duplicates, result='duplicate')
+        SYNC_LOGS.inc(len(rejected), result='rejected')
+        SYNC_LOGS.inc(len(deferred), result='deferred')
+        if rejected:
+            logger.warning("%d logs rejected by the cloud and quarantined", len(rejected))
+        if deferred:
+            logger.info("%d logs deferred by the cloud (users not enrolled there yet)", len(deferred))
+        unsettled = len(batch_ids) - len(synced) - len(rejected) - len(deferred)
+        if unsettled:
+            logger.warning("%d logs not acknowledged; left queued for the next sync", unsettled)
+        return not unsettled
 
-    def _is_online(self) -> bool:
-        # Passive connectivity check for SEA mode
+    def _send_batch(self, batch_id: str, logs: list) -> requests.Response:
+        """
+        Upload one LAND/OFFICE batch (runs on an upload worker).
+        Returns the HTTP response.
+        """
+        body, headers = self._encode_json(logs)
+        headers['Idempotency-Key'] = batch_id
+        self.db.journal_mark_sent(batch_id)
+        return self._post(body, headers, timeout=10)
+
+    def _complete_batch(self, batch_id: str, logs: list, future: Future) -> bool:
+        """
+        Wait for an in-flight batch and settle the logs the cloud acknowledged.
+        A 4xx means the cloud did not take the batch, so its journal entry is
+        dropped; after a timeout or 5xx it stays 'sent' for recover().
+        """
         try:
-            result = subprocess.run(['ping', '-n', '1', '8.8.8.8'], stdout=subprocess.DEVNULL)
-            return result.returncode == 0
-        except Exception:
+            resp = future.result()
+        except Exception as e:
+            logger.error("%s sync error: %s", self.mode, e)
             return False
+        logger.info("%s sync: %d logs sent", self.mode, len(logs), status=resp.status_code)
+        if resp.status_code != 200:
+            if resp.status_code < 500:
+                self.db.journal_discard(batch_id)
+            return False
+        return self._acknowledge(batch_id, [log[0] for log in logs], resp)
 
-    def _prepare_payload(self, logs: List[Any]) -> bytes:
-        # GZIP compress JSON payload for satellite cost savings
-        payload = json.dumps([
-            {
-                'id': log[0],
-                'user_id': log[1],
-                'timestamp': log[2],
-                'punch_type': log[3],
-                'beacon_node_id': log[5]
-            } for log in logs
-        ])
-        return gzip.compress(payload.encode('utf-8'))
+    def _drain_backlog(self) -> bool:
+        """
+        Upload the unsynced backlog batch by batch with up to max_in_flight
+        uploads outstanding. Batches are disjoint (keyset pages), so each is
+        marked synced as it completes; the first failure stops new submissions.
+        Returns True if the whole backlog was accepted.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='upload')
+        ok = True
+        in_flight: deque = deque()
+        for batch in self.db.iter_unsynced_batches():
+            batch_id = self.db.journal_prepare([log[0] for log in batch])
+            in_flight.append((batch_id, batch, self._executor.submit(self._send_batch, batch_id, batch)))
+            if len(in_flight) >= self.max_in_flight and not self._complete_batch(*in_flight.popleft()):
+                ok = False
+                break
+        while in_flight:
+            ok = self._complete_batch(*in_flight.popleft()) and ok
+        return ok
 
-    def sync(self) -> None:
-        if self.mode == 'LAND':
-            logs = self.db.fetch_unsynced_logs()
+    def _post_sea(self, logs: list, body: bytes, headers: Dict[str, str],
+                  batch_id: Optional[str] = None) -> Tuple[requests.Response, int]:
+        """
+        Upload one encoded SEA batch, negotiating down to GZIP JSON if the cloud
+        rejects the binary format. No blind retries: a failed batch is retried
+        smaller on the next pass instead. Returns (response, body bytes).
+        """
+        if batch_id:
+            headers = dict(headers, **{'Idempotency-Key': batch_id})
+        resp = self._post(body, headers, timeout=SEA_UPLOAD_TIMEOUT, retries=0)
+        if headers['Content-Type'] == wire.CONTENT_TYPE and self._rejects_wire(resp):
+            # Cloud does not take the binary format: negotiate down to GZIP JSON
+            logger.warning("Cloud rejected %s; using JSON", wire.CONTENT_TYPE, status=resp.status_code)
+            self.binary_wire = False
+            body, headers = self._encode_sea(logs)
+            if batch_id:
+                headers['Idempotency-Key'] = batch_id
+            resp = self._post(body, headers, timeout=SEA_UPLOAD_TIMEOUT, retries=0)
+        return resp, len(body)
+
+    @staticmethod
+    def _rejects_wire(resp: requests.Response) -> bool:
+        """
+        True if the cloud refused the binary format itself: 415, or a 400 whose
+        error names the content type. Any other 400 is about the batch and goes
+        through the normal rejection path, leaving binary mode on.
+        """
+        if resp.status_code == 415:
+            return True
+        return resp.status_code == 400 and wire.CONTENT_TYPE in (resp.text or '')
+
+    def _adapt_sea_batch(self, ok: bool) -> None:
+        """
+        Size the next SEA batch: after a success, enough rows to upload in about
+        SEA_TARGET_UPLOAD_SECONDS at the measured throughput (at most doubling
+        per step); after a failure, half the previous size.
+        """
+        if not ok:
+            self.sea_batch_rows = max(SEA_MIN_BATCH, self.sea_batch_rows // 2)
+            return
+        if self.link.throughput is None or not self._sea_bytes_per_log:
+            return
+        window = max(1.0, SEA_TARGET_UPLOAD_SECONDS - (self.link.rtt or 0.0))
+        target = int(self.link.throughput * window / self._sea_bytes_per_log)
+        self.sea_batch_rows = max(SEA_MIN_BATCH, min(SEA_MAX_BATCH, target, self.sea_batch_rows * 2))
+
+    def _sea_budget_remaining(self) -> Optional[int]:
+        if not SEA_DAILY_BYTE_BUDGET:
+            return None
+        today = datetime.now(timezone.utc).date().isoformat()
+        return SEA_DAILY_BYTE_BUDGET - self.db.get_sync_bytes(today)
+
+    def _drain_sea(self) -> Tuple[bool, bool]:
+        """
+        Upload SEA batches back to back while the link is good.
+        Stops when the backlog is empty, an upload fails, the failure rate
+        climbs past SEA_DRAIN_MAX_FAILURE_RATE, the daily byte budget would be
+        exceeded, or SEA_MAX_BATCHES_PER_SYNC batches were sent.
+        Returns (ok, backlog_remaining).
+        """
+        for _ in range(SEA_MAX_BATCHES_PER_SYNC):
+            rows = self.sea_batch_rows
+            logs = self.db.fetch_unsynced_logs(limit=rows)
             if not logs:
-                return
+                return True, False
+            body, headers = self._encode_sea(logs)
+            remaining = self._sea_budget_remaining()
+            while remaining is not None and len(body) > remaining:
+                # Compression is not linear in rows, so shrink until the batch fits
+                fit = int(len(logs) * remaining / len(body) * 0.9)
+                if fit < min(SEA_MIN_BATCH, len(logs)):
+                    logger.info("SEA daily byte budget reached (%d bytes); deferring upload", SEA_DAILY_BYTE_BUDGET)
+                    return False, True
+                logs = logs[:fit]
+                body, headers = self._encode_sea(logs)
+
+            ids = [log[0] for log in logs]
+            batch_id = self.db.journal_prepare(ids)
+            sent_before = self.bytes_sent
+            started = time.monotonic()
+            resp: Optional[requests.Response] = None
+            try:
+                self.db.journal_mark_sent(batch_id)
+                resp, size = self._post_sea(logs, body, headers, batch_id)
+                ok = resp.status_code == 200
+                logger.info("SEA sync: %d logs sent (%d bytes)", len(logs), size, status=resp.status_code)
+            except Exception as e:
+                ok, size = False, self.bytes_sent - sent_before
+                logger.error("SEA sync error: %s", e)
+            duration = time.monotonic() - started
+            self.db.add_sync_bytes(datetime.now(timezone.utc).date().isoformat(), self.bytes_sent - sent_before)
+            self.link.record(size, duration, ok)
+            if resp is not None and resp.status_code != 200 and resp.status_code < 500:
+                # Definite rejection: the cloud did not take the batch
+                self.db.journal_discard(batch_id)
+            settled = ok and self._acknowledge(batch_id, ids, resp)
+            if ok:
+                per_log = size / len(logs)
+                self._sea_bytes_per_log = per_log if self._sea_bytes_per_log is None \
+                    else 0.7 * self._sea_bytes_per_log + 0.3 * per_log
+            self._adapt_sea_batch(ok)
+            if not settled:
+                return False, True
+            if len(logs) < rows:
+                return True, False
+            if self.link.failure_rate > SEA_DRAIN_MAX_FAILURE_RATE:
+                return True, True
+        return True, True
+
+    def recover(self) -> bool:
+        """
+        Settle batches left in flight by a crash or an ambiguous failure
+        (timeout, 5xx) before anything new is sent. 'prepared' batches never
+        left the edge and are dropped. 'sent' batches are looked up on the
+        cloud by batch id: a stored ack is applied without resending; an
+        unknown batch (404, or 405 from a cloud without lookups) is dropped
+        and its logs go out again in the normal way.
+        Returns False if the cloud could not be asked (try again later).
+        """
+        for batch_id, state, ids in self.db.journal_pending():
+            if state == 'prepared':
+                self.db.journal_discard(batch_id)
+                continue
             try:
-                resp = requests.post(self.api_url, json=[{
-                    'id': log[0],
-                    'user_id': log[1],
-                    'timestamp': log[2],
-                    'punch_type': log[3],
-                    'beacon_node_id': log[5]
-                } for log in logs], timeout=10)
-                if resp.status_code == 200:
-                    self.db.mark_logs_synced([log[0] for log in logs])
-            except Exception:
-                pass
+                resp = self.session.get(self.api_url, params={'batch': batch_id}, timeout=10)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning("Could not look up in-flight batch: %s", e, batch=batch_id)
+                return False
+            if resp.status_code == 200:
+                self._acknowledge(batch_id, ids, resp)
+                logger.info("Recovered in-flight batch (%d logs) from the cloud's ack", len(ids), batch=batch_id)
+            elif resp.status_code in (404, 405):
+                self.db.journal_discard(batch_id)
+            else:
+                logger.warning("Lookup of in-flight batch failed", batch=batch_id, status=resp.status_code)
+                return False
+        if time.monotonic() - self._journal_pruned_at >= 3600:
+            self.db.journal_prune(datetime.now() - timedelta(hours=SYNC_JOURNAL_RETENTION_HOURS))
+            self._journal_pruned_at = time.monotonic()
+        return True
+
+    def reupload(self, logs: Iterable[tuple]) -> int:
+        """
+        Upload rows that are not in the sync queue (e.g. archived months) in
+        batches of SYNC_BATCH_ROWS, using the mode's encoding. Nothing is marked
+        in the DB; the cloud deduplicates rows it already has.
+        Returns the number of rows accepted (stops at the first failed batch).
+        """
+        sent = 0
+        it = iter(logs)
+        while True:
+            batch = list(islice(it, SYNC_BATCH_ROWS))
+            if not batch:
+                return sent
+            try:
+                if self.mode == 'SEA':
+                    body, headers = self._encode_sea(batch)
+                    status = self._post_sea(batch, body, headers)[0].status_code
+                else:
+                    body, headers = self._encode_json(batch)
+                    status = self._post(body, headers, timeout=10).status_code
+            except Exception as e:
+                logger.error("Re-upload error: %s", e)
+                return sent
+            if status != 200:
+                logger.error("Re-upload rejected", status=status)
+                return sent
+            sent += len(batch)
+
+    def sync(self) -> None:
+        """
+        Syncs unsynced logs to the cloud API.
+        - LAND: Sends all unsynced logs as JSON, in bounded batches, stopping
+          at the first failed batch (earlier batches stay marked synced)
+        - SEA: If online, sends batches sized to the measured link (binary or
+          GZIP JSON), several in a row while the link holds up
+        - OFFICE: Same as LAND, but logs as OFFICE and uses LAN intervals
+        Batches left in flight by an earlier run are settled first (recover).
+        Marks acknowledged logs as synced, quarantines rejected ones. Handles errors gracefully.
+        """
+        self._last_attempt = time.monotonic()
+        self._metrics_due = SYNC_SEND_METRICS
+        if self.mode in ('LAND', 'OFFICE'):
+            self._finish(self.recover() and self._drain_backlog())
         elif self.mode == 'SEA':
             if not self._is_online():
                 # No connectivity, skip sync to save satellite bandwidth
+                self._finish(False)
                 return
-            logs = self.db.fetch_unsynced_logs(limit=500)
-            if not logs:
+            if not self.recover():
+                self._finish(False)
                 return
-            compressed = self._prepare_payload(logs)
-            headers = {'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
-            try:
-                resp = requests.post(self.api_url, data=compressed, headers=headers, timeout=30)
-                if resp.status_code == 200:
-                    self.db.mark_logs_synced([log[0] for log in logs])
-            except Exception:
-                pass
+            ok, backlog = self._drain_sea()
+            self._finish(ok, backlog)
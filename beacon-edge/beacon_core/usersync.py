@@ -0,0 +1,214 @@
+"""
+User sync module for Project BEACON Edge Gateway
+------------------------------------------------
+- Mirrors the cloud's enrolled users and fingerprint templates onto every
+  terminal the harvester reads (DEVICE_LIST, else DEVICE_IP)
+- Pulls incrementally from /api/edge/sync-users: each request carries the stored
+  cursor (updatedSince) and ETag (If-None-Match), so an unchanged roster costs
+  one 304 and a change costs only the changed users; removals come from the id
+  manifest in each response
+- The roster is kept in SQLite (cloud_users), so restarts and new terminals
+  need no re-download
+- Pushes only the differences to each terminal: users missing there, users
+  whose name or template changed since they were pushed (digests in
+  device_users) and users removed from the cloud, in apply_batch chunks
+- Users added on the terminal menu (never pushed by user sync) are left alone
+- A roster change calls on_roster_change (main.py: requeue punches the cloud
+  deferred because their user was not enrolled there yet)
+- Used by main.py
+"""
+
+import base64
+import hashlib
+import os
+import requests
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urljoin
+from beacon_core.database import Database
+from beacon_core.inventory import DeviceInventory
+from beacon_core.logger import get_logger
+from beacon_core.metrics import REGISTRY
+
+from zk import const
+
+# Roster endpoint; defaults to /api/edge/sync-users on the CLOUD_API_URL host
+USER_SYNC_URL = os.getenv('USER_SYNC_URL') or \
+    urljoin(os.getenv('CLOUD_API_URL', 'https://api.example.com/beacon/sync'), '/api/edge/sync-users')
+# Seconds between roster pulls (0, the default, disables user sync); it creates and
+# deletes users on terminals, so it is opt-in (needs a cloud that checks BEACON_TOKEN)
+USER_SYNC_INTERVAL = float(os.getenv('USER_SYNC_INTERVAL', '0'))
+USER_SYNC_TIMEOUT = float(os.getenv('USER_SYNC_TIMEOUT', '60'))
+# Users written per apply_batch call (the terminal is disabled while a chunk is written)
+USER_SYNC_BATCH_USERS = int(os.getenv('USER_SYNC_BATCH_USERS', '100'))
+
+# sync_state keys
+CURSOR_KEY = 'users_cursor'
+ETAG_KEY = 'users_etag'
+
+logger = get_logger('UserSync')
+
+USER_SYNC_REQUESTS = REGISTRY.counter('beacon_user_sync_requests_total',
+                                      'Roster pulls by HTTP status (error = no response)', ('status',))
+USER_SYNC_BYTES = REGISTRY.counter('beacon_user_sync_bytes_total', 'Roster response body bytes received')
+USER_SYNC_PUSHED = REGISTRY.counter('beacon_user_sync_pushed_total',
+                                    'Users written to or removed from terminals', ('device', 'action'))
+
+
+def user_digest(name: str, template: Optional[bytes]) -> str:
+    """
+    Digest of what user sync writes for a user (name as stored, template).
+    """
+    return hashlib.sha1(name[:24].encode('utf-8') + b'\x00' + (template or b'')).hexdigest()
+
+
+class UserSync:
+    """
+    Pulls roster changes from the cloud and pushes the differences to terminals.
+    """
+    def __init__(self, db: Database, inventory: DeviceInventory, devices: Sequence[str],
+                 url: str = USER_SYNC_URL, token: Optional[str] = None, timeout: float = USER_SYNC_TIMEOUT,
+                 on_roster_change: Optional[Callable[[], Any]] = None):
+        """
+        :param db: Database instance
+        :param inventory: Device inventory (pooled sessions, cached users)
+        :param devices: Terminal IPs to keep in step with the cloud
+        :param url: Roster endpoint
+        :param token: Bearer token for authentication
+        :param timeout: Roster request timeout in seconds
+        :param on_roster_change: Called after a pull that added or updated users
+        """
+        self.db = db
+        self.inventory = inventory
+        self.devices = list(devices)
+        self.url = url
+        self.timeout = timeout
+        self.on_roster_change = on_roster_change
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def close(self) -> None:
+        self.session.close()
+
+    def pull(self) -> bool:
+        """
+        Fetch roster changes since the stored cursor into cloud_users.
+        Returns True if anything changed.
+        """
+        cursor = self.db.get_sync_state(CURSOR_KEY)
+        etag = self.db.get_sync_state(ETAG_KEY)
+        headers = {'If-None-Match': etag} if etag else {}
+        params = {'updatedSince': cursor} if cursor else {}
+        try:
+            response = self.session.get(self.url, params=params, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            USER_SYNC_REQUESTS.inc(status='error')
+            raise
+        USER_SYNC_REQUESTS.inc(status=response.status_code)
+        USER_SYNC_BYTES.inc(len(response.content))
+        if response.status_code == 304:
+            logger.debug("Roster unchanged")
+            return False
+        response.raise_for_status()
+        body = response.json()
+        changed = [
+            (user['biometricId'], user.get('name') or '',
+             base64.b64decode(user['fingerprintTemplate']) if user.get('fingerprintTemplate') else None,
+             user.get('updatedAt') or '')
+            for user in body.get('users', []) if user.get('biometricId') is not None
+        ]
+        # Older clouds send no manifest; their (always full) response is the whole roster
+        keep = body.get('ids')
+        if keep is None and not cursor:
+            keep = [row[0] for row in changed]
+        state = {}
+        if body.get('cursor'):
+            state[CURSOR_KEY] = body['cursor']
+        if response.headers.get('ETag'):
+            state[ETAG_KEY] = response.headers['ETag']
+        removed = self.db.apply_cloud_users(changed, keep, state)
+        logger.info("Roster pull: %d changed, %d removed (%d bytes)", len(changed), removed, len(response.content))
+        if changed and self.on_roster_change:
+            self.on_roster_change()
+        return bool(changed or removed)
+
+    def push(self, device_ip: str) -> Dict[str, int]:
+        """
+        Bring one terminal in step with cloud_users; returns counts per action.
+        Costs one counters round-trip when the terminal is already in step.
+        """
+        desired = {uid: (name, template) for uid, name, template, _ in self.db.fetch_cloud_users()}
+        applied = self.db.fetch_device_users(device_ip)
+        users, templates = self.inventory.users(device_ip)
+        present = {user.uid for user in users}
+
+        upserts: List[Dict[str, Any]] = []
+        digests: Dict[int, str] = {}
+        for uid, (name, template) in desired.items():
+            digest = user_digest(name, template)
+            if uid in present and applied.get(uid) == digest and (not template or uid in templates):
+                continue
+            digests[uid] = digest
+            upserts.append(dict(
+                uid=uid,
+                name=name[:24],  # ZKTeco name limit
+                privilege=const.USER_DEFAULT,
+                password='',
+                group_id='',
+                user_id=str(uid),
+                card=0,
+                template=template
+            ))
+        gone = [uid for uid in applied if uid not in desired]
+        deletes = [uid for uid in gone if uid in present]
+        # Already absent from the terminal: just forget them
+        forgotten = [uid for uid in gone if uid not in present]
+
+        counts = {'created': 0, 'updated': 0, 'deleted': 0, 'failed': 0}
+        if forgotten:
+            self.db.record_device_users(device_ip, {}, forgotten)
+        work = [('upsert', fields) for fields in upserts] + [('delete', uid) for uid in deletes]
+        for start in range(0, len(work), max(1, USER_SYNC_BATCH_USERS)):
+            chunk = work[start:start + USER_SYNC_BATCH_USERS]
+            results = self.inventory.apply_batch(
+                device_ip,
+                upserts=[item for kind, item in chunk if kind == 'upsert'],
+                deletes=[item for kind, item in chunk if kind == 'delete']
+            )
+            pushed: Dict[int, str] = {}
+            removed: List[int] = []
+            for result in results:
+                action = result['action']
+                if not result['success']:
+                    counts['failed'] += 1
+                    logger.warning("Could not %s user: %s", 'delete' if result['uid'] in deletes else 'write',
+                                   result.get('error'), uid=result['uid'], device=device_ip)
+                    continue
+                if action in ('created', 'updated'):
+                    pushed[result['uid']] = digests[result['uid']]
+                else:
+                    removed.append(result['uid'])
+                    action = 'deleted'
+                counts[action] += 1
+                USER_SYNC_PUSHED.inc(device=device_ip, action=action)
+            self.db.record_device_users(device_ip, pushed, removed)
+        if upserts or deletes:
+            logger.info("Pushed roster: %d created, %d updated, %d deleted, %d failed", counts['created'],
+                        counts['updated'], counts['deleted'], counts['failed'], device=device_ip)
+        return counts
+
+    def run(self) -> None:
+        """
+        One user sync pass: pull, then push to every terminal. A terminal that
+        cannot be reached is retried on the next pass; the others still sync.
+        """
+        try:
+            self.pull()
+        except Exception as e:
+            # Terminals still get the roster as last pulled
+            logger.warning("Roster pull failed: %s", e)
+        for device_ip in self.devices:
+            try:
+                self.push(device_ip)
+            except Exception as e:
+                logger.warning("Roster push failed: %s", e, device=device_ip)
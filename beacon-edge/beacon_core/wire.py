@@ -0,0 +1,209 @@
+"""
+Wire format module for Project BEACON Edge Gateway
+--------------------------------------------------
+- Compact, versioned, columnar encoding of log batches for SEA uploads
+- Negotiated by Content-Type; gzip JSON remains the fallback
+- Decoded in the cloud by beacon-cloud/src/lib/beaconWire.ts
+
+Layout (v1)::
+
+    b"BCN" | version (1 byte) | compression (1 byte) | body
+
+The body (deflate-compressed when compression == 1) holds, as unsigned
+LEB128 varints and length-prefixed UTF-8 strings:
+
+    count
+    beacon_node_id                      (once per batch)
+    dict_size, user_id * dict_size      (per-batch user-id dictionary)
+    id * count                          (first absolute, then zigzag deltas)
+    user index * count                  (into the dictionary)
+    timestamp * count                   (epoch seconds of the naive device
+                                         time; first absolute, then zigzag deltas)
+    punch_type * count
+
+All rows in a batch must share one beacon_node_id. Timestamps round-trip as
+'YYYY-MM-DD HH:MM:SS' strings, matching what the JSON path sends.
+"""
+
+import calendar
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = 'application/vnd.beacon.logs.v1'
+
+MAGIC = b'BCN'
+VERSION = 1
+COMPRESSION_NONE = 0
+COMPRESSION_DEFLATE = 1
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class WireFormatError(ValueError):
+    """Raised when a batch cannot be encoded or a payload cannot be decoded."""
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    if value < 0:
+        raise WireFormatError(f"varint must be non-negative: {value}")
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _write_string(out: bytearray, value: str) -> None:
+    data = value.encode('utf-8')
+    _write_varint(out, len(data))
+    out += data
+
+
+def _write_deltas(out: bytearray, values: Sequence[int]) -> None:
+    previous = 0
+    for i, value in enumerate(values):
+        if i == 0:
+            _write_varint(out, _zigzag(value))
+        else:
+            _write_varint(out, _zigzag(value - previous))
+        previous = value
+
+
+def _to_epoch(timestamp: Any) -> int:
+    if isinstance(timestamp, datetime):
+        moment = timestamp
+    else:
+        try:
+            moment = datetime.strptime(str(timestamp), TIMESTAMP_FORMAT)
+        except ValueError as e:
+            raise WireFormatError(f"unsupported timestamp {timestamp!r}") from e
+    if moment.microsecond:
+        raise WireFormatError(f"sub-second timestamp {timestamp!r}")
+    return calendar.timegm(moment.timetuple())
+
+
+def encode_logs(logs: Sequence[Tuple[Any, ...]], compress: bool = True, level: int = 9) -> bytes:
+    """
+    Encode beacon_logs rows (all columns, as returned by Database) into a v1 payload.
+    Raises WireFormatError if the batch cannot be represented (callers fall back to JSON).
+    """
+    node_ids = {log[5] for log in logs}
+    if len(node_ids) > 1:
+        raise WireFormatError("batch spans several beacon_node_ids")
+    user_index: Dict[str, int] = {}
+    users: List[int] = []
+    for log in logs:
+        users.append(user_index.setdefault(str(log[1]), len(user_index)))
+
+    body = bytearray()
+    _write_varint(body, len(logs))
+    _write_string(body, node_ids.pop() if node_ids else '')
+    _write_varint(body, len(user_index))
+    for user_id in user_index:
+        _write_string(body, user_id)
+    _write_deltas(body, [int(log[0]) for log in logs])
+    for index in users:
+        _write_varint(body, index)
+    _write_deltas(body, [_to_epoch(log[2]) for log in logs])
+    for log in logs:
+        _write_varint(body, int(log[3]))
+
+    if compress:
+        return MAGIC + bytes((VERSION, COMPRESSION_DEFLATE)) + zlib.compress(bytes(body), level)
+    return MAGIC + bytes((VERSION, COMPRESSION_NONE)) + bytes(body)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def varint(self) -> int:
+        result = 0
+        shift = 0
+        while True:
+            if self.pos >= len(self.data):
+                raise WireFormatError("truncated payload")
+            byte = self.data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def string(self) -> str:
+        length = self.varint()
+        if self.pos + length > len(self.data):
+            raise WireFormatError("truncated payload")
+        try:
+            value = self.data[self.pos:self.pos + length].decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise WireFormatError("invalid UTF-8 string") from e
+        self.pos += length
+        return value
+
+    def lookup(self, dictionary: List[str]) -> str:
+        index = self.varint()
+        if index >= len(dictionary):
+            raise WireFormatError("user index out of range")
+        return dictionary[index]
+
+    def deltas(self, count: int) -> List[int]:
+        values: List[int] = []
+        current = 0
+        for i in range(count):
+            value = _unzigzag(self.varint())
+            current = value if i == 0 else current + value
+            values.append(current)
+        return values
+
+
+def decode_logs(payload: bytes) -> List[Dict[str, Any]]:
+    """
+    Decode a v1 payload into the same dicts the JSON upload carries.
+    Raises WireFormatError for any payload that is not a valid v1 batch.
+    """
+    if len(payload) < 5 or payload[:3] != MAGIC:
+        raise WireFormatError("not a BEACON wire payload")
+    if payload[3] != VERSION:
+        raise WireFormatError(f"unsupported wire version {payload[3]}")
+    if payload[4] == COMPRESSION_DEFLATE:
+        try:
+            body = zlib.decompress(payload[5:])
+        except zlib.error as e:
+            raise WireFormatError(f"corrupt compressed body: {e}") from e
+    elif payload[4] == COMPRESSION_NONE:
+        body = payload[5:]
+    else:
+        raise WireFormatError(f"unsupported compression {payload[4]}")
+
+    reader = _Reader(body)
+    count = reader.varint()
+    node_id = reader.string()
+    dictionary = [reader.string() for _ in range(reader.varint())]
+    ids = reader.deltas(count)
+    users = [reader.lookup(dictionary) for _ in range(count)]
+    timestamps = reader.deltas(count)
+    punches = [reader.varint() for _ in range(count)]
+    try:
+        times = [datetime.fromtimestamp(ts, tz=timezone.utc).strftime(TIMESTAMP_FORMAT) for ts in timestamps]
+    except (OverflowError, OSError, ValueError) as e:
+        raise WireFormatError(f"timestamp out of range: {e}") from e
+    return [
+        {
+            'id': ids[i],
+            'user_id': users[i],
+            'timestamp': times[i],
+            'punch_type': punches[i],
+            'beacon_node_id': node_id,
+        }
+        for i in range(count)
+    ]
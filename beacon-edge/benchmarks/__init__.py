@@ -0,0 +1,2 @@
+# Benchmarks for the BEACON edge pipeline (run from beacon-edge: python -m benchmarks for the
+# whole suite as JSON, or python -m benchmarks.<name> for one)
@@ -0,0 +1,126 @@
+"""
+Benchmark suite runner for Project BEACON Edge Gateway
+------------------------------------------------------
+- Runs every benchmark (database, wire_format, pipeline) and writes one JSON
+  report with environment metadata, so releases can be compared
+- --baseline prints the change of each timing/throughput figure against an
+  earlier report and exits non-zero past --threshold
+- Usage: python -m benchmarks [--quick] [--output results.json] [--baseline old.json]
+"""
+
+import argparse
+import contextlib
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+from benchmarks import database, pipeline, wire_format
+
+# Compared metrics: medians, totals and sizes (lower is better) plus these (higher is better);
+# min/max samples are reported but too noisy to gate on
+HIGHER_IS_BETTER = ('rows_per_s', 'logs_per_s', 'ratio')
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+
+def run_suite(quick: bool) -> Dict[str, Any]:
+    rows = [10_000] if quick else [10_000, 100_000, 1_000_000]
+    cycles = 3 if quick else 10
+    results = []
+    for count in rows:
+        print(f"[bench] database rows={count}", file=sys.stderr)
+        results.append(database.run(count))
+    for batch in (50, 500, 5000):
+        print(f"[bench] wire_format batch={batch}", file=sys.stderr)
+        results.append(wire_format.run(batch, 200))
+    for mode in ('LAND', 'SEA'):
+        print(f"[bench] pipeline mode={mode}", file=sys.stderr)
+        results.append(pipeline.run(mode, devices=4, cycles=cycles, punches=50,
+                                    backlog=1000 if quick else 5000, latency=0.0))
+    return {
+        'suite': 'beacon-edge',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'quick': quick,
+        'results': results,
+    }
+
+
+def _key(result: Dict[str, Any]) -> str:
+    params = ('rows', 'batch', 'mode')
+    return result['benchmark'] + ''.join(f' {p}={result[p]}' for p in params if p in result)
+
+
+def _metrics(value: Any, path: str = '') -> Iterator[Tuple[str, float]]:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _metrics(v, f'{path}.{k}' if path else k)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool) and (
+            path.endswith(('median_ms', 'encode_ms', 'seconds', 'total_s', 'bytes_per_log'))
+            or path.endswith(HIGHER_IS_BETTER)):
+        yield path, float(value)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> int:
+    """
+    Print per-metric changes against baseline; returns the number of regressions.
+    """
+    previous = {_key(r): dict(_metrics(r)) for r in baseline.get('results', [])}
+    regressions = 0
+    for result in report['results']:
+        before = previous.get(_key(result))
+        if not before:
+            continue
+        for path, value in _metrics(result):
+            old = before.get(path)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if path.endswith(HIGHER_IS_BETTER) else change
+            flag = ''
+            if worse > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{_key(result):<32} {path:<42} {old:>12.3f} -> {value:>12.3f} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='small sizes only (CI / Pi smoke run)')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (fraction)')
+    args = parser.parse_args()
+
+    # Harvester/Syncer progress lines go to stderr so stdout stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_suite(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
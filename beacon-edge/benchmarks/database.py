@@ -0,0 +1,126 @@
+"""
+Database benchmark for Project BEACON Edge Gateway
+--------------------------------------------------
+- Insert and dedup throughput of Database.insert_logs_bulk at 10k/100k/1M rows
+  (fresh rows, then the same rows again as a re-harvest would deliver them)
+- Latency of fetch_unsynced_logs / fetch_unsynced_page on the full backlog
+- Latency of mark_logs_synced for contiguous and scattered id sets
+- Runs against a throwaway database in a temp directory
+- Usage: python -m benchmarks.database [--rows N] [--json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List
+
+from beacon_core.database import Database, LogRecord
+
+NODE_ID = '00000000-0000-4000-8000-000000000001'
+
+
+def synthetic_records(count: int, employees: int = 500) -> Iterator[LogRecord]:
+    """
+    Distinct (user_id, timestamp, punch_type, beacon_node_id) records, one
+    punch per employee every few seconds, generated lazily.
+    """
+    start = datetime(2026, 1, 5, 8)
+    for i in range(count):
+        yield (str(1000 + i % employees), start + timedelta(seconds=i * 7), i % 2, NODE_ID)
+
+
+def timed(fn: Callable[[], Any], rounds: int = 5) -> Dict[str, float]:
+    """
+    Run fn rounds times; latency summary in milliseconds.
+    """
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def run(rows: int, batch: int = 1000) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='beacon-bench-')
+    db = Database(os.path.join(workdir, 'bench.db'))
+    try:
+        started = time.perf_counter()
+        fresh = db.insert_logs_bulk(synthetic_records(rows))
+        insert_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        again = db.insert_logs_bulk(synthetic_records(rows))
+        dedup_s = time.perf_counter() - started
+
+        fetch = timed(lambda: db.fetch_unsynced_logs(limit=batch))
+        page = timed(lambda: db.fetch_unsynced_page(None, batch))
+        mid = db.fetch_unsynced_page(None, rows // 2)[-1]
+        page_deep = timed(lambda: db.fetch_unsynced_page((mid[2], mid[0]), batch))
+
+        # Each round marks a new slice so it never degenerates to a no-op
+        contiguous: List[List[int]] = [list(range(1 + r * batch, 1 + (r + 1) * batch)) for r in range(5)]
+        offset = 5 * batch
+        scattered: List[List[int]] = [list(range(offset + 1 + r, offset + 1 + r + 5 * batch, 5)) for r in range(5)]
+        mark_contiguous = timed(lambda: db.mark_logs_synced(contiguous.pop()))
+        mark_scattered = timed(lambda: db.mark_logs_synced(scattered.pop()))
+
+        return {
+            'benchmark': 'database',
+            'rows': rows,
+            'batch': batch,
+            'insert': {
+                'inserted': fresh.inserted,
+                'seconds': round(insert_s, 3),
+                'rows_per_s': round(rows / insert_s),
+            },
+            'dedup': {
+                'duplicates': again.duplicates,
+                'seconds': round(dedup_s, 3),
+                'rows_per_s': round(rows / dedup_s),
+            },
+            'fetch_unsynced_logs': fetch,
+            'fetch_unsynced_page_first': page,
+            'fetch_unsynced_page_middle': page_deep,
+            'mark_logs_synced_contiguous': mark_contiguous,
+            'mark_logs_synced_scattered': mark_scattered,
+            'db_bytes': os.path.getsize(os.path.join(workdir, 'bench.db')),
+        }
+    finally:
+        db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, action='append', help='backlog size (repeatable)')
+    parser.add_argument('--batch', type=int, default=1000, help='rows per fetch / mark')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        results = [run(rows, args.batch) for rows in (args.rows or [10_000, 100_000, 1_000_000])]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'rows':>9} {'insert/s':>10} {'dedup/s':>10} {'fetch ms':>9} {'page mid ms':>12} "
+          f"{'mark ms':>8} {'mark scat ms':>13}")
+    for r in results:
+        print(f"{r['rows']:>9} {r['insert']['rows_per_s']:>10} {r['dedup']['rows_per_s']:>10} "
+              f"{r['fetch_unsynced_logs']['median_ms']:>9} {r['fetch_unsynced_page_middle']['median_ms']:>12} "
+              f"{r['mark_logs_synced_contiguous']['median_ms']:>8} {r['mark_logs_synced_scattered']['median_ms']:>13}")
+
+
+if __name__ == '__main__':
+    main()
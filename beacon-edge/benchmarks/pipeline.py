@@ -0,0 +1,234 @@
+"""
+Pipeline benchmark for Project BEACON Edge Gateway
+--------------------------------------------------
+- Full harvest -> sync cycles: Harvester reads stand-in devices, Syncer uploads
+  to a stand-in cloud over real HTTP on localhost
+- Stand-in devices answer like a pyzk connection (read_sizes, get_attendance)
+  with a buffer that grows by --punches records per device per cycle
+- Stand-in cloud decodes JSON / GZIP JSON / binary batches and acknowledges
+  per record like /api/beacon/sync (optional --latency per request)
+- Usage: python -m benchmarks.pipeline [--mode LAND|SEA] [--devices N] [--cycles N] [--json]
+"""
+
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from beacon_core import wire
+from beacon_core.database import Database
+from beacon_core.harvester import DeviceState, Harvester
+from beacon_core.syncer import Syncer
+
+NODE_ID = '00000000-0000-4000-8000-000000000002'
+
+
+class StandInDevice:
+    """
+    In-memory attendance buffer exposing the parts of a pyzk connection the
+    harvester uses.
+    """
+    def __init__(self, index: int, employees: int = 200):
+        self.index = index
+        self.employees = employees
+        self.logs: List[SimpleNamespace] = []
+        self.records = 0
+        self.rec_cap = 100_000
+        self._clock = datetime(2026, 1, 5, 7, 30) + timedelta(milliseconds=index)
+
+    def punch(self, count: int) -> None:
+        for _ in range(count):
+            self._clock += timedelta(seconds=3)
+            user = 1000 + (len(self.logs) * 7 + self.index) % self.employees
+            self.logs.append(SimpleNamespace(user_id=str(user), timestamp=self._clock.replace(microsecond=0),
+                                             punch=len(self.logs) % 2))
+
+    def read_sizes(self) -> None:
+        self.records = len(self.logs)
+
+    def get_attendance(self) -> List[SimpleNamespace]:
+        return list(self.logs)
+
+    def disconnect(self) -> None:
+        pass
+
+
+class StandInHarvester(Harvester):
+    """
+    Harvester whose devices are StandInDevice objects instead of terminals.
+    """
+    def __init__(self, db: Database, devices: List[StandInDevice], **kwargs: Any):
+        super().__init__(db, NODE_ID, None, **kwargs)
+        self.stand_ins = {f'stand-in-{d.index}': d for d in devices}
+        self.devices = [DeviceState(ip=ip, type='ZKTeco', interval=0) for ip in self.stand_ins]
+
+    def _connect(self, dev: DeviceState) -> Any:
+        return self.stand_ins[dev.ip]
+
+
+class StandInCloud:
+    """
+    Local HTTP server acknowledging uploads per record (see /api/beacon/sync).
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.keys: Set[Tuple[str, str]] = set()
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        cloud = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _reply(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                self._reply(404, {'error': 'Unknown batch'})
+
+            def do_POST(self) -> None:
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if cloud.latency:
+                    time.sleep(cloud.latency)
+                if self.headers.get('Content-Type', '').startswith(wire.CONTENT_TYPE):
+                    logs = wire.decode_logs(raw)
+                elif self.headers.get('Content-Encoding') == 'gzip':
+                    logs = json.loads(gzip.decompress(raw))
+                else:
+                    logs = json.loads(raw)
+                accepted, duplicates = [], []
+                with cloud.lock:
+                    cloud.requests += 1
+                    # Bytes on the wire, as sent (compressed)
+                    cloud.bytes += len(raw)
+                    for log in logs:
+                        key = (log['user_id'], log['timestamp'])
+                        (duplicates if key in cloud.keys else accepted).append(log['id'])
+                        cloud.keys.add(key)
+                self._reply(200, {'ok': True, 'accepted': accepted, 'duplicates': duplicates, 'rejected': []})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/beacon/sync'
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stand-in-cloud', daemon=True)
+
+    def __enter__(self) -> 'StandInCloud':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 2),
+        'max_ms': round(max(samples) * 1000, 2),
+    }
+
+
+def run(mode: str, devices: int, cycles: int, punches: int, backlog: int,
+        latency: float, workdir: Optional[str] = None) -> Dict[str, Any]:
+    workdir = workdir or tempfile.mkdtemp(prefix='beacon-bench-')
+    db = Database(os.path.join(workdir, 'bench.db'))
+    stand_ins = [StandInDevice(i) for i in range(devices)]
+    for device in stand_ins:
+        device.punch(backlog)
+    harvester = StandInHarvester(db, stand_ins)
+    try:
+        with StandInCloud(latency) as cloud:
+            syncer = Syncer(db, NODE_ID, cloud.url, mode)
+            harvest_s: List[float] = []
+            sync_s: List[float] = []
+            started = time.perf_counter()
+            for cycle in range(cycles):
+                if cycle:
+                    for device in stand_ins:
+                        device.punch(punches)
+                for dev in harvester.devices:
+                    dev.next_due = 0.0
+                t0 = time.perf_counter()
+                harvester.fetch_and_store_logs()
+                t1 = time.perf_counter()
+                # SEA stops after SEA_MAX_BATCHES_PER_SYNC batches; keep going until drained
+                while True:
+                    syncer.sync()
+                    if syncer._failed or not db.fetch_unsynced_logs(limit=1):
+                        break
+                sync_s.append(time.perf_counter() - t1)
+                harvest_s.append(t1 - t0)
+            total_s = time.perf_counter() - started
+            syncer.close()
+            produced = sum(len(device.logs) for device in stand_ins)
+            return {
+                'benchmark': 'pipeline',
+                'mode': mode,
+                'devices': devices,
+                'cycles': cycles,
+                'initial_backlog_per_device': backlog,
+                'punches_per_device_per_cycle': punches,
+                'cloud_latency_s': latency,
+                'logs_produced': produced,
+                'logs_received': len(cloud.keys),
+                'unsynced_left': len(db.fetch_unsynced_logs()),
+                'requests': cloud.requests,
+                'bytes_sent': syncer.bytes_sent,
+                'bytes_received': cloud.bytes,
+                'bytes_per_log': round(syncer.bytes_sent / max(1, len(cloud.keys)), 2),
+                'harvest': summary(harvest_s),
+                'sync': summary(sync_s),
+                'total_s': round(total_s, 3),
+                'logs_per_s': round(produced / total_s),
+            }
+    finally:
+        harvester.close()
+        db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', action='append', choices=['LAND', 'SEA', 'OFFICE'], help='sync mode (repeatable)')
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--punches', type=int, default=50, help='new punches per device per cycle')
+    parser.add_argument('--backlog', type=int, default=5000, help='records already on each device')
+    parser.add_argument('--latency', type=float, default=0.0, help='stand-in cloud latency per request (s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    # Harvester/Syncer progress lines go to stderr so stdout stays a clean table / JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        results = [run(mode, args.devices, args.cycles, args.punches, args.backlog, args.latency)
+                   for mode in (args.mode or ['LAND', 'SEA'])]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':>6} {'logs':>7} {'received':>9} {'requests':>9} {'B/log':>7} "
+          f"{'harvest ms':>11} {'sync ms':>8} {'logs/s':>8}")
+    for r in results:
+        print(f"{r['mode']:>6} {r['logs_produced']:>7} {r['logs_received']:>9} {r['requests']:>9} "
+              f"{r['bytes_per_log']:>7} {r['harvest']['median_ms']:>11} {r['sync']['median_ms']:>8} "
+              f"{r['logs_per_s']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Wire format benchmark for Project BEACON Edge Gateway
+-----------------------------------------------------
+- Compares bytes per log of the compact binary SEA format (beacon_core.wire)
+  with the current GZIP JSON payload (Syncer._prepare_payload)
+- Uses synthetic shift-pattern punches; no device or network needed
+- Usage: python -m benchmarks.wire_format [--employees N] [--batch N] [--json]
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from beacon_core import wire
+from beacon_core.syncer import Syncer
+
+
+def synthetic_logs(count: int, employees: int, seed: int = 42) -> List[Tuple[Any, ...]]:
+    """
+    beacon_logs rows as Database returns them: in/out punches around 08:00 and
+    17:00 for a fixed workforce, ordered by timestamp like fetch_unsynced_logs.
+    """
+    rng = random.Random(seed)
+    node_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    rows: List[Tuple[Any, ...]] = []
+    day = datetime(2026, 1, 5)
+    while len(rows) < count:
+        for punch, hour in ((0, 8), (1, 17)):
+            shift = day.replace(hour=hour)
+            for emp in range(employees):
+                ts = shift + timedelta(seconds=rng.randint(-1800, 1800))
+                rows.append((0, str(1000 + emp), ts.strftime('%Y-%m-%d %H:%M:%S'), punch, 0, node_id))
+        day += timedelta(days=1)
+    rows = sorted(rows[:count], key=lambda r: r[2])
+    return [(i + 1,) + row[1:] for i, row in enumerate(rows)]
+
+
+def measure(logs: List[Tuple[Any, ...]], encode, rounds: int = 5) -> Dict[str, float]:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        payload = encode(logs)
+    elapsed = (time.perf_counter() - started) / rounds
+    return {
+        'bytes': len(payload),
+        'bytes_per_log': round(len(payload) / len(logs), 2),
+        'encode_ms': round(elapsed * 1000, 2),
+    }
+
+
+def run(batch: int, employees: int) -> Dict[str, Any]:
+    logs = synthetic_logs(batch, employees)
+    gzip_json = measure(logs, Syncer._prepare_payload)
+    binary = measure(logs, wire.encode_logs)
+    return {
+        'benchmark': 'wire_format',
+        'batch': batch,
+        'employees': employees,
+        'gzip_json': gzip_json,
+        'binary_v1': binary,
+        'ratio': round(gzip_json['bytes'] / binary['bytes'], 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--batch', type=int, action='append', help='batch size (repeatable)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = [run(batch, args.employees) for batch in (args.batch or [50, 500, 5000])]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'batch':>6} {'gzip json B/log':>16} {'binary B/log':>13} {'ratio':>6}")
+    for r in results:
+        print(f"{r['batch']:>6} {r['gzip_json']['bytes_per_log']:>16} "
+              f"{r['binary_v1']['bytes_per_log']:>13} {r['ratio']:>5}x")
+
+
+if __name__ == '__main__':
+    main()
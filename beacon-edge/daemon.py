@@ -0,0 +1,170 @@
+"""
+Edge daemon for Project BEACON
+------------------------------
+- One process for everything main.py and enrollment_service.py do: harvesting,
+  cloud sync, user sync, retention and the enrollment HTTP API
+- Everything is scheduled on one asyncio event loop; blocking work (device I/O,
+  uploads, SQLite) runs on the enrollment API's bounded DeviceRunner, so a
+  harvest and an API call for the same terminal queue for one session instead
+  of competing for two (a streamed terminal's live capture runs on that pooled
+  session too and pauses while another command is queued for it)
+- Shares one Database, the process-wide device pool and the inventory cache
+- Startup: database, metrics, device pool, background loops, then the API.
+  Shutdown (SIGTERM/SIGINT): the API stops accepting requests, the loops stop,
+  work in progress gets DAEMON_SHUTDOWN_TIMEOUT seconds to finish, then every
+  component is closed in order and the database last
+- Run: python daemon.py (same environment as main.py plus ENROLL_API_PORT)
+"""
+
+import asyncio
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+import uvicorn
+
+# Imported first: it loads .env before main.py reads its settings
+import enrollment_service
+import main
+from beacon_core.archive import ARCHIVE_INTERVAL
+from beacon_core.devices import DEVICE_POOL
+from beacon_core.harvester import HARVEST_STREAMING
+from beacon_core.logger import get_logger
+from beacon_core.usersync import USER_SYNC_INTERVAL
+
+# Enrollment API listener (0 disables the API)
+ENROLL_API_HOST = os.getenv('ENROLL_API_HOST', '0.0.0.0')
+ENROLL_API_PORT = int(os.getenv('ENROLL_API_PORT', '8001'))
+# Seconds given to harvests, uploads and API requests in progress at shutdown
+DAEMON_SHUTDOWN_TIMEOUT = float(os.getenv('DAEMON_SHUTDOWN_TIMEOUT', '20'))
+
+logger = get_logger('Daemon')
+
+# Bounded executor for blocking work, queued per terminal (and per job below)
+runner = enrollment_service.device_runner
+
+
+class ApiServer(uvicorn.Server):
+    """uvicorn server that leaves signal handling to the daemon."""
+    @contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def run_blocking(key: str, fn: Callable[..., Any], *args: Any) -> Any:
+    return await runner.run(key, fn, *args, timeout=None)
+
+
+async def harvest_loop() -> None:
+    harvester = main.harvester
+    while True:
+        due = harvester.due_devices()
+        if due:
+            # One job per terminal; harvest_device records its own failures
+            await asyncio.gather(*(run_blocking(dev.ip, harvester.harvest_device, dev) for dev in due))
+        await asyncio.sleep(max(1, min(main.INTERVALS['harvest'], harvester.seconds_until_next_due())))
+
+
+async def sync_loop() -> None:
+    syncer = main.syncer
+    while True:
+        # wait_for_work blocks on the harvester's notifications, so it holds one
+        # worker (as the syncer thread did) until stop() releases it
+        if not await run_blocking('cloud', syncer.wait_for_work, main.INTERVALS['sync']):
+            continue
+        try:
+            await run_blocking('cloud', syncer.sync)
+        except Exception as e:
+            logger.exception("Syncer error: %s", e)
+
+
+async def usersync_loop() -> None:
+    while True:
+        try:
+            await run_blocking('usersync', main.usersync.run)
+        except Exception as e:
+            logger.exception("User sync error: %s", e)
+        await asyncio.sleep(USER_SYNC_INTERVAL)
+
+
+async def archive_loop() -> None:
+    while True:
+        try:
+            await run_blocking('archive', main.archiver.run)
+        except Exception as e:
+            logger.exception("Archive error: %s", e)
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+async def serve_api(server: ApiServer) -> None:
+    try:
+        await server.serve()
+    except SystemExit:
+        # uvicorn exits when it cannot bind; attendance keeps running without the API
+        logger.error("Enrollment API failed to start on %s:%d", ENROLL_API_HOST, ENROLL_API_PORT)
+
+
+def install_signal_handlers(loop: asyncio.AbstractEventLoop, stop: asyncio.Event) -> None:
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows event loops have no add_signal_handler
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+
+
+async def run_daemon() -> None:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    install_signal_handlers(loop, stop)
+
+    main.metrics_server.start()
+    DEVICE_POOL.start()
+    if HARVEST_STREAMING:
+        main.harvester.start_streaming()
+    if main.BEACON_MODE == 'SEA':
+        main.syncer.link_monitor.start()
+    loops = [loop.create_task(harvest_loop()), loop.create_task(sync_loop()),
+             loop.create_task(archive_loop())]
+    if USER_SYNC_INTERVAL > 0:
+        loops.append(loop.create_task(usersync_loop()))
+    server: Optional[ApiServer] = None
+    api: Optional[asyncio.Task] = None
+    if ENROLL_API_PORT:
+        # lifespan off: the daemon starts and closes the shared pool and runner itself
+        server = ApiServer(uvicorn.Config(enrollment_service.app, host=ENROLL_API_HOST, port=ENROLL_API_PORT,
+                                          lifespan='off'))
+        api = loop.create_task(serve_api(server))
+    logger.info("Started: %d devices, mode %s, enrollment API %s", len(main.harvester.devices), main.BEACON_MODE,
+                f'on {ENROLL_API_HOST}:{ENROLL_API_PORT}' if api else 'disabled')
+
+    try:
+        await stop.wait()
+        logger.info("Shutting down")
+    finally:
+        if api is not None:
+            server.should_exit = True
+            await asyncio.wait([api], timeout=DAEMON_SHUTDOWN_TIMEOUT)
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        main.syncer.stop()
+        # Nothing else runs on the loop by now, so the drain may block it
+        drain = threading.Thread(target=runner.close, kwargs={'wait': True}, name='drain', daemon=True)
+        drain.start()
+        drain.join(DAEMON_SHUTDOWN_TIMEOUT)
+        if drain.is_alive():
+            logger.warning("Work still running after %.0fs; closing anyway", DAEMON_SHUTDOWN_TIMEOUT)
+        main.metrics_server.close()
+        main.harvester.close()
+        main.syncer.close()
+        main.usersync.close()
+        DEVICE_POOL.close()
+        main.db.close()
+        logger.info("Stopped")
+
+
+if __name__ == '__main__':
+    asyncio.run(run_daemon())
@@ -6,13 +6,17 @@ Improved enrollment with proper device interaction and verification
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from zk.base import ZK
 from zk import const
 import os
+import asyncio
 import base64
+from contextlib import asynccontextmanager
 from typing import Optional, List
 import uvicorn
 from datetime import datetime
+from beacon_core.devices import DEVICE_POOL, DeviceRunner
+from beacon_core.inventory import INVENTORY
+from beacon_core.logger import get_logger
 
 try:
     from dotenv import load_dotenv
@@ -20,10 +24,37 @@ try:
 except ImportError:
     pass
 
-app = FastAPI(title="BEACON Enrollment Service")
-
 DEVICE_IP = os.getenv('DEVICE_IP', '192.168.1.196')
-ZK_PASSWORD = int(os.getenv('ZK_PASSWORD', '0'))
+# Deadline for a single-device request, queueing included (504 past it)
+ENROLL_REQUEST_TIMEOUT = float(os.getenv('ENROLL_REQUEST_TIMEOUT', '30'))
+# Deadline for a batch enroll/delete, and the most users one batch may carry
+BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', '120'))
+BATCH_MAX_USERS = int(os.getenv('BATCH_MAX_USERS', '500'))
+# Deadline per device for GET /devices; slower devices are reported as "timeout"
+DEVICES_TIMEOUT = float(os.getenv('DEVICES_TIMEOUT', '5'))
+
+logger = get_logger('Enrollment')
+
+# Authenticated device sessions shared by all requests (one lock per device;
+# ZK_PASSWORD is read on connect); under daemon.py the harvester shares them too
+device_pool = DEVICE_POOL
+# Cached users/template presence per device, validated by the device counters
+inventory = INVENTORY
+# Blocking device calls run here, bounded per device, so handlers stay async
+# (daemon.py runs its harvests on it too)
+device_runner = DeviceRunner()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Standalone only: daemon.py serves the app with lifespan off and owns these
+    device_pool.start()
+    try:
+        yield
+    finally:
+        device_runner.close()
+        device_pool.close()
+
+app = FastAPI(title="BEACON Enrollment Service", lifespan=lifespan)
 
 class EnrollRequest(BaseModel):
     biometric_id: int
@@ -41,6 +72,31 @@ class VerifyRequest(BaseModel):
     biometric_id: int
     device_ip: Optional[str] = None
 
+class BatchUser(BaseModel):
+    biometric_id: int
+    name: str
+
+class BatchEnrollRequest(BaseModel):
+    users: List[BatchUser]
+    device_ip: Optional[str] = None
+
+class BatchDeleteRequest(BaseModel):
+    biometric_ids: List[int]
+    device_ip: Optional[str] = None
+
+class BatchResult(BaseModel):
+    biometric_id: int
+    action: str  # created, updated, deleted, not_found or not_attempted
+    success: bool
+    has_fingerprint: Optional[bool] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    device_ip: str
+    succeeded: int
+    failed: int
+    results: List[BatchResult]
+
 class DeviceInfo(BaseModel):
     ip: str
     name: str
@@ -50,11 +106,26 @@ class DeviceInfo(BaseModel):
     templates_count: int = 0
     device_name: Optional[str] = None
     firmware: Optional[str] = None
+    error: Optional[str] = None
 
-def connect_device(device_ip: str):
-    """Connect to ZKTeco device"""
-    zk = ZK(device_ip, port=4370, timeout=10, password=ZK_PASSWORD, force_udp=False, ommit_ping=True)
-    return zk.connect()
+def configured_devices() -> List[dict]:
+    """Devices from DEVICE_LIST (ip:type[:interval], as the harvester reads it), else DEVICE_IP"""
+    devices = []
+    for entry in os.getenv('DEVICE_LIST', '').split(','):
+        if ':' in entry:
+            ip, dev_type = [part.strip() for part in entry.split(':')][:2]
+            devices.append({"ip": ip, "name": f"{dev_type} {ip}", "location": "DEVICE_LIST"})
+    return devices or [
+        {"ip": DEVICE_IP, "name": "Office Device", "location": "HQ - Direct PC Connection"},
+    ]
+
+async def on_device(device_ip: str, handler, *args, timeout: float = ENROLL_REQUEST_TIMEOUT):
+    """Run a blocking handler for one device on the device runner, within the request deadline"""
+    try:
+        return await device_runner.run(device_ip, handler, *args, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Device did not answer within %.0fs", timeout, device=device_ip)
+        raise HTTPException(status_code=504, detail=f"Device {device_ip} did not answer within {timeout:.0f}s")
 
 @app.get("/health")
 def health_check():
@@ -62,7 +133,7 @@ def health_check():
     return {"status": "ok", "service": "enrollment", "timestamp": datetime.now().isoformat()}
 
 @app.post("/enroll", response_model=EnrollResponse)
-def enroll_fingerprint(request: EnrollRequest):
+async def enroll_fingerprint(request: EnrollRequest):
     """
     Prepare device for fingerprint enrollment
     
@@ -70,28 +141,25 @@ def enroll_fingerprint(request: EnrollRequest):
     This endpoint creates the user and provides instructions.
     """
     device_ip = request.device_ip or DEVICE_IP
-    
-    print(f"[ENROLL] Preparing enrollment for ID={request.biometric_id}, Name={request.name} on {device_ip}")
+    return await on_device(device_ip, _enroll_fingerprint, request, device_ip)
+
+def _enroll_fingerprint(request: EnrollRequest, device_ip: str) -> EnrollResponse:
+    """Blocking part of /enroll (runs on the device runner)"""
+    logger.info("Preparing enrollment for %s", request.name, uid=request.biometric_id, device=device_ip)
     
     try:
-        conn = connect_device(device_ip)
-        print(f"[ENROLL] Connected to device at {device_ip}")
-        
         # Check if user already exists
-        existing_user = None
         try:
-            users = conn.get_users()
-            for user in users:
-                if user.uid == request.biometric_id:
-                    existing_user = user
-                    print(f"[ENROLL] User ID {request.biometric_id} already exists")
-                    break
+            users, _ = inventory.users(device_ip)
+            if any(user.uid == request.biometric_id for user in users):
+                logger.info("User already exists", uid=request.biometric_id, device=device_ip)
         except Exception as e:
-            print(f"[ENROLL] Warning checking existing users: {e}")
+            logger.warning("Could not check existing users: %s", e, device=device_ip)
         
         # Create or update user on device
         try:
-            conn.set_user(
+            inventory.set_user(
+                device_ip,
                 uid=request.biometric_id,
                 name=request.name[:24],  # ZKTeco name limit
                 privilege=const.USER_DEFAULT,
@@ -100,29 +168,21 @@ def enroll_fingerprint(request: EnrollRequest):
                 user_id=str(request.biometric_id),
                 card=0
             )
-            print(f"[ENROLL] User {request.name} (ID: {request.biometric_id}) created/updated on device")
+            logger.info("User %s created/updated on device", request.name, uid=request.biometric_id, device=device_ip)
         except Exception as e:
-            print(f"[ENROLL] Error creating user: {e}")
-            conn.disconnect()
+            logger.error("Error creating user: %s", e, uid=request.biometric_id, device=device_ip)
             raise HTTPException(status_code=500, detail=f"Failed to create user on device: {str(e)}")
         
         # Check if user has fingerprint template
-        has_template = False
         template_data = None
         try:
-            templates = conn.get_templates()
-            for tmpl in templates:
-                if tmpl.uid == request.biometric_id:
-                    has_template = True
-                    template_data = tmpl.template
-                    print(f"[ENROLL] Found existing fingerprint template for user {request.biometric_id}")
-                    break
+            template_data = inventory.template(device_ip, request.biometric_id)
+            if template_data:
+                logger.info("Found existing fingerprint template", uid=request.biometric_id, device=device_ip)
         except Exception as e:
-            print(f"[ENROLL] Could not retrieve templates: {e}")
-        
-        conn.disconnect()
+            logger.warning("Could not retrieve templates: %s", e, device=device_ip)
         
-        if has_template and template_data:
+        if template_data:
             # Template exists - return it
             encoded_template = base64.b64encode(template_data).decode('utf-8')
             return EnrollResponse(
@@ -169,42 +229,91 @@ Note: User {request.name} has been created with ID {request.biometric_id}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[ENROLL] Enrollment failed: {e}")
+        logger.error("Enrollment failed: %s", e, uid=request.biometric_id, device=device_ip)
         raise HTTPException(status_code=500, detail=f"Enrollment failed: {str(e)}")
 
+@app.post("/batch/enroll", response_model=BatchResponse)
+async def batch_enroll(request: BatchEnrollRequest):
+    """
+    Create or update many users in one device session (device disabled while writing)
+    
+    Fingerprints still have to be enrolled on the device menu; has_fingerprint
+    tells which users already have one.
+    """
+    device_ip = request.device_ip or DEVICE_IP
+    if len(request.users) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_USERS} users per batch")
+    # Last entry wins when a user is listed twice
+    users = {user.biometric_id: user for user in request.users}
+    upserts = [
+        dict(
+            uid=user.biometric_id,
+            name=user.name[:24],  # ZKTeco name limit
+            privilege=const.USER_DEFAULT,
+            password='',
+            group_id='',
+            user_id=str(user.biometric_id),
+            card=0
+        )
+        for user in users.values()
+    ]
+    return await on_device(device_ip, _apply_batch, device_ip, upserts, [], timeout=BATCH_TIMEOUT)
+
+@app.post("/batch/delete", response_model=BatchResponse)
+async def batch_delete(request: BatchDeleteRequest):
+    """Delete many users and their templates in one device session"""
+    device_ip = request.device_ip or DEVICE_IP
+    if len(request.biometric_ids) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_USERS} users per batch")
+    deletes = list(dict.fromkeys(request.biometric_ids))
+    return await on_device(device_ip, _apply_batch, device_ip, [], deletes, timeout=BATCH_TIMEOUT)
+
+def _apply_batch(device_ip: str, upserts: List[dict], deletes: List[int]) -> BatchResponse:
+    """Blocking part of the batch endpoints (runs on the device runner)"""
+    logger.info("Applying batch: %d create/update, %d delete", len(upserts), len(deletes), device=device_ip)
+    try:
+        results = inventory.apply_batch(device_ip, upserts, deletes)
+    except Exception as e:
+        logger.error("Batch failed: %s", e, device=device_ip)
+        raise HTTPException(status_code=500, detail=f"Batch failed: {str(e)}")
+    
+    response = BatchResponse(
+        device_ip=device_ip,
+        succeeded=sum(1 for r in results if r['success']),
+        failed=sum(1 for r in results if not r['success']),
+        results=[
+            BatchResult(
+                biometric_id=r['uid'],
+                action=r['action'],
+                success=r['success'],
+                has_fingerprint=r.get('has_template'),
+                error=r.get('error')
+            )
+            for r in results
+        ]
+    )
+    logger.info("Batch applied: %d succeeded, %d failed", response.succeeded, response.failed, device=device_ip)
+    return response
+
 @app.post("/verify")
-def verify_enrollment(request: VerifyRequest):
+async def verify_enrollment(request: VerifyRequest):
     """
     Verify if fingerprint is enrolled and retrieve template
     """
     device_ip = request.device_ip or DEVICE_IP
-    
-    print(f"[VERIFY] Checking enrollment for ID={request.biometric_id} on {device_ip}")
+    return await on_device(device_ip, _verify_enrollment, request, device_ip)
+
+def _verify_enrollment(request: VerifyRequest, device_ip: str) -> dict:
+    """Blocking part of /verify (runs on the device runner)"""
+    logger.info("Verifying enrollment", uid=request.biometric_id, device=device_ip)
     
     try:
-        conn = connect_device(device_ip)
-        
-        # Check if user has fingerprint template
-        templates = conn.get_templates()
-        print(f"[VERIFY] Found {len(templates)} templates on device")
-        
-        # Log all templates for debugging
-        for tmpl in templates:
-            print(f"[VERIFY]   Template UID={tmpl.uid}, FID={tmpl.fid}, Size={tmpl.size}, Valid={tmpl.valid}")
-        
-        template_data = None
-        
-        for tmpl in templates:
-            # Check match with type flexibility
-            if str(tmpl.uid) == str(request.biometric_id):
-                template_data = tmpl.template
-                print(f"[VERIFY] Found fingerprint template for user {request.biometric_id} (Match: tmpl.uid={tmpl.uid})")
-                break
-        
-        if not template_data:
-            print(f"[VERIFY] NO template found for UID {request.biometric_id}. Available UIDs: {[t.uid for t in templates]}")
-        
-        conn.disconnect()
+        # Template presence comes from the inventory; only this user's template is downloaded
+        template_data = inventory.template(device_ip, request.biometric_id)
+        if template_data:
+            logger.info("Found fingerprint template", uid=request.biometric_id, device=device_ip)
+        else:
+            logger.info("No template found", uid=request.biometric_id, device=device_ip)
         
         if template_data:
             encoded_template = base64.b64encode(template_data).decode('utf-8')
@@ -222,154 +331,113 @@ def verify_enrollment(request: VerifyRequest):
             }
             
     except Exception as e:
-        print(f"[VERIFY] Verification failed: {e}")
+        logger.error("Verification failed: %s", e, uid=request.biometric_id, device=device_ip)
         raise HTTPException(status_code=500, detail=f"Verification failed: {str(e)}")
 
 @app.get("/devices", response_model=List[DeviceInfo])
-def list_devices():
-    """List all configured devices with status"""
-    # In production, this would come from database
-    device_configs = [
-        {"ip": DEVICE_IP, "name": "Office Device", "location": "HQ - Direct PC Connection"},
-    ]
-    
-    devices = []
-    for config in device_configs:
-        device_info = DeviceInfo(
-            ip=config["ip"],
-            name=config["name"],
-            location=config["location"],
-            status="unknown",
-            users_count=0,
-            templates_count=0
-        )
-        
+async def list_devices():
+    """List all configured devices with status (queried concurrently; partial results past DEVICES_TIMEOUT)"""
+    async def probe(config: dict) -> DeviceInfo:
         try:
-            conn = connect_device(config["ip"])
-            device_info.status = "online"
-            
-            # Get device info
-            try:
-                device_info.device_name = conn.get_device_name()
-            except:
-                pass
-            
-            try:
-                device_info.firmware = conn.get_firmware_version()
-            except:
-                pass
-            
-            # Count users and templates
-            try:
-                users = conn.get_users()
-                device_info.users_count = len(users)
-            except:
-                pass
-            
-            try:
-                templates = conn.get_templates()
-                device_info.templates_count = len(templates)
-            except:
-                pass
-            
-            conn.disconnect()
-        except Exception as e:
-            print(f"[DEVICES] Error connecting to {config['ip']}: {e}")
-            device_info.status = "offline"
-        
-        devices.append(device_info)
+            return await device_runner.run(config["ip"], _device_info, config, timeout=DEVICES_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Device did not answer within %.0fs", DEVICES_TIMEOUT, device=config["ip"])
+            return DeviceInfo(ip=config["ip"], name=config["name"], location=config["location"],
+                              status="timeout", error=f"No answer within {DEVICES_TIMEOUT:.0f}s")
+    
+    return await asyncio.gather(*(probe(config) for config in configured_devices()))
+
+def _device_info(config: dict) -> DeviceInfo:
+    """Status and counters of one device (runs on the device runner)"""
+    device_info = DeviceInfo(
+        ip=config["ip"],
+        name=config["name"],
+        location=config["location"],
+        status="unknown",
+        users_count=0,
+        templates_count=0
+    )
     
-    return devices
+    try:
+        # Counters from the device (or the inventory cache); no user/template downloads
+        info = inventory.info(config["ip"])
+        device_info.status = "online"
+        device_info.device_name = info["device_name"]
+        device_info.firmware = info["firmware"]
+        device_info.users_count = info["users"]
+        device_info.templates_count = info["fingers"]
+    except Exception as e:
+        logger.warning("Error connecting: %s", e, device=config['ip'])
+        device_info.status = "offline"
+        device_info.error = str(e)
+    
+    return device_info
 
 @app.get("/users/{device_ip}")
-def list_users(device_ip: str):
+async def list_users(device_ip: str):
     """List all users on a specific device"""
-    print(f"[USERS] Raw IP input: {repr(device_ip)}")
+    logger.debug("Listing users; raw IP input %r", device_ip)
     device_ip = device_ip.strip()
-    print(f"[USERS] Stripped IP: {repr(device_ip)}")
+    return await on_device(device_ip, _list_users, device_ip)
+
+def _list_users(device_ip: str) -> dict:
+    """Blocking part of /users (runs on the device runner)"""
     try:
         if device_ip == 'undefined' or not device_ip:
             raise ValueError(f"Invalid device IP: {device_ip}")
             
-        conn = connect_device(device_ip)
-        users = conn.get_users()
-        
-        # Get templates for comparison
-        templates = []
-        try:
-            templates = conn.get_templates()
-        except:
-            pass
-        
-        template_uids = set()
-        template_map = {}
-        try:
-            templates = conn.get_templates()
-            print(f"[USERS] Retieved {len(templates)} templates")
-            for tmpl in templates:
-                # Debug template info
-                print(f"[USERS] Tmpl: uid={tmpl.uid} (type={type(tmpl.uid)}), fid={tmpl.fid}, size={tmpl.size}")
-                template_uids.add(tmpl.uid)
-                template_uids.add(str(tmpl.uid)) # Add string version too just in case
-        except Exception as e:
-            print(f"[USERS] Error getting templates: {e}")
+        users, templates = inventory.users(device_ip)
         
         user_list = []
         for user in users:
-            uid_val = user.uid
-            # Check both int and string match
-            has_fp = (uid_val in template_uids) or (str(uid_val) in template_uids)
-            
-            print(f"[USERS] User: uid={uid_val} (type={type(uid_val)}), name={user.name}, has_fp={has_fp}")
-            
             user_list.append({
                 "uid": user.uid,
                 "name": user.name,
                 "privilege": user.privilege,
-                "has_fingerprint": has_fp,
+                "has_fingerprint": user.uid in templates,
                 "card": user.card
             })
         
-        conn.disconnect()
-        
         return {"device_ip": device_ip, "users": user_list}
         
     except Exception as e:
-        print(f"[USERS] Detailed error: {e}")
+        logger.error("Failed to list users: %s", e, device=device_ip)
         raise HTTPException(status_code=500, detail=f"Failed to list users: {str(e)}")
 
 @app.delete("/users/{device_ip}/{uid}")
-def delete_user(device_ip: str, uid: int):
+async def delete_user(device_ip: str, uid: int):
     """Delete a user and their templates from the device"""
-    print(f"[DELETE] Deleting user {uid} from device {device_ip}")
+    return await on_device(device_ip, _delete_user, device_ip, uid)
+
+def _delete_user(device_ip: str, uid: int) -> dict:
+    """Blocking part of DELETE /users (runs on the device runner)"""
+    logger.info("Deleting user", uid=uid, device=device_ip)
     try:
-        conn = connect_device(device_ip)
-        
-        # Enable device if disabled (sometimes happens after error)
-        conn.enable_device()
+        with device_pool.session(device_ip) as conn:
+            # Enable device if disabled (sometimes happens after error)
+            conn.enable_device()
         
         # Delete user
         try:
-            conn.delete_user(uid=uid)
-            print(f"[DELETE] User {uid} deleted successfully")
+            inventory.delete_user(device_ip, uid)
+            logger.info("User deleted", uid=uid, device=device_ip)
         except Exception as e:
             # Check if user actually exists before failing
-            users = conn.get_users()
+            users, _ = inventory.users(device_ip)
             if any(u.uid == uid for u in users):
-                print(f"[DELETE] Failed to delete user {uid}: {e}")
+                logger.error("Failed to delete user: %s", e, uid=uid, device=device_ip)
                 raise e
             else:
-                print(f"[DELETE] User {uid} was already deleted")
+                logger.info("User was already deleted", uid=uid, device=device_ip)
         
-        conn.disconnect()
         return {"success": True, "message": f"User {uid} deleted successfully"}
         
     except Exception as e:
-        print(f"[DELETE] Error deleting user: {e}")
+        logger.error("Error deleting user: %s", e, uid=uid, device=device_ip)
         raise HTTPException(status_code=500, detail=f"Failed to delete user: {str(e)}")
 
 if __name__ == "__main__":
-    print(f"[ENROLLMENT SERVICE] Starting server on http://localhost:8001")
-    print(f"[ENROLLMENT SERVICE] Device IP: {DEVICE_IP}")
-    print(f"[ENROLLMENT SERVICE] Manual enrollment mode enabled")
+    logger.info("Starting server on http://localhost:8001")
+    logger.info("Device IP: %s", DEVICE_IP)
+    logger.info("Manual enrollment mode enabled")
     uvicorn.run(app, host="0.0.0.0", port=8001)
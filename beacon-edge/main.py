@@ -2,9 +2,15 @@ import os
 import threading
 import time
 import uuid
+from beacon_core.archive import Archiver, ARCHIVE_INTERVAL
 from beacon_core.database import Database
-from beacon_core.harvester import Harvester
+from beacon_core.devices import DEVICE_POOL
+from beacon_core.harvester import Harvester, HARVEST_STREAMING
+from beacon_core.inventory import INVENTORY
+from beacon_core.logger import get_logger
+from beacon_core.metrics import MetricsServer
 from beacon_core.syncer import Syncer
+from beacon_core.usersync import UserSync, USER_SYNC_INTERVAL
 
 BEACON_MODE = os.getenv('BEACON_MODE', 'LAND').upper()
 DEVICE_IP = os.getenv('DEVICE_IP', '192.168.1.201')
@@ -12,15 +18,32 @@ API_URL = os.getenv('CLOUD_API_URL', 'https://api.example.com/beacon/sync')
 BEACON_TOKEN = os.getenv('BEACON_TOKEN', '')
 BEACON_NODE_ID = os.getenv('BEACON_NODE_ID', str(uuid.uuid4()))
 
+# 'sync' is now the idle/retry tick: new logs wake the syncer immediately, after
+# waiting 'sync_coalesce' seconds for more to arrive and no sooner than
+# 'sync_min' seconds after the previous upload attempt.
 POLL_INTERVALS = {
-	'LAND': {'harvest': 60, 'sync': 30},
-	'SEA': {'harvest': 60, 'sync': 900},  # 900s = 15min
-	'OFFICE': {'harvest': 30, 'sync': 10}  # Faster polling for LAN
+	'LAND': {'harvest': 60, 'sync': 30, 'sync_coalesce': 2, 'sync_min': 5},
+	'SEA': {'harvest': 60, 'sync': 900, 'sync_coalesce': 60, 'sync_min': 900},  # 900s = 15min
+	'OFFICE': {'harvest': 30, 'sync': 10, 'sync_coalesce': 1, 'sync_min': 2}  # Faster polling for LAN
 }
 
+INTERVALS = POLL_INTERVALS.get(BEACON_MODE, POLL_INTERVALS['LAND'])
+SYNC_COALESCE_WINDOW = float(os.getenv('SYNC_COALESCE_WINDOW', INTERVALS['sync_coalesce']))
+SYNC_MIN_INTERVAL = float(os.getenv('SYNC_MIN_INTERVAL', INTERVALS['sync_min']))
+
 db = Database()
-harvester = Harvester(db, DEVICE_IP, BEACON_NODE_ID)
-syncer = Syncer(db, BEACON_NODE_ID, API_URL, BEACON_MODE, BEACON_TOKEN)
+syncer = Syncer(db, BEACON_NODE_ID, API_URL, BEACON_MODE, BEACON_TOKEN,
+				coalesce_window=SYNC_COALESCE_WINDOW, min_interval=SYNC_MIN_INTERVAL)
+# Polling shares the process-wide device sessions with user sync (and, under
+# daemon.py, the enrollment API)
+harvester = Harvester(db, BEACON_NODE_ID, DEVICE_IP, harvest_interval=INTERVALS['harvest'],
+					  on_new_logs=syncer.notify, pool=DEVICE_POOL)
+archiver = Archiver(db)
+# Cloud roster -> terminals (USER_SYNC_INTERVAL, 0 disables)
+usersync = UserSync(db, INVENTORY, [device.ip for device in harvester.devices], token=BEACON_TOKEN,
+					on_roster_change=syncer.requeue_deferred)
+metrics_server = MetricsServer()
+logger = get_logger('Main')
 
 
 def harvester_thread():
@@ -28,25 +51,64 @@ def harvester_thread():
 		try:
 			harvester.fetch_and_store_logs()
 		except Exception as e:
-			print(f"[Harvester] Error: {e}")
-		time.sleep(POLL_INTERVALS.get(BEACON_MODE, POLL_INTERVALS['LAND'])['harvest'])
+			logger.exception("Harvester error: %s", e)
+		# Wake for whichever device is due next (each has its own schedule/backoff)
+		time.sleep(max(1, min(INTERVALS['harvest'], harvester.seconds_until_next_due())))
 
 
 def syncer_thread():
 	while True:
+		if not syncer.wait_for_work(INTERVALS['sync']):
+			continue
 		try:
 			syncer.sync()
 		except Exception as e:
-			print(f"[Syncer] Error: {e}")
-		time.sleep(POLL_INTERVALS.get(BEACON_MODE, POLL_INTERVALS['LAND'])['sync'])
+			logger.exception("Syncer error: %s", e)
+
+def archive_thread():
+	# Retention: move old synced logs out of SQLite into monthly archive files
+	while True:
+		try:
+			archiver.run()
+		except Exception as e:
+			logger.exception("Archive error: %s", e)
+		time.sleep(ARCHIVE_INTERVAL)
+
+def usersync_thread():
+	while True:
+		try:
+			usersync.run()
+		except Exception as e:
+			logger.exception("User sync error: %s", e)
+		time.sleep(USER_SYNC_INTERVAL)
 
 def main():
 	t1 = threading.Thread(target=harvester_thread, daemon=True)
 	t2 = threading.Thread(target=syncer_thread, daemon=True)
+	t3 = threading.Thread(target=archive_thread, daemon=True)
+	# Prometheus scrape endpoint (METRICS_PORT, 0 disables)
+	metrics_server.start()
+	DEVICE_POOL.start()
+	if HARVEST_STREAMING:
+		harvester.start_streaming()
+	if BEACON_MODE == 'SEA':
+		# Background link probes wake the syncer as soon as a satellite window opens
+		syncer.link_monitor.start()
 	t1.start()
 	t2.start()
-	t1.join()
-	t2.join()
+	t3.start()
+	if USER_SYNC_INTERVAL > 0:
+		threading.Thread(target=usersync_thread, daemon=True).start()
+	try:
+		t1.join()
+		t2.join()
+	finally:
+		metrics_server.close()
+		harvester.close()
+		syncer.close()
+		usersync.close()
+		DEVICE_POOL.close()
+		db.close()
 
 if __name__ == '__main__':
 	main()
\ No newline at end of file
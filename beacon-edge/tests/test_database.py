@@ -0,0 +1,126 @@
+"""
+Settling uploads in the local queue: synced, quarantined and deferred logs and
+the sync journal.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from beacon_core.database import Database
+
+START = datetime(2026, 3, 1, 8, 0, 0)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(os.path.join(tmp_path, 'beacon.db'))
+    for i in range(10):
+        db.insert_logs_safely(str(i % 3), START + timedelta(minutes=i), 0, 'node')
+    yield db
+    db.close()
+
+
+def ids(db):
+    return [row[0] for row in db.fetch_unsynced_logs()]
+
+
+def status(db, log_id):
+    with db.connections.reader() as conn:
+        return conn.execute('SELECT sync_status FROM beacon_logs WHERE id=?', (log_id,)).fetchone()[0]
+
+
+def journal_state(db, batch_id):
+    with db.connections.reader() as conn:
+        row = conn.execute('SELECT state FROM sync_journal WHERE batch_id=?', (batch_id,)).fetchone()
+    return row[0] if row else None
+
+
+def test_mark_contiguous_range(db):
+    queued = ids(db)
+    db.mark_logs_synced(queued[2:6])
+    assert ids(db) == queued[:2] + queued[6:]
+
+
+def test_mark_sparse_ids(db):
+    queued = ids(db)
+    # Unordered, repeated and not one range: goes through the staged-ids table
+    db.mark_logs_synced([queued[7], queued[1], queued[4], queued[1]])
+    assert ids(db) == [i for i in queued if i not in (queued[1], queued[4], queued[7])]
+    db.mark_logs_synced([queued[0], queued[9]])
+    assert ids(db) == [queued[2], queued[3], queued[5], queued[6], queued[8]]
+
+
+def test_mark_nothing(db):
+    db.mark_logs_synced([])
+    assert db.count_unsynced() == 10
+
+
+def test_settle_batch(db):
+    queued = ids(db)
+    batch_id = db.journal_prepare(queued[:6])
+    db.journal_mark_sent(batch_id)
+    assert journal_state(db, batch_id) == 'sent'
+
+    db.settle_batch(batch_id, synced=[queued[0], queued[1], queued[3]],
+                    rejected=[(queued[2], 'bad timestamp')], deferred=[queued[4], queued[5]])
+
+    assert [status(db, i) for i in queued[:6]] == [1, 1, 2, 1, 3, 3]
+    assert ids(db) == queued[6:]
+    assert [(row[0], row[-2]) for row in db.fetch_quarantined()] == [(queued[2], 'bad timestamp')]
+    assert db.count_deferred() == 2
+    assert journal_state(db, batch_id) == 'acknowledged'
+    assert db.journal_pending() == []
+
+
+def test_settle_without_journal(db):
+    queued = ids(db)
+    db.settle_batch(None, synced=queued[:3])
+    assert ids(db) == queued[3:]
+
+
+def test_requeue_deferred(db):
+    queued = ids(db)
+    db.settle_batch(None, synced=[], rejected=[(queued[0], 'unknown user'), (queued[1], 'bad timestamp')],
+                    deferred=[queued[2]])
+    assert db.requeue_deferred() == 2
+    # Only the deferred log and the one quarantined for an unknown user come back
+    assert ids(db) == [queued[0]] + queued[2:]
+    assert [row[0] for row in db.fetch_quarantined()] == [queued[1]]
+    assert db.count_deferred() == 0
+
+
+def test_journal_prune_keeps_pending(db):
+    queued = ids(db)
+    done = db.journal_prepare(queued[:2])
+    db.settle_batch(done, synced=queued[:2])
+    pending = db.journal_prepare(queued[2:4])
+    assert db.journal_prune(datetime.now() + timedelta(seconds=1)) == 1
+    assert [batch_id for batch_id, _, _ in db.journal_pending()] == [pending]
+
+
+def test_archive_from_another_process_still_dedups(db):
+    # An empty archive when the daemon opened the database...
+    rows = db.fetch_unsynced_logs()[:4]
+    db.mark_logs_synced([row[0] for row in rows])
+    # ...then `python -m beacon_core.archive run` moves rows out through its own connection
+    archiver = Database(db.db_path)
+    archiver.purge_archived(archiver.fetch_synced_before('9999-12-31 00:00:00', 0, 100))
+    archiver.close()
+
+    result = db.insert_logs_bulk([(row[1], datetime.fromisoformat(row[2]), row[3], row[5]) for row in rows])
+    assert result == (0, 4)
+    assert db.count_unsynced() == 6
+
+
+def test_quarantine_and_requeue_id_sets(db):
+    queued = ids(db)
+    sparse = [queued[1], queued[4], queued[8]]
+    db.quarantine_logs([(log_id, 'bad timestamp') for log_id in sparse + queued[5:8]])
+    assert [status(db, i) for i in queued] == [0, 2, 0, 0, 2, 2, 2, 2, 2, 0]
+    # A range, then scattered ids (one already back in the queue is not counted)
+    assert db.requeue_quarantined(queued[5:8]) == 3
+    assert db.requeue_quarantined([queued[8], queued[1], queued[6]]) == 2
+    assert [row[0] for row in db.fetch_quarantined()] == [queued[4]]
+    assert db.count_unsynced() == 9
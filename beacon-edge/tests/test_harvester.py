@@ -0,0 +1,130 @@
+"""
+Incremental harvesting against zk_simulator terminals.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from beacon_core import harvester as harvester_module
+from beacon_core.database import Database
+from beacon_core.devices import DevicePool
+from beacon_core.harvester import Harvester
+from zk_simulator import Simulator
+
+# A loopback address of its own, so a simulator left by another run cannot answer
+SIM_HOST = '127.0.0.61'
+
+
+@pytest.fixture
+def device():
+    with Simulator(devices=1, host=SIM_HOST, users=5, records=20) as sim:
+        yield sim.devices[0]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(os.path.join(tmp_path, 'beacon.db'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def harvester(db):
+    harvester = Harvester(db, 'node', SIM_HOST)
+    yield harvester
+    harvester.close()
+
+
+def harvest(harvester):
+    dev = harvester.devices[0]
+    harvester.harvest_device(dev)
+    assert dev.last_error is None
+
+
+def stored(db):
+    return len(db.fetch_unsynced_logs())
+
+
+def punch(device, count, start):
+    for i in range(count):
+        device.punch(when=start + timedelta(minutes=i))
+
+
+def test_first_harvest_stores_backlog_and_cursor(device, db, harvester):
+    harvest(harvester)
+    assert stored(db) == 20
+    record_count, last_ts = db.get_device_cursor(SIM_HOST)
+    assert record_count == 20
+    assert last_ts is not None
+
+
+def test_harvest_stores_only_new_records(device, db, harvester):
+    harvest(harvester)
+    punch(device, 3, datetime.now().replace(microsecond=0) + timedelta(hours=1))
+    harvest(harvester)
+    assert stored(db) == 23
+    assert db.get_device_cursor(SIM_HOST)[0] == 23
+
+
+def test_unchanged_device_is_not_downloaded(device, db, harvester):
+    harvest(harvester)
+    commands = device.stats['bytes_sent']
+    harvest(harvester)
+    # Only connect and counters: far less than the 20-record attendance download
+    assert device.stats['bytes_sent'] - commands < 20 * 40
+    assert stored(db) == 20
+
+
+def test_cleared_buffer_is_harvested_by_timestamp(device, db, harvester):
+    harvest(harvester)
+    with device.lock:
+        device.attlog = bytearray()
+        device.records = 0
+    punch(device, 5, datetime.now().replace(microsecond=0) + timedelta(hours=1))
+    harvest(harvester)
+    assert stored(db) == 25
+    assert db.get_device_cursor(SIM_HOST)[0] == 5
+
+
+def test_cleared_buffer_regrown_past_old_count_loses_nothing(device, db, harvester):
+    harvest(harvester)
+    with device.lock:
+        device.attlog = bytearray()
+        device.records = 0
+    # Refilled beyond the 20 records of the last harvest before the next one
+    punch(device, 30, datetime.now().replace(microsecond=0) + timedelta(hours=1))
+    harvest(harvester)
+    assert stored(db) == 50
+    assert db.get_device_cursor(SIM_HOST)[0] == 30
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_stream_hands_its_session_to_pool_checkouts(device, db, monkeypatch):
+    monkeypatch.setattr(harvester_module, 'LIVE_CAPTURE_TICK', 1)
+    pool = DevicePool(idle_timeout=60)
+    streamer = Harvester(db, 'node', SIM_HOST, pool=pool)
+    try:
+        streamer.start_streaming()
+        wait_for(lambda: any(session.live for session in device.sessions))
+        # A user sync / enrollment command waits for capture to pause, on the same session
+        with pool.session(SIM_HOST) as conn:
+            assert len(conn.get_users()) == 5
+            assert len(device.sessions) == 1
+            assert not device.sessions[0].live
+        assert pool.stats()[SIM_HOST]['opened'] == 1
+        # Capture resumes afterwards
+        wait_for(lambda: any(session.live for session in device.sessions))
+        punch(device, 1, datetime.now().replace(microsecond=0) + timedelta(hours=1))
+        wait_for(lambda: stored(db) == 21)
+    finally:
+        streamer.close()
+        pool.close()
@@ -0,0 +1,117 @@
+"""
+Binary wire format round trips and JSON fallback negotiation.
+"""
+
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+import requests
+
+from beacon_core import wire
+from beacon_core.syncer import Syncer
+
+# beacon_logs rows: id, user_id, timestamp, punch_type, sync_status, beacon_node_id
+ROWS = [
+    (101, '7', '2026-03-01 08:00:00', 0, 0, 'node-a'),
+    (102, '12', '2026-03-01 07:59:30', 1, 0, 'node-a'),
+    (105, '7', '2026-03-01 17:02:11', 1, 0, 'node-a'),
+    (104, 'Ñandú', datetime(2026, 3, 2, 0, 0, 0), 4, 0, 'node-a'),
+]
+
+
+def expected(rows):
+    return [
+        {
+            'id': row[0],
+            'user_id': row[1],
+            'timestamp': row[2] if isinstance(row[2], str) else row[2].strftime(wire.TIMESTAMP_FORMAT),
+            'punch_type': row[3],
+            'beacon_node_id': row[5],
+        }
+        for row in rows
+    ]
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip(compress):
+    assert wire.decode_logs(wire.encode_logs(ROWS, compress=compress)) == expected(ROWS)
+
+
+def test_empty_batch():
+    assert wire.decode_logs(wire.encode_logs([])) == []
+
+
+def test_smaller_than_gzip_json():
+    rows = [(i, str(i % 40), f'2026-03-01 {8 + i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}', i % 2, 0, 'node-a')
+            for i in range(1, 2001)]
+    as_json = gzip.compress(json.dumps(expected(rows)).encode())
+    assert len(wire.encode_logs(rows)) < len(as_json)
+
+
+def test_mixed_nodes_rejected():
+    with pytest.raises(wire.WireFormatError):
+        wire.encode_logs([ROWS[0], (106, '7', '2026-03-01 08:00:00', 0, 0, 'node-b')])
+
+
+def test_sub_second_timestamp_rejected():
+    with pytest.raises(wire.WireFormatError):
+        wire.encode_logs([(1, '7', datetime(2026, 3, 1, 8, 0, 0, 500), 0, 0, 'node-a')])
+
+
+@pytest.mark.parametrize('payload', [b'', b'XYZ\x01\x00', b'BCN\x02\x00', b'BCN\x01\x07',
+                                     wire.encode_logs(ROWS, compress=False)[:-3]])
+def test_bad_payload_rejected(payload):
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_logs(payload)
+
+
+def uncompressed(body):
+    return wire.MAGIC + bytes((wire.VERSION, wire.COMPRESSION_NONE)) + bytes(body)
+
+
+@pytest.mark.parametrize('payload', [
+    # Deflate stream cut short, and one that is not deflate at all
+    wire.encode_logs(ROWS)[:-4],
+    wire.MAGIC + bytes((wire.VERSION, wire.COMPRESSION_DEFLATE)) + b'not deflate',
+    # One row whose user index (1) points past a one-entry dictionary
+    uncompressed([1, 1, ord('n'), 1, 1, ord('7'), 2, 1, 0, 0]),
+    # Node id that is not UTF-8
+    uncompressed([1, 1, 0xFF, 0]),
+    # Timestamp far beyond datetime's range
+    uncompressed([1, 0, 1, 0, 2, 0, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0x7F, 0]),
+])
+def test_corrupt_payload_rejected(payload):
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_logs(payload)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_damaged_payload_never_raises_anything_else(compress):
+    payload = wire.encode_logs(ROWS, compress=compress)
+    damaged = [payload[:n] for n in range(len(payload))]
+    damaged += [payload[:n] + bytes((payload[n] ^ 0xFF,)) + payload[n + 1:] for n in range(5, len(payload))]
+    for candidate in damaged:
+        try:
+            wire.decode_logs(candidate)
+        except wire.WireFormatError:
+            pass
+
+
+def response(status, error):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps({'error': error}).encode()
+    return resp
+
+
+@pytest.mark.parametrize('status, error, falls_back', [
+    (415, 'Unsupported payload format', True),
+    (400, f'Unsupported Content-Type {wire.CONTENT_TYPE}', True),
+    (400, 'Invalid payload', False),
+    (400, 'Payload must be array', False),
+    (422, 'Unprocessable', False),
+])
+def test_json_fallback_only_when_format_refused(status, error, falls_back):
+    assert Syncer._rejects_wire(response(status, error)) is falls_back
@@ -0,0 +1,602 @@
+"""
+ZKTeco Device Simulator for Project BEACON Edge Gateway
+-------------------------------------------------------
+- Speaks the ZKTeco TCP/UDP protocol (the subset pyzk uses) so the harvester,
+  enrollment service and diagnostics can run against virtual terminals
+- Supports connect (with comm key), read_sizes, get_attendance, get_users,
+  get_templates, get_user_template, set_user, save_user_template, delete_user,
+  delete_user_template, device info and live capture (CMD_REG_EVENT)
+- Many virtual devices in one process: one loopback address per device
+  (127.0.0.1, 127.0.0.2, ... on port 4370, so DEVICE_LIST works unchanged) or
+  one port per device with --same-host
+- Configurable attendance backlog, users, templates, response latency/jitter,
+  packet loss (a lost request is never answered; the client times out) and
+  live punches per minute
+- Usage: python zk_simulator.py [--devices N] [--records N] [--latency S] [--loss P] [--live-rate N]
+- Note: extra 127.0.0.x addresses work out of the box on Linux; macOS and
+  Windows need loopback aliases (or use --same-host)
+"""
+
+import argparse
+import ipaddress
+import random
+import socket
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from struct import pack, unpack
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from zk import const
+from zk.base import make_commkey
+
+# Reply payload per CMD_DATA datagram over UDP (pyzk reads 1024 + 8 bytes)
+UDP_CHUNK = 1024
+# Pause between live events after the client acknowledges one, so consecutive
+# events never share a TCP read (pyzk parses one event per packet)
+EVENT_GAP = 0.02
+# Seconds between backlog punches, spread across all users
+BACKLOG_SPACING = 37
+
+
+def checksum(packet: bytes) -> int:
+    """
+    ZKTeco packet checksum: one's-complement style sum of 16-bit words.
+    """
+    even = len(packet) & ~1
+    total = sum(memoryview(packet[:even]).cast('H'))
+    if len(packet) & 1:
+        total += packet[-1]
+    folded = total % const.USHRT_MAX
+    if folded == 0 and total:
+        folded = const.USHRT_MAX
+    result = ~folded
+    while result < 0:
+        result += const.USHRT_MAX
+    return result
+
+
+def make_packet(command: int, session_id: int, reply_id: int, data: bytes = b'') -> bytes:
+    body = pack('<4H', command, 0, session_id, reply_id) + data
+    return pack('<4H', command, checksum(body), session_id, reply_id) + data
+
+
+def encode_time(t: datetime) -> bytes:
+    d = ((t.year % 100) * 12 * 31 + (t.month - 1) * 31 + t.day - 1) * 86400 \
+        + (t.hour * 60 + t.minute) * 60 + t.second
+    return pack('<I', d)
+
+
+@dataclass
+class SimUser:
+    uid: int
+    user_id: str
+    name: str = ''
+    privilege: int = const.USER_DEFAULT
+    password: str = ''
+    group_id: str = ''
+    card: int = 0
+
+
+class Session:
+    """
+    One client connection (TCP socket or UDP peer address).
+    """
+    def __init__(self, send: Callable[[bytes], None], tcp: bool, session_id: int):
+        self.send = send
+        self.tcp = tcp
+        self.session_id = session_id
+        self.authenticated = False
+        # Snapshot served by CMD_DATA_RDY (1504) chunk reads
+        self.buffer = b''
+        # Data uploaded with CMD_PREPARE_DATA / CMD_DATA (save_user_template)
+        self.upload = bytearray()
+        self.live = False
+        self.events: Deque[bytes] = deque()
+        self.awaiting_ack = False
+        self.closed = False
+        # Held while a request is answered or an event is sent, so events never
+        # interleave with a reply
+        self.lock = threading.Lock()
+
+    def transmit(self, command: int, reply_id: int, data: bytes = b'') -> None:
+        packet = make_packet(command, self.session_id, reply_id, data)
+        if self.tcp:
+            packet = pack('<HHI', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2, len(packet)) + packet
+        self.send(packet)
+
+
+class VirtualDevice:
+    """
+    In-memory terminal: users, templates and an attendance buffer served over
+    TCP and UDP on (host, port). Thread-safe; start() / stop() control the
+    listeners and the live punch generator.
+    """
+    def __init__(self, name: str, host: str = '127.0.0.1', port: int = 4370, users: int = 200,
+                 fingers: int = 1, records: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 loss: float = 0.0, live_rate: float = 0.0, password: int = 0, rec_cap: int = 100_000,
+                 seed: Optional[int] = None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        # Live punches per minute across all users (Poisson arrivals)
+        self.live_rate = live_rate
+        self.password = password
+        self.serial = f'SIM{zlib.crc32(f"{host}:{port}".encode()):010d}'
+        self.rec_cap = max(rec_cap, records)
+        self.users_cap = max(3000, users)
+        self.fingers_cap = max(3000, users * fingers)
+        self.rng = random.Random(seed)
+        self.lock = threading.RLock()
+        self.users: Dict[int, SimUser] = {}
+        self.templates: Dict[Tuple[int, int], bytes] = {}
+        # Pre-packed 40-byte attendance records, appended as punches happen
+        self.attlog = bytearray()
+        self.records = 0
+        self._last_punch: Dict[str, int] = {}
+        self.sessions: List[Session] = []
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._sockets: List[socket.socket] = []
+        self.stats = {'connections': 0, 'commands': 0, 'dropped': 0, 'bytes_sent': 0, 'events_sent': 0}
+
+        for i in range(users):
+            user = SimUser(uid=i + 1, user_id=str(1000 + i), name=f'Sim User {1000 + i}')
+            self.users[user.uid] = user
+            for fid in range(fingers):
+                self.templates[(user.uid, fid)] = self.rng.randbytes(self.rng.randint(500, 700))
+        user_list = list(self.users.values())
+        # Stagger devices so neighbouring simulators do not produce identical punches
+        offset = (int(ipaddress.IPv4Address(host)) + port) % BACKLOG_SPACING
+        start = datetime.now().replace(microsecond=0) - timedelta(seconds=BACKLOG_SPACING * (records + 1) + offset)
+        for i in range(records):
+            if user_list:
+                self._append_punch(user_list[i % len(user_list)], start + timedelta(seconds=BACKLOG_SPACING * i))
+
+    # --- device state ---------------------------------------------------------
+
+    def _append_punch(self, user: SimUser, when: datetime) -> Tuple[int, int]:
+        punch = self._last_punch.get(user.user_id, 1) ^ 1
+        self._last_punch[user.user_id] = punch
+        status = 1  # verified by fingerprint
+        self.attlog += pack('<H24sB4sB8s', user.uid, user.user_id.encode(), status, encode_time(when), punch, b'')
+        self.records += 1
+        return status, punch
+
+    def punch(self, user_id: Optional[str] = None, when: Optional[datetime] = None) -> None:
+        """
+        Record a punch (random user, now by default) and push it to live sessions.
+        """
+        with self.lock:
+            if user_id is None:
+                if not self.users:
+                    return
+                user = self.rng.choice(list(self.users.values()))
+            else:
+                user = next((u for u in self.users.values() if u.user_id == user_id), None) \
+                    or SimUser(uid=0, user_id=user_id)
+            when = (when or datetime.now()).replace(microsecond=0)
+            status, punch = self._append_punch(user, when)
+            event = pack('<24sBB6s', user.user_id.encode(), status, punch,
+                         pack('6B', when.year - 2000, when.month, when.day, when.hour, when.minute, when.second))
+            live = [s for s in self.sessions if s.live]
+        for session in live:
+            session.events.append(event)
+            self._pump(session)
+
+    def _pump(self, session: Session) -> None:
+        """
+        Send the next queued live event once the previous one was acknowledged.
+        """
+        with session.lock:
+            if session.closed or not session.live or session.awaiting_ack or not session.events:
+                return
+            session.awaiting_ack = True
+            try:
+                session.transmit(const.CMD_REG_EVENT, 0, session.events.popleft())
+                self.stats['events_sent'] += 1
+            except OSError:
+                session.closed = True
+
+    def _users_payload(self) -> bytes:
+        body = b''.join(
+            pack('<HB8s24sIx7sx24s', u.uid, u.privilege, u.password.encode(), u.name.encode(), u.card,
+                 u.group_id.encode(), u.user_id.encode())
+            for u in sorted(self.users.values(), key=lambda u: u.uid))
+        return pack('I', len(body)) + body
+
+    def _templates_payload(self) -> bytes:
+        body = b''.join(pack('<HHbb', len(t) + 6, uid, fid, 1) + t
+                        for (uid, fid), t in sorted(self.templates.items()))
+        return pack('i', len(body)) + body
+
+    def _sizes_payload(self) -> bytes:
+        fields = [0] * 20
+        fields[4] = len(self.users)
+        fields[6] = len(self.templates)
+        fields[8] = self.records
+        fields[14] = self.fingers_cap
+        fields[15] = self.users_cap
+        fields[16] = self.rec_cap
+        fields[17] = self.fingers_cap - fields[6]
+        fields[18] = self.users_cap - fields[4]
+        fields[19] = self.rec_cap - self.records
+        return pack('20i', *fields) + pack('3i', 0, 0, 0)
+
+    def _save_upload(self, data: bytes) -> bool:
+        """
+        Apply a save_user_template bundle: user record, template table, templates.
+        """
+        try:
+            ulen, tlen, _flen = unpack('III', data[:12])
+            upack = data[12:12 + ulen]
+            if ulen == 73:
+                _, uid, privilege, password, name, card, _, group_id, user_id = unpack('<BHB8s24sIB7sx24s', upack)
+                group = _text(group_id)
+            else:
+                _, uid, privilege, password, name, card, group, _, user_num = unpack('<BHB5s8sIxBhI', upack)
+                user_id, group = str(user_num).encode(), str(group)
+            user = SimUser(uid, _text(user_id), _text(name), privilege, _text(password), group, card)
+            table = data[12 + ulen:12 + ulen + tlen]
+            fpack = data[12 + ulen + tlen:]
+            fingers = {}
+            for i in range(0, len(table), 8):
+                _, _, fnum, offset = unpack('<bHbI', table[i:i + 8])
+                size = unpack('H', fpack[offset:offset + 2])[0]
+                fingers[fnum - 0x10] = fpack[offset + 2:offset + 2 + size]
+        except Exception:
+            return False
+        with self.lock:
+            self.users[user.uid] = user
+            for fid, template in fingers.items():
+                self.templates[(user.uid, fid)] = template
+        return True
+
+    # --- protocol -------------------------------------------------------------
+
+    def handle(self, session: Session, command: int, reply_id: int, data: bytes) -> List[Tuple[int, bytes]]:
+        """
+        Answer one request; returns the (command, payload) packets to send.
+        """
+        if command == const.CMD_CONNECT:
+            session.authenticated = not self.password
+            return [(const.CMD_ACK_OK if session.authenticated else const.CMD_ACK_UNAUTH, b'')]
+        if command == const.CMD_AUTH:
+            session.authenticated = data[:4] == make_commkey(self.password, session.session_id)
+            return [(const.CMD_ACK_OK if session.authenticated else const.CMD_ACK_UNAUTH, b'')]
+        if not session.authenticated:
+            return [(const.CMD_ACK_UNAUTH, b'')]
+        if command == const.CMD_EXIT:
+            session.closed = True
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_GET_FREE_SIZES:
+            with self.lock:
+                return [(const.CMD_ACK_OK, self._sizes_payload())]
+        if command == 1503:  # read with buffer: snapshot now, serve by chunk
+            _, inner, fct, _ = unpack('<bhii', data[:11])
+            with self.lock:
+                if inner == const.CMD_ATTLOG_RRQ:
+                    session.buffer = pack('I', len(self.attlog)) + bytes(self.attlog)
+                elif inner == const.CMD_USERTEMP_RRQ and fct == const.FCT_USER:
+                    session.buffer = self._users_payload()
+                elif inner == const.CMD_DB_RRQ and fct == const.FCT_FINGERTMP:
+                    session.buffer = self._templates_payload()
+                else:
+                    return [(const.CMD_ACK_ERROR, b'')]
+            return [(const.CMD_ACK_OK, pack('<BI', 0, len(session.buffer)))]
+        if command == 1504:  # read chunk
+            start, size = unpack('<ii', data[:8])
+            chunk = session.buffer[start:start + size]
+            if session.tcp:
+                # 8-byte payload: pyzk skips 8 bytes before the CMD_DATA packet
+                return [(const.CMD_PREPARE_DATA, pack('<II', len(chunk), 0)),
+                        (const.CMD_DATA, chunk), (const.CMD_ACK_OK, b'')]
+            return [(const.CMD_PREPARE_DATA, pack('I', len(chunk)))] + \
+                [(const.CMD_DATA, chunk[i:i + UDP_CHUNK]) for i in range(0, len(chunk), UDP_CHUNK)] + \
+                [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_FREE_DATA:
+            session.buffer = b''
+            session.upload = bytearray()
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_PREPARE_DATA:
+            session.upload = bytearray()
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_DATA:
+            session.upload += data
+            return [(const.CMD_ACK_OK, b'')]
+        if command == 110:  # commit uploaded user + templates
+            ok = self._save_upload(bytes(session.upload))
+            session.upload = bytearray()
+            return [(const.CMD_ACK_OK if ok else const.CMD_ACK_ERROR, b'')]
+        if command == const.CMD_USER_WRQ:
+            if len(data) >= 72:
+                uid, privilege, password, name, card, group_id, user_id = unpack('<HB8s24s4sx7sx24s', data[:72])
+                user = SimUser(uid, _text(user_id), _text(name), privilege, _text(password), _text(group_id),
+                               unpack('<I', card)[0])
+            elif len(data) >= 28:
+                uid, privilege, password, name, card, group_id, _, user_num = unpack('<HB5s8sIxBHI', data[:28])
+                user = SimUser(uid, str(user_num), _text(name), privilege, _text(password), str(group_id), card)
+            else:
+                return [(const.CMD_ACK_ERROR, b'')]
+            with self.lock:
+                self.users[uid] = user
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_DELETE_USER:
+            uid = unpack('h', data[:2])[0]
+            with self.lock:
+                self.users.pop(uid, None)
+                for key in [k for k in self.templates if k[0] == uid]:
+                    del self.templates[key]
+            return [(const.CMD_ACK_OK, b'')]
+        if command in (const.CMD_DELETE_USERTEMP, 134):
+            with self.lock:
+                if command == 134:
+                    user_id, fid = unpack('<24sB', data[:25])
+                    uid = next((u.uid for u in self.users.values() if u.user_id == _text(user_id)), None)
+                else:
+                    uid, fid = unpack('hb', data[:3])
+                found = self.templates.pop((uid, fid), None) is not None
+            return [(const.CMD_ACK_OK if found else const.CMD_ACK_ERROR, b'')]
+        if command == 88:  # get one user template
+            uid, fid = unpack('hb', data[:3])
+            with self.lock:
+                template = self.templates.get((uid, fid))
+            if template is None:
+                return [(const.CMD_ACK_ERROR, b'')]
+            return [(const.CMD_DATA, template + b'\x00')]
+        if command == const.CMD_REG_EVENT:
+            session.live = bool(unpack('I', data[:4])[0] & const.EF_ATTLOG) if len(data) >= 4 else False
+            if not session.live:
+                session.events.clear()
+                session.awaiting_ack = False
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_CLEAR_ATTLOG:
+            with self.lock:
+                self.attlog = bytearray()
+                self.records = 0
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_CLEAR_DATA:
+            with self.lock:
+                self.users.clear()
+                self.templates.clear()
+                self.attlog = bytearray()
+                self.records = 0
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_GET_VERSION:
+            return [(const.CMD_ACK_OK, b'Ver 6.60 Sim\x00')]
+        if command == const.CMD_GET_TIME:
+            return [(const.CMD_ACK_OK, encode_time(datetime.now()))]
+        if command == const.CMD_OPTIONS_RRQ:
+            key = data.split(b'\x00')[0]
+            options = {b'~SerialNumber': self.serial.encode(), b'~Platform': b'ZMM220_TFT',
+                       b'~DeviceName': b'BEACON-SIM', b'MAC': b'00:17:61:00:00:01', b'~ZKFPVersion': b'10'}
+            return [(const.CMD_ACK_OK, key + b'=' + options.get(key, b'') + b'\x00')]
+        if command in (const.CMD_ENABLEDEVICE, const.CMD_DISABLEDEVICE, const.CMD_REFRESHDATA,
+                       const.CMD_REFRESHOPTION, const.CMD_CANCELCAPTURE, const.CMD_STARTVERIFY,
+                       const.CMD_OPTIONS_WRQ, const.CMD_SET_TIME, const.CMD_TESTVOICE, const.CMD_UNLOCK):
+            return [(const.CMD_ACK_OK, b'')]
+        return [(const.CMD_ACK_UNKNOWN, b'')]
+
+    def _dispatch(self, session: Session, packet: bytes) -> None:
+        if len(packet) < 8:
+            return
+        command, _, _, reply_id = unpack('<4H', packet[:8])
+        if command == const.CMD_ACK_OK:
+            # Client acknowledging a live event; never answered
+            session.awaiting_ack = False
+            if session.events:
+                timer = threading.Timer(EVENT_GAP, self._pump, (session,))
+                timer.daemon = True
+                timer.start()
+            return
+        self.stats['commands'] += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.stats['dropped'] += 1
+            return
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        with session.lock:
+            for code, payload in self.handle(session, command, reply_id, packet[8:]):
+                session.transmit(code, reply_id, payload)
+        if session.live:
+            self._pump(session)
+
+    def _serve_tcp_client(self, conn: socket.socket) -> None:
+        def send(packet: bytes) -> None:
+            conn.sendall(packet)
+            self.stats['bytes_sent'] += len(packet)
+
+        session = Session(send, True, self.rng.randint(1, 0xFFF0))
+        with self.lock:
+            self.sessions.append(session)
+            self.stats['connections'] += 1
+        try:
+            while not session.closed and not self._stop.is_set():
+                top = _recv_exact(conn, 8)
+                if top is None:
+                    break
+                magic1, magic2, length = unpack('<HHI', top)
+                if (magic1, magic2) != (const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2):
+                    break
+                packet = _recv_exact(conn, length)
+                if packet is None:
+                    break
+                self._dispatch(session, packet)
+        except OSError:
+            pass
+        finally:
+            session.closed = True
+            with self.lock:
+                self.sessions.remove(session)
+            conn.close()
+
+    def _serve_tcp(self, server: socket.socket) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sockets.append(conn)
+            threading.Thread(target=self._serve_tcp_client, args=(conn,), daemon=True,
+                             name=f'sim-{self.name}-tcp').start()
+
+    def _serve_udp(self, server: socket.socket) -> None:
+        peers: Dict[Tuple[str, int], Session] = {}
+        while not self._stop.is_set():
+            try:
+                packet, addr = server.recvfrom(65535)
+            except OSError:
+                break
+            if len(packet) < 8:
+                continue
+            session = peers.get(addr)
+            if session is None or unpack('<H', packet[:2])[0] == const.CMD_CONNECT:
+                def send(data: bytes, addr: Tuple[str, int] = addr) -> None:
+                    server.sendto(data, addr)
+                    self.stats['bytes_sent'] += len(data)
+
+                if session is not None:
+                    self._drop_session(session)
+                session = peers[addr] = Session(send, False, self.rng.randint(1, 0xFFF0))
+                with self.lock:
+                    self.sessions.append(session)
+                    self.stats['connections'] += 1
+            self._dispatch(session, packet)
+            if session.closed:
+                peers.pop(addr, None)
+                self._drop_session(session)
+
+    def _drop_session(self, session: Session) -> None:
+        session.closed = True
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def _generate_live(self) -> None:
+        while not self._stop.wait(self.rng.expovariate(self.live_rate / 60.0)):
+            self.punch()
+
+    def start(self) -> 'VirtualDevice':
+        tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        tcp.bind((self.host, self.port))
+        tcp.listen(16)
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.bind((self.host, self.port))
+        self._sockets += [tcp, udp]
+        targets = [(self._serve_tcp, (tcp,)), (self._serve_udp, (udp,))]
+        if self.live_rate > 0:
+            targets.append((self._generate_live, ()))
+        for target, args in targets:
+            thread = threading.Thread(target=target, args=args, daemon=True, name=f'sim-{self.name}')
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        for sock in self._sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+
+def _text(raw: bytes) -> str:
+    return raw.split(b'\x00')[0].decode(errors='ignore').strip()
+
+
+def _recv_exact(conn: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class Simulator:
+    """
+    A fleet of VirtualDevices sharing the same settings; use as a context manager.
+    """
+    def __init__(self, devices: int = 1, host: str = '127.0.0.1', port: int = 4370, same_host: bool = False,
+                 **device_kwargs):
+        self.devices: List[VirtualDevice] = []
+        base = ipaddress.IPv4Address(host)
+        for i in range(devices):
+            dev_host, dev_port = (host, port + i) if same_host else (str(base + i), port)
+            kwargs = dict(device_kwargs)
+            if kwargs.get('seed') is not None:
+                kwargs['seed'] += i
+            self.devices.append(VirtualDevice(f'dev{i + 1}', dev_host, dev_port, **kwargs))
+
+    def start(self) -> 'Simulator':
+        for device in self.devices:
+            device.start()
+        return self
+
+    def stop(self) -> None:
+        for device in self.devices:
+            device.stop()
+
+    def __enter__(self) -> 'Simulator':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def device_list(self) -> str:
+        """
+        DEVICE_LIST value for the harvester (needs one address per device).
+        """
+        return ','.join(f'{d.host}:ZKTeco' for d in self.devices)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1', help='address of the first device')
+    parser.add_argument('--port', type=int, default=4370)
+    parser.add_argument('--same-host', action='store_true', help='one port per device instead of one address')
+    parser.add_argument('--users', type=int, default=200, help='users per device')
+    parser.add_argument('--fingers', type=int, default=1, help='templates per user')
+    parser.add_argument('--records', type=int, default=5000, help='attendance records already on each device')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay before each reply (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random delay up to this (s)')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability a request is never answered')
+    parser.add_argument('--live-rate', type=float, default=0.0, help='live punches per minute per device')
+    parser.add_argument('--password', type=int, default=0, help='comm key (ZK_PASSWORD)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    sim = Simulator(args.devices, args.host, args.port, args.same_host, users=args.users, fingers=args.fingers,
+                    records=args.records, latency=args.latency, jitter=args.jitter, loss=args.loss,
+                    live_rate=args.live_rate, password=args.password, seed=args.seed)
+    with sim:
+        for d in sim.devices:
+            print(f"[Simulator] {d.name} on {d.host}:{d.port} (tcp+udp): {len(d.users)} users, "
+                  f"{len(d.templates)} templates, {d.records} records")
+        if not args.same_host:
+            print(f"[Simulator] DEVICE_LIST={sim.device_list()}")
+        try:
+            while True:
+                time.sleep(60)
+                for d in sim.devices:
+                    print(f"[Simulator] {d.name}: {d.records} records, {d.stats}")
+        except KeyboardInterrupt:
+            print("[Simulator] Stopping")
+
+
+if __name__ == '__main__':
+    main()